@@ -16,27 +16,43 @@ Funcionalidades principais:
 import init_eventlet
 
 from flask import Flask, render_template, request, jsonify, Response
-import json
 import os
 import logging
 import logging.handlers
 import traceback
+import itertools
 from datetime import datetime
 import requests
 import argparse
-from youtube_handler import YoutubeHandler
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from youtube_handler import YoutubeService
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from uuid import uuid4
 from utils.chat_storage import (
     create_new_conversation,
     add_message_to_conversation,
     get_conversation_by_id,
+    get_conversation_messages,
+    get_message_page,
+    get_message_content,
+    resolve_message,
     get_conversation_history,
+    get_conversation_history_page,
     delete_conversation,
     rename_conversation,
-    update_message_in_conversation
+    update_message_in_conversation,
+    get_tokenizer,
+    flush_all
 )
+from utils.context_builder import ContextBuilder
+from utils.conversation_memory import MemoryCompactor, covered_messages
+from utils.response_cache import CACHE_ENABLED as RESPONSE_CACHE_ENABLED, ResponseCache, cache_key
+from utils.llm_client import LLMClient, LLMResponseError
+from utils.llm_scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, LLMQueueFull, LLMScheduler
+from utils.summarizer import MapReduceSummarizer
+from utils.streaming import STREAM_ABANDON_GRACE, ChunkEmitter, GenerationCancelled, StreamRegistry
+from utils.transcript_chunker import format_timestamp
 import re
+from contextlib import nullcontext
 
 # Configuração do sistema de logging
 def setup_logger():
@@ -121,11 +137,121 @@ logger.info("Aplicação Flask e Socket.IO inicializados")
 # Configuração da API Ollama
 API_URL = "http://localhost:11434/v1/chat/completions"
 MODEL_NAME = "gemma2:2b"
-youtube_handler = YoutubeHandler()
+# Serviço compartilhado: workers com o yt-dlp já inicializado e fila limitada de vídeos
+youtube_service = YoutubeService()
+# Cliente compartilhado: mantém conexões keep-alive com a API entre as chamadas
+llm_client = LLMClient(API_URL)
+# Fila única de chamadas ao modelo, limitada ao que o Ollama atende em paralelo
+llm_scheduler = LLMScheduler()
 logger.info(f"API configurada: {API_URL}, Modelo: {MODEL_NAME}")
 
-# Cache para mensagens em streaming
-streaming_messages = {}
+# Histórico da conversa enviado ao modelo junto com cada mensagem:
+# - "none": nenhum (chamadas sem contexto, como os resumos de blocos)
+# - "last_k": as últimas HISTORY_LAST_K mensagens
+# - "token_budget": as mensagens mais recentes que couberem em HISTORY_TOKEN_BUDGET tokens,
+#   com mensagens enormes truncadas (ver utils/context_builder.py)
+HISTORY_POLICIES = ("none", "last_k", "token_budget")
+HISTORY_POLICY = os.environ.get("CHAT_HISTORY_POLICY", "token_budget")
+HISTORY_LAST_K = int(os.environ.get("CHAT_HISTORY_LAST_K", "10"))
+# O contexto do gemma2:2b tem 8192 tokens; o restante fica para a resposta (max_tokens)
+HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", "4096"))
+HISTORY_MAX_MESSAGE_TOKENS = int(os.environ.get("CHAT_HISTORY_MAX_MESSAGE_TOKENS", "1536"))
+
+def summarize_conversation_memory(prompt):
+    """
+    Gera (ou atualiza) o resumo acumulado de uma conversa longa, sem streaming.
+    Usado em background pelo MemoryCompactor; erros são propagados para que um
+    resumo inválido nunca seja gravado.
+    
+    Args:
+        prompt: Pedido de resumo montado por utils/conversation_memory.py
+        
+    Returns:
+        str: Texto do resumo
+    """
+    payload = {
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False,
+        "temperature": 0.2,
+        "max_tokens": 800
+    }
+    with llm_scheduler.slot(priority=PRIORITY_BATCH):
+        response_data = llm_client.complete(payload)
+    return response_data['choices'][0]['message']['content']
+
+def queue_position_notifier(conversation_id, message_id):
+    """Cria o callback que informa ao cliente a posição da mensagem na fila do modelo."""
+    def notify(position):
+        socketio.emit('queue_position', {
+            'message_id': message_id,
+            'conversation_id': conversation_id,
+            'position': position
+        }, room=conversation_id)
+    return notify
+
+# Cache opcional de respostas determinísticas (ver utils/response_cache.py)
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+if response_cache:
+    logger.info(f"Cache de respostas ativo em {response_cache.directory}")
+
+# Resumo acumulado das conversas longas (ver utils/conversation_memory.py)
+memory_compactor = MemoryCompactor(summarize_conversation_memory, spawn=socketio.start_background_task)
+
+# Mensagens em streaming, com os quadros já enviados para clientes que reconectam
+streaming_messages = StreamRegistry()
+
+def room_send_backlog(room):
+    """
+    Retorna o maior número de pacotes aguardando envio entre os clientes da sala,
+    usado pelo ChunkEmitter para detectar clientes lentos. Retorna 0 se a versão do
+    Socket.IO não expuser as filas.
+    """
+    try:
+        server = socketio.server
+        backlog = 0
+        for participant in server.manager.get_participants('/', room):
+            # python-socketio 5 retorna (sid, eio_sid); versões anteriores só o sid
+            eio_sid = participant[1] if isinstance(participant, tuple) else participant
+            eio_socket = server.eio.sockets.get(eio_sid)
+            if eio_socket is not None:
+                backlog = max(backlog, eio_socket.queue.qsize())
+        return backlog
+    except Exception:
+        return 0
+
+def room_has_clients(room):
+    """
+    Indica se ainda há clientes na sala. Na dúvida (versão do Socket.IO sem acesso
+    aos participantes) responde True, para nunca cancelar uma geração por engano.
+    """
+    try:
+        return any(True for _ in socketio.server.manager.get_participants('/', room))
+    except Exception:
+        return True
+
+def cancel_if_abandoned(conversation_id):
+    """
+    Cancela as gerações em andamento da conversa se a sala continuar vazia por
+    STREAM_ABANDON_GRACE segundos (tempo para o cliente reconectar e usar o resume_stream).
+    """
+    if not streaming_messages.active(conversation_id):
+        return
+    
+    def check():
+        socketio.sleep(STREAM_ABANDON_GRACE)
+        if room_has_clients(conversation_id):
+            return
+        cancelled = streaming_messages.cancel_conversation(conversation_id, "sala vazia")
+        if cancelled:
+            logger.info(f"Nenhum cliente na conversa {conversation_id}: {cancelled} geração(ões) cancelada(s)")
+    
+    socketio.start_background_task(check)
+
+def create_chunk_emitter(send, conversation_id):
+    """Cria o agrupador de trechos de uma mensagem transmitida à sala da conversa."""
+    return ChunkEmitter(send, backlog=lambda: room_send_backlog(conversation_id), sleep=socketio.sleep,
+                        spawn=socketio.start_background_task)
 
 @app.route('/')
 def home():
@@ -137,9 +263,22 @@ def home():
 
 @app.route('/get_conversation_history')
 def conversation_history():
-    """Endpoint para obter o histórico de todas as conversas"""
+    """
+    Endpoint para obter o histórico de conversas.
+    Sem parâmetros retorna a lista completa; com ?limit=N (e opcionalmente
+    ?cursor=<next_cursor>) retorna uma página: {'conversations', 'next_cursor'}.
+    """
     try:
         logger.info("Requisição para obter histórico de conversas")
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+        if limit is not None or cursor:
+            try:
+                page = get_conversation_history_page(limit or 50, cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            logger.debug(f"Retornando página com {len(page['conversations'])} conversas do histórico")
+            return jsonify(page)
         conversations = get_conversation_history()
         logger.debug(f"Retornando {len(conversations)} conversas do histórico")
         return jsonify(conversations)
@@ -156,7 +295,8 @@ def get_conversation(conversation_id):
         conversation = get_conversation_by_id(conversation_id)
         if conversation:
             logger.debug(f"Conversa {conversation_id} encontrada com {len(conversation.get('messages', []))} mensagens")
-            return jsonify(conversation)
+            # Conteúdos guardados como blob são lidos apenas aqui, para o cliente
+            return jsonify(dict(conversation, messages=[resolve_message(m) for m in conversation['messages']]))
         logger.warning(f"Conversa não encontrada: {conversation_id}")
         return jsonify({'error': 'Conversa não encontrada'}), 404
     except Exception as e:
@@ -177,19 +317,20 @@ def get_conversation_batch(conversation_id, offset, limit):
     """
     try:
         logger.info(f"Requisição de lote para conversa: {conversation_id} (offset={offset}, limit={limit})")
-        conversation = get_conversation_by_id(conversation_id)
-        if conversation:
-            messages = conversation['messages']
+        # Apenas a faixa pedida é carregada pelo motor de armazenamento
+        page = get_conversation_messages(conversation_id, offset, limit)
+        if page:
+            total = page['total']
             # Garantir que offset e limit estão dentro dos limites
-            offset = min(offset, len(messages))
-            end_index = min(offset + limit, len(messages))
-            batch = messages[offset:end_index]
+            offset = min(offset, total)
+            end_index = min(offset + limit, total)
+            batch = [resolve_message(m) for m in page['messages']]
             
-            logger.debug(f"Retornando lote {offset}-{end_index} de {len(messages)} mensagens")
+            logger.debug(f"Retornando lote {offset}-{end_index} de {total} mensagens")
             return jsonify({
                 'messages': batch,
-                'total': len(messages),
-                'hasMore': end_index < len(messages)
+                'total': total,
+                'hasMore': end_index < total
             })
         
         logger.warning(f"Conversa não encontrada para batch loading: {conversation_id}")
@@ -199,6 +340,45 @@ def get_conversation_batch(conversation_id, offset, limit):
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/get_conversation/<conversation_id>/messages')
+def get_conversation_messages_page(conversation_id):
+    """
+    Endpoint de paginação de mensagens por cursor.
+    Parâmetros: ?limit=N e ?after=<next_cursor> ou ?before=<prev_cursor>.
+    Apenas as mensagens da página são lidas do disco.
+    """
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        after = request.args.get('after')
+        before = request.args.get('before')
+        logger.info(f"Requisição de página para conversa: {conversation_id} (after={after}, before={before}, limit={limit})")
+        try:
+            page = get_message_page(conversation_id, after=after, before=before, limit=limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if page is None:
+            logger.warning(f"Conversa não encontrada para paginação: {conversation_id}")
+            return jsonify({'error': 'Conversa não encontrada'}), 404
+        page['messages'] = [resolve_message(m) for m in page['messages']]
+        return jsonify(page)
+    except Exception as e:
+        logger.error(f"Falha ao obter página de mensagens: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/get_message_content/<conversation_id>/<message_id>')
+def get_message_content_endpoint(conversation_id, message_id):
+    """Endpoint para obter o conteúdo completo de uma mensagem (inclusive as guardadas como blob)"""
+    try:
+        content = get_message_content(conversation_id, message_id)
+        if content is None:
+            return jsonify({'error': 'Mensagem não encontrada'}), 404
+        return jsonify({'message_id': message_id, 'content': content})
+    except Exception as e:
+        logger.error(f"Falha ao obter conteúdo da mensagem {message_id}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/stream')
 def stream():
     """
@@ -282,67 +462,79 @@ def process_streaming_response(message, conversation_id, message_id):
     """
     try:
         # Inicializar uma entrada para a mensagem em streaming
-        if message_id not in streaming_messages:
-            streaming_messages[message_id] = {
-                'content': '',
-                'complete': False,
-                'conversation_id': conversation_id
-            }
+        session = streaming_messages.start(message_id, conversation_id)
             
         logger.debug_with_context("Iniciando processamento de resposta em streaming", 
                                 context="backend",
                                 message_id=message_id, 
                                 conversation_id=conversation_id)
         
+        def send_frame(frame):
+            # Emitir os trechos agrupados para o cliente, numerados para o resume_stream
+            socketio.emit('message_chunk', {
+                'message_id': message_id,
+                'chunk': frame,
+                'seq': session.add_frame(frame),
+                'conversation_id': conversation_id
+            }, room=conversation_id)
+        
         def background_task():
+            emitter = create_chunk_emitter(send_frame, conversation_id)
             try:
                 # Obter a resposta da IA em streaming
-                for chunk in process_with_ai_stream(message, conversation_id):
+                for chunk in process_with_ai_stream(message, conversation_id,
+                                                    on_queue_position=queue_position_notifier(conversation_id, message_id),
+                                                    cancel=session.cancel_token):
                     if chunk:
-                        # Adicionar o chunk à mensagem em streaming
-                        streaming_messages[message_id]['content'] += chunk
-                        
-                        # Emitir o chunk para o cliente
-                        socketio.emit('message_chunk', {
-                            'message_id': message_id,
-                            'chunk': chunk,
-                            'conversation_id': conversation_id
-                        }, room=conversation_id)
-                        
-                        logger.debug_with_context("Chunk enviado", 
-                                                context="backend",
-                                                message_id=message_id, 
-                                                conversation_id=conversation_id,
-                                                chunk_size=len(chunk))
+                        emitter.push(chunk)
+                emitter.close()
+                # Texto completo (todos os quadros enviados), unido uma única vez
+                content = session.content.getvalue()
                 
-                # Marcar a mensagem como completa
-                streaming_messages[message_id]['complete'] = True
+                logger.debug_with_context("Chunks enviados", 
+                                        context="backend",
+                                        message_id=message_id, 
+                                        conversation_id=conversation_id,
+                                        **emitter.stats())
                 
-                # Notificar o cliente que a mensagem está completa
+                # Marcar a mensagem como completa; a sessão expira após STREAM_SESSION_TTL
+                cancelled = session.cancelled
+                streaming_messages.finish(message_id)
+                
+                # Notificar o cliente que a mensagem está completa (ou foi cancelada)
                 socketio.emit('message_complete', {
                     'message_id': message_id,
                     'conversation_id': conversation_id,
-                    'content': streaming_messages[message_id]['content']
+                    'content': content,
+                    'cancelled': cancelled
                 }, room=conversation_id)
                 
-                # Salvar a mensagem completa na conversa
+                if cancelled and not content:
+                    logger.info_with_context("Geração cancelada antes da resposta", 
+                                            context="backend",
+                                            message_id=message_id,
+                                            conversation_id=conversation_id,
+                                            reason=session.cancel_token.reason)
+                    return
+                
+                # Salvar a mensagem (completa, ou parcial se cancelada) na conversa
                 assistant_message_id = add_message_to_conversation(
                     conversation_id, 
-                    streaming_messages[message_id]['content'], 
+                    content, 
                     "assistant",
                     message_id=f"assistant_{message_id}"
                 )
                 
+                # Conversas longas: incorpora as mensagens antigas ao resumo acumulado
+                memory_compactor.schedule(conversation_id)
+                
                 logger.info_with_context("Mensagem completa processada", 
                                         context="backend",
                                         message_id=message_id,
                                         assistant_message_id=assistant_message_id,
                                         conversation_id=conversation_id,
-                                        content_length=len(streaming_messages[message_id]['content']))
-                
-                # Limpar a mensagem do cache
-                if message_id in streaming_messages:
-                    del streaming_messages[message_id]
+                                        content_length=len(content),
+                                        cancelled=cancelled)
                     
             except Exception as e:
                 logger.error_with_context("Erro no processamento em background", 
@@ -352,7 +544,9 @@ def process_streaming_response(message, conversation_id, message_id):
                                         error=str(e),
                                         traceback=traceback.format_exc())
                 
-                # Notificar o cliente do erro
+                # Envia os trechos ainda pendentes e notifica o cliente do erro
+                emitter.close()
+                streaming_messages.finish(message_id, error=str(e))
                 socketio.emit('message_error', {
                     'message_id': message_id,
                     'conversation_id': conversation_id,
@@ -431,8 +625,6 @@ def process_youtube_background(url, conversation_id):
         conversation_id: ID da conversa onde salvar o resultado
     """
     print(f"[INFO] Iniciando processamento do vídeo: {url} para conversa: {conversation_id}")
-    youtube_handler = YoutubeHandler()
-    
     try:
         # Gerar message_id único para a resposta
         message_id = str(uuid4())
@@ -453,7 +645,7 @@ def process_youtube_background(url, conversation_id):
         }, room=conversation_id)
         
         # Substituindo as chamadas separadas pelo novo método combinado
-        cleaned_subtitles, video_title = youtube_handler.download_and_clean_transcript(url)
+        cleaned_subtitles, video_title = youtube_service.get_transcript(url)
         
         if not cleaned_subtitles:
             error_msg = f"Não foi possível processar as legendas do vídeo '{video_title or 'desconhecido'}' em PT-BR, PT ou EN."
@@ -577,8 +769,6 @@ def process_youtube_resumo_background(url, conversation_id):
         conversation_id: ID da conversa onde salvar o resultado
     """
     print(f"[INFO] Iniciando processamento de resumo do vídeo: {url} para conversa: {conversation_id}")
-    youtube_handler = YoutubeHandler()
-    
     try:
         # Gerar message_id único para a resposta
         message_id = str(uuid4())
@@ -599,7 +789,8 @@ def process_youtube_resumo_background(url, conversation_id):
         }, room=conversation_id)
         
         # Baixa e limpa a transcrição
-        transcript, video_title = youtube_handler.download_and_clean_transcript(url)
+        # Linhas da transcrição com os tempos, para indicar o trecho do vídeo de cada bloco
+        transcript, video_title = youtube_service.get_transcript_segments(url)
         
         if not transcript:
             error_msg = f"Não foi possível processar as legendas do vídeo '{video_title or 'desconhecido'}' em PT-BR, PT ou EN."
@@ -621,10 +812,12 @@ def process_youtube_resumo_background(url, conversation_id):
             
         print(f"[INFO] Legendas encontradas e processadas para o vídeo: {video_title}")
         
-        # Divide a transcrição em blocos de aproximadamente 300 palavras
-        transcript_chunks = youtube_handler.split_transcript_into_chunks(transcript)
+        # Divide a transcrição em blocos limitados em tokens, em fim de frase; os blocos
+        # são gerados sob demanda, conforme os workers do resumo ficam livres
+        transcript_chunks = youtube_service.iter_transcript_chunks(transcript)
+        first_chunk = next(transcript_chunks, None)
         
-        if not transcript_chunks:
+        if first_chunk is None:
             error_msg = f"Falha ao dividir a transcrição do vídeo '{video_title}' em blocos."
             print(f"[ERRO] {error_msg}")
             
@@ -646,81 +839,108 @@ def process_youtube_resumo_background(url, conversation_id):
         full_response = f"**Resumo do vídeo '{video_title}':**\n\n"
         
         # Adiciona a informação sobre os blocos
-        full_response += f"*O vídeo foi dividido em {len(transcript_chunks)} blocos para resumo detalhado.*\n\n"
+        full_response += "*O vídeo foi dividido em blocos para resumo detalhado.*\n\n"
         
         # Salva a mensagem inicial no histórico com o message_id específico
         add_message_to_conversation(conversation_id, full_response, "assistant", message_id=message_id)
         
-        # Envia a resposta inicial para o frontend
-        socketio.emit('message_chunk', {
-            'content': full_response,
-            'conversation_id': conversation_id,
-            'message_id': message_id,
-            'chunk_number': 1
-        }, room=conversation_id)
-        logger.debug(f"[BACKEND] Emitido cabeçalho do resumo para {conversation_id}")
+        # Os quadros enviados ficam em streaming_messages, como nas mensagens do chat,
+        # numerados para o resume_stream
+        session = streaming_messages.start(message_id, conversation_id)
+        chunk_number = 1
         
-        # Processa cada bloco com a IA para gerar resumos
-        response_content = full_response
-        chunk_number = 2
-        
-        for i, chunk in enumerate(transcript_chunks):
-            # Formata o número do bloco
-            block_number = i + 1
-            
-            # Adiciona cabeçalho do bloco
-            block_header = f"\n\n### Bloco {block_number}/{len(transcript_chunks)}\n\n"
+        def send_frame(frame):
+            nonlocal chunk_number
             socketio.emit('message_chunk', {
-                'content': block_header,
+                'content': frame,
                 'conversation_id': conversation_id,
                 'message_id': message_id,
-                'chunk_number': chunk_number
+                'chunk_number': chunk_number,
+                'seq': session.add_frame(frame)
             }, room=conversation_id)
-            response_content += block_header
             chunk_number += 1
-            
-            # Prepara o prompt para a IA
+        
+        # Envia a resposta inicial para o frontend
+        send_frame(full_response)
+        logger.debug(f"[BACKEND] Emitido cabeçalho do resumo para {conversation_id}")
+        
+        # Processa os blocos com a IA em paralelo (map) e gera um resumo geral (reduce);
+        # os trechos chegam ao cliente na ordem dos blocos
+        emitter = create_chunk_emitter(send_frame, conversation_id)
+        notify_position = queue_position_notifier(conversation_id, message_id)
+        
+        def emit_chunk(content):
+            emitter.push(content)
+        
+        def summarize_block(chunk):
             prompt = f"""Resumir o seguinte trecho em um parágrafo conciso, mantendo os pontos importantes:
 
-"{chunk}"
+"{chunk.text}"
 
 Resumo detalhado:"""
-            
-            # Gera o resumo com a IA e envia em streaming
-            try:
-                for resumo_chunk in process_with_ai_stream(prompt, conversation_id):
-                    if resumo_chunk:
-                        # Enviar chunk via socket para streaming em tempo real
-                        socketio.emit('message_chunk', {
-                            'content': resumo_chunk,
-                            'conversation_id': conversation_id,
-                            'message_id': message_id,
-                            'chunk_number': chunk_number
-                        }, room=conversation_id)
-                        response_content += resumo_chunk
-                        chunk_number += 1
-            except Exception as e:
-                error_msg = f"Falha ao gerar resumo para o bloco {block_number}: {str(e)}"
-                print(f"[ERRO] {error_msg}")
-                error_response = f"*Erro ao gerar resumo para este bloco*\n\n**Trecho original:**\n\n{chunk[:150]}..."
-                socketio.emit('message_chunk', {
-                    'content': error_response,
-                    'conversation_id': conversation_id,
-                    'message_id': message_id,
-                    'chunk_number': chunk_number
-                }, room=conversation_id)
-                response_content += error_response
+            return process_with_ai_stream(prompt, conversation_id, history_policy="none", use_cache=True,
+                                          priority=PRIORITY_BATCH, on_queue_position=notify_position,
+                                          cancel=session.cancel_token)
+        
+        def summarize_all(block_summaries):
+            joined = "\n\n".join(f"Bloco {i + 1}: {summary.strip()}" for i, summary in enumerate(block_summaries))
+            prompt = f"""A seguir estão os resumos de cada bloco de um vídeo. Escreva um resumo geral do vídeo, coeso e em poucos parágrafos, com os pontos mais importantes:
+
+{joined}
+
+Resumo geral:"""
+            return process_with_ai_stream(prompt, conversation_id, history_policy="none", use_cache=True,
+                                          priority=PRIORITY_BATCH, on_queue_position=notify_position,
+                                          cancel=session.cancel_token)
+        
+        summarizer = MapReduceSummarizer(summarize_block, reduce_fn=summarize_all)
+        logger.info(f"[BACKEND] Resumindo blocos com até {summarizer.concurrency} em paralelo")
+        
+        current_block = None
+        blocks_done = 0
+        for event in summarizer.run(itertools.chain([first_chunk], transcript_chunks)):
+            if session.cancelled:
+                # Sair do loop encerra o summarizer: os blocos restantes não são iniciados
+                break
+            kind = event[0]
+            if kind == "block_start":
+                # Adiciona cabeçalho do bloco, com o trecho do vídeo quando conhecido
+                current_block = event[2]
+                position = f" ({format_timestamp(current_block.start)}–{format_timestamp(current_block.end)})" if current_block.start is not None else ""
+                emit_chunk(f"\n\n### Bloco {event[1] + 1}{position}\n\n")
+            elif kind == "block_chunk" and event[2]:
+                emit_chunk(event[2])
+            elif kind == "block_error":
+                block_number = event[1] + 1
+                print(f"[ERRO] Falha ao gerar resumo para o bloco {block_number}: {str(event[2])}")
+                emit_chunk(f"*Erro ao gerar resumo para este bloco*\n\n**Trecho original:**\n\n{current_block.text[:150]}...")
+            elif kind == "block_end":
+                blocks_done = event[1] + 1
+            elif kind == "reduce_start":
+                emit_chunk("\n\n## Resumo geral\n\n")
+            elif kind == "reduce_chunk" and event[1]:
+                emit_chunk(event[1])
+        cancelled = session.cancelled
+        if cancelled:
+            emit_chunk("\n\n*Resumo interrompido.*")
+            logger.info(f"[BACKEND] Resumo cancelado para {conversation_id} ({session.cancel_token.reason})")
+        emitter.close()
+        logger.info(f"[BACKEND] {blocks_done} blocos resumidos para {conversation_id}")
+        logger.debug(f"[BACKEND] Trechos do resumo enviados: {emitter.stats()}")
+        response_content = session.content.getvalue()
+        streaming_messages.finish(message_id)
         
         # Notificar que a resposta está completa
         socketio.emit('response_complete', {
             'conversation_id': conversation_id,
             'message_id': message_id,
             'total_chunks': chunk_number,
-            'complete_response': response_content
+            'complete_response': response_content,
+            'cancelled': cancelled
         }, room=conversation_id)
         logger.info(f"[BACKEND] Resumo concluído para {conversation_id}, total de chunks: {chunk_number}")
         
-        # Atualiza a mensagem no histórico
+        # Atualiza a mensagem no histórico (com o resumo parcial, se cancelado)
         update_message_in_conversation(conversation_id, message_id, response_content)
         
         # Notifica que a conversa foi atualizada
@@ -734,19 +954,41 @@ Resumo detalhado:"""
         error_msg = f"Erro ao processar o resumo do vídeo: {str(e)}"
         print(f"[ERRO] {error_msg}")
         
-        # Em caso de erro, enviar message_chunk e response_complete
-        socketio.emit('message_chunk', {
-            'content': f"**Erro:** {error_msg}",
-            'conversation_id': conversation_id,
-            'message_id': message_id,
-            'chunk_number': chunk_number if 'chunk_number' in locals() else 1
-        }, room=conversation_id)
+        # Em caso de erro, enviar os trechos pendentes, message_chunk e response_complete
+        if 'emitter' in locals():
+            emitter.close()
+        if 'send_frame' in locals():
+            send_frame(f"**Erro:** {error_msg}")
+            streaming_messages.finish(message_id, error=error_msg)
+        else:
+            socketio.emit('message_chunk', {
+                'content': f"**Erro:** {error_msg}",
+                'conversation_id': conversation_id,
+                'message_id': message_id,
+                'chunk_number': 1
+            }, room=conversation_id)
         socketio.emit('response_complete', {
             'conversation_id': conversation_id,
             'message_id': message_id
         }, room=conversation_id)
         logger.error(f"[BACKEND] Erro no YouTube Resumo: {str(e)}")
 
+@app.route('/youtube_metrics')
+def youtube_metrics():
+    """
+    Endpoint com as métricas do serviço de vídeos: tempo de inicialização do yt-dlp
+    versus tempo de rede, leitura das legendas e estado da fila.
+    """
+    return jsonify(youtube_service.metrics())
+
+@app.route('/llm_metrics')
+def llm_metrics():
+    """
+    Endpoint com as métricas da fila de chamadas ao modelo: chamadas em andamento e
+    aguardando, e o tempo de espera na fila por classe de prioridade.
+    """
+    return jsonify(llm_scheduler.metrics())
+
 @app.route('/rename_conversation/<conversation_id>', methods=['POST'])
 def handle_rename_conversation(conversation_id):
     try:
@@ -1107,6 +1349,10 @@ def handle_connect():
 def handle_disconnect():
     """Evento de desconexão do Socket.IO"""
     logger.info(f"Conexão Socket.IO encerrada: {request.sid}")
+    # Gerações de conversas que ficarem sem nenhum cliente são canceladas
+    for room in rooms():
+        if room != request.sid:
+            cancel_if_abandoned(room)
 
 @socketio.on('join_conversation')
 def handle_join_conversation(data):
@@ -1118,6 +1364,56 @@ def handle_join_conversation(data):
         return {'status': 'success', 'joined': conversation_id}
     return {'status': 'error', 'message': 'ID da conversa não fornecido'}
 
+@socketio.on('resume_stream')
+def handle_resume_stream(data):
+    """
+    Evento para um cliente que reconectou durante uma resposta em streaming: entra na
+    sala da conversa e recebe, na resposta do evento, o texto dos quadros a partir de
+    from_seq (o seq seguinte ao último message_chunk recebido). Os quadros seguintes
+    chegam como message_chunk a partir de next_seq; os de seq menor já estão no texto
+    devolvido e devem ser ignorados.
+    """
+    message_id = data.get('message_id')
+    if not message_id:
+        return {'status': 'error', 'message': 'ID da mensagem não fornecido'}
+    from_seq = data.get('from_seq') or 0
+    if isinstance(from_seq, str) and from_seq.isdigit():
+        from_seq = int(from_seq)
+    # bool é subclasse de int, mas não é um seq válido
+    if not isinstance(from_seq, int) or isinstance(from_seq, bool) or from_seq < 0:
+        return {'status': 'error', 'message': 'from_seq inválido'}
+    session = streaming_messages.get(message_id)
+    if session is None:
+        # Sessão concluída há mais de STREAM_SESSION_TTL: o cliente recarrega a conversa
+        return {'status': 'error', 'message': 'Streaming não encontrado ou expirado'}
+    join_room(session.conversation_id)
+    content, next_seq = session.replay(from_seq)
+    logger.debug(f"Cliente {request.sid} retomou o streaming {message_id} com {len(content)} caracteres")
+    return {
+        'status': 'success',
+        'message_id': message_id,
+        'conversation_id': session.conversation_id,
+        'content': content,
+        'next_seq': next_seq,
+        'complete': session.complete,
+        'error': session.error
+    }
+
+@socketio.on('cancel_generation')
+def handle_cancel_generation(data):
+    """
+    Evento para interromper a geração de uma resposta (chat ou resumo de vídeo). A
+    resposta HTTP do modelo é fechada na hora, o texto já gerado é salvo na conversa
+    e os blocos restantes de um resumo não são processados.
+    """
+    message_id = data.get('message_id')
+    if not message_id:
+        return {'status': 'error', 'message': 'ID da mensagem não fornecido'}
+    if not streaming_messages.cancel(message_id, "cancelada pelo usuário"):
+        return {'status': 'error', 'message': 'Nenhuma geração em andamento para esta mensagem'}
+    logger.info(f"Cliente {request.sid} cancelou a geração {message_id}")
+    return {'status': 'success', 'message_id': message_id}
+
 @socketio.on('leave_conversation')
 def handle_leave_conversation(data):
     """Evento para sair de uma sala de conversa"""
@@ -1125,6 +1421,7 @@ def handle_leave_conversation(data):
     if conversation_id:
         leave_room(conversation_id)
         logger.debug(f"Cliente {request.sid} saiu da sala: {conversation_id}")
+        cancel_if_abandoned(conversation_id)
         return {'status': 'success', 'left': conversation_id}
     return {'status': 'error', 'message': 'ID da conversa não fornecido'}
 
@@ -1153,14 +1450,13 @@ def process_with_ai(text, conversation_id=None):
             ],
             "stream": False
         }
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(API_URL, json=payload, headers=headers)
-        response.raise_for_status()
-
-        response_data = response.json()
+        with llm_scheduler.slot(conversation_id):
+            response_data = llm_client.complete(payload)
         if 'choices' in response_data and len(response_data['choices']) > 0:
             return response_data['choices'][0]['message']['content']
         return "Erro: Nenhuma resposta válida recebida da IA."
+    except LLMQueueFull:
+        return "O servidor está ocupado no momento. Tente novamente em instantes."
     except requests.exceptions.RequestException as e:
         print(f"[Debug] Erro na requisição HTTP: {str(e)}")
         return "Ocorreu um erro ao se conectar com a IA."
@@ -1168,7 +1464,68 @@ def process_with_ai(text, conversation_id=None):
         print(f"[Debug] Erro inesperado: {str(e)}")
         return "Ocorreu um erro inesperado ao processar sua mensagem."
 
-def process_with_ai_stream(text, conversation_id=None):
+def build_history_messages(conversation_id, history_policy=HISTORY_POLICY, text=None):
+    """
+    Monta as mensagens de histórico enviadas ao modelo, conforme a política escolhida.
+    Com a política "none" a conversa nem é carregada.
+    
+    Args:
+        conversation_id: ID da conversa (ou None)
+        history_policy: "none", "last_k" ou "token_budget"
+        text: Mensagem atual; com "token_budget" seus tokens são descontados do orçamento
+        
+    Returns:
+        list: Mensagens no formato da API ({'role', 'content'}), da mais antiga para a mais nova
+    """
+    if history_policy not in HISTORY_POLICIES:
+        raise ValueError(f"Política de histórico desconhecida: {history_policy}")
+    if history_policy == "none" or not conversation_id:
+        return []
+    
+    conversation = get_conversation_by_id(conversation_id)
+    if not conversation or 'messages' not in conversation:
+        return []
+    
+    # Mensagens já cobertas pelo resumo acumulado são substituídas por ele; as demais
+    # vão com o conteúdo completo (não a prévia dos blobs), cortado pelo ContextBuilder
+    stored = [resolve_message(msg) for msg in conversation['messages'][covered_messages(conversation):]]
+    memory = []
+    if conversation.get('memory'):
+        memory = [{
+            "role": "system",
+            "content": f"Resumo da conversa até aqui:\n{conversation['memory']['summary']}"
+        }]
+    
+    if history_policy == "last_k":
+        history = [
+            {"role": msg['role'], "content": msg['content']}
+            for msg in stored
+            if msg.get('role') in ('user', 'assistant')
+        ]
+        return memory + (history[-HISTORY_LAST_K:] if HISTORY_LAST_K > 0 else [])
+    
+    # token_budget: a mensagem atual entra inteira depois; o histórico ocupa o restante
+    tokenizer = get_tokenizer()
+    reserved = sum(tokenizer.count(msg['content']) for msg in memory)
+    if text is not None:
+        reserved += tokenizer.count(text)
+        if stored and stored[-1].get('content') == text:
+            stored = stored[:-1]
+    builder = ContextBuilder(tokenizer, HISTORY_TOKEN_BUDGET, HISTORY_MAX_MESSAGE_TOKENS)
+    history, tokens = builder.build(stored, reserved_tokens=reserved)
+    logger.debug(f"Histórico com {len(history)} mensagens e {tokens} tokens (+{reserved} do resumo e da mensagem atual)")
+    return memory + history
+
+def replay_cached_response(content):
+    """
+    Reproduz uma resposta guardada no cache em trechos do tamanho de palavras, para
+    que ela passe pelo mesmo agrupamento em chunks de uma resposta em streaming.
+    """
+    for match in re.finditer(r'\s*\S+\s*|\s+', content):
+        yield match.group(0)
+
+def process_with_ai_stream(text, conversation_id=None, history_policy=HISTORY_POLICY, use_cache=False,
+                           priority=PRIORITY_INTERACTIVE, on_queue_position=None, cancel=None):
     """
     Processa o texto com a IA em modo streaming.
     Retorna a resposta incrementalmente em formato de gerador.
@@ -1176,29 +1533,20 @@ def process_with_ai_stream(text, conversation_id=None):
     Args:
         text: Texto da mensagem
         conversation_id: ID da conversa
+        history_policy: Histórico enviado junto com o texto ("none", "last_k" ou
+                        "token_budget"); prompts autocontidos devem usar "none"
+        use_cache: Consulta e alimenta o cache de respostas (se LLM_CACHE_ENABLED);
+                   apenas para chamadas determinísticas, sem histórico
+        priority: Classe na fila do modelo (PRIORITY_INTERACTIVE ou PRIORITY_BATCH)
+        on_queue_position: Chamado com a posição na fila enquanto a chamada aguarda
+        cancel: CancelToken da mensagem; ao ser cancelado, a resposta HTTP é fechada
+                e o gerador termina com o que já foi gerado (sem mensagem de erro)
     """
     try:
-        logger.debug(f"Iniciando processamento com IA para conversa: {conversation_id}")
+        logger.debug(f"Iniciando processamento com IA para conversa: {conversation_id} (histórico: {history_policy})")
         
         # Obter histórico da conversa para contexto
-        conversation = get_conversation_by_id(conversation_id) if conversation_id else None
-        messages = []
-        
-        if conversation and 'messages' in conversation:
-            # Carregar apenas as últimas mensagens para respeitar limite de tokens
-            history = conversation['messages'][-10:]  # Ajuste conforme necessário
-            
-            for msg in history:
-                if msg['role'] == 'user':
-                    messages.append({
-                        "role": "user", 
-                        "content": msg['content']
-                    })
-                elif msg['role'] == 'assistant':
-                    messages.append({
-                        "role": "assistant", 
-                        "content": msg['content']
-                    })
+        messages = build_history_messages(conversation_id, history_policy, text)
         
         # Adicionar a mensagem atual se ainda não estiver no histórico carregado
         if not messages or messages[-1]['content'] != text:
@@ -1218,61 +1566,81 @@ def process_with_ai_stream(text, conversation_id=None):
             "max_tokens": 2000
         }
         
-        logger.debug(f"Enviando requisição para API: {API_URL}")
+        cache = response_cache if use_cache else None
+        key = cache_key(payload) if cache else None
+        cached = cache.get(key) if cache else None
+        if cached is not None:
+            # Resposta já conhecida: reproduzida sem chamar o modelo nem entrar na fila
+            logger.debug(f"Resposta encontrada no cache: {key[:12]}")
+            source = replay_cached_response(cached)
+            slot = nullcontext()
+        else:
+            source = None
+            # A vaga no modelo fica ocupada até o fim da resposta (ou até o gerador ser fechado)
+            slot = llm_scheduler.slot(conversation_id, priority, on_queue_position, cancel)
         
-        # Enviar requisição em streaming
-        response = requests.post(
-            API_URL,
-            json=payload,
-            stream=True,
-            timeout=60
-        )
+        remove_close_callback = None
         
-        if response.status_code != 200:
-            logger.error(f"Erro na API: {response.status_code} - {response.text}")
-            yield f"Erro ao processar a resposta: {response.status_code}"
-            return
-            
-        logger.debug("Conexão estabelecida com a API, iniciando streaming")
+        def watch_response(response):
+            nonlocal remove_close_callback
+            # Cancelar a geração fecha a resposta, interrompendo a leitura na hora
+            remove_close_callback = cancel.on_cancel(response.close)
         
         buffer = ""
-        for line in response.iter_lines():
-            if line:
-                try:
-                    line_text = line.decode('utf-8')
-                    
-                    # Pular prefixo de dados
-                    if line_text.startswith('data: '):
-                        line_text = line_text[6:]
-                        
-                    # Verificar se é o marcador de fim    
-                    if line_text == '[DONE]':
-                        logger.debug("Marcador [DONE] recebido, finalizando streaming")
+        complete_response = []
+        try:
+            with slot:
+                if source is None:
+                    logger.debug(f"Enviando requisição para API: {API_URL}")
+                    # Enviar requisição em streaming, reutilizando uma conexão do pool
+                    source = llm_client.stream_chat(payload, on_response=watch_response if cancel else None)
+                for content in source:
+                    buffer += content
+                    complete_response.append(content)
+                    if cancel is not None and cancel.is_cancelled():
                         break
-                        
-                    # Decodificar JSON
-                    data = json.loads(line_text)
                     
-                    if 'choices' in data and len(data['choices']) > 0:
-                        choice = data['choices'][0]
-                        if 'delta' in choice and 'content' in choice['delta']:
-                            content = choice['delta']['content']
-                            if content:
-                                buffer += content
-                                
-                                # Enviar buffer quando atingir certo tamanho ou tiver pontuação
-                                if len(buffer) >= 10 or any(c in buffer for c in '.!?'):
-                                    logger.debug(f"Enviando chunk de {len(buffer)} caracteres")
-                                    yield buffer
-                                    buffer = ""
-                except Exception as e:
-                    logger.error(f"Erro ao processar linha do streaming: {str(e)}")
-                    logger.error(traceback.format_exc())
+                    # Enviar buffer quando atingir certo tamanho ou tiver pontuação
+                    if len(buffer) >= 10 or any(c in buffer for c in '.!?'):
+                        logger.debug(f"Enviando chunk de {len(buffer)} caracteres")
+                        yield buffer
+                        buffer = ""
+        except GenerationCancelled:
+            logger.info(f"Geração cancelada antes de começar para conversa: {conversation_id}")
+            return
+        except LLMQueueFull as e:
+            logger.warning(f"{str(e)} (conversa: {conversation_id})")
+            yield "O servidor está ocupado no momento. Tente novamente em instantes."
+            return
+        except LLMResponseError as e:
+            logger.error(str(e))
+            yield f"Erro ao processar a resposta: {e.status_code}"
+            return
+        except Exception:
+            # Erro de leitura causado pelo fechamento da resposta no cancelamento
+            if cancel is None or not cancel.is_cancelled():
+                raise
+        finally:
+            # Fecha a resposta HTTP se a leitura parou antes do fim
+            close = getattr(source, "close", None)
+            if close:
+                close()
+            if remove_close_callback:
+                remove_close_callback()
         
         # Enviar resto do buffer se houver
         if buffer:
             logger.debug(f"Enviando chunk final de {len(buffer)} caracteres")
             yield buffer
+        
+        if cancel is not None and cancel.is_cancelled():
+            # Resposta parcial: entregue ao chamador, mas não entra no cache
+            logger.info(f"Geração cancelada para conversa: {conversation_id} ({cancel.reason})")
+            return
+        
+        # Só respostas completas entram no cache
+        if cache and cached is None and complete_response:
+            cache.put(key, "".join(complete_response))
             
         logger.info(f"Streaming concluído para conversa: {conversation_id}")
         
@@ -1314,3 +1682,9 @@ if __name__ == '__main__':
     except Exception as e:
         logger.critical(f"Falha ao iniciar servidor: {str(e)}")
         logger.critical(traceback.format_exc())
+    finally:
+        # Grava as conversas com alterações pendentes no cache antes de encerrar
+        flush_all()
+        logger.info("Alterações pendentes gravadas em disco")
+        llm_client.close()
+        youtube_service.close()
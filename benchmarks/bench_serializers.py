@@ -0,0 +1,137 @@
+"""
+Benchmark dos formatos de serialização de conversas.
+
+Gera uma conversa sintética (com mensagens longas, como as transcrições do YouTube),
+grava e lê o documento em disco com cada serializador disponível e informa o
+tamanho do arquivo e o tempo de gravação e leitura por MB de conversa. O formato
+antigo (JSON indentado) entra como referência.
+
+Uso:
+    python benchmarks/bench_serializers.py
+    python benchmarks/bench_serializers.py --messages 400 --transcript-kb 512 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.atomic_file import atomic_write
+from utils.serializers import available_serializers
+
+
+class IndentedJsonSerializer:
+    """Formato original: json.dumps(indent=2), usado como referência."""
+
+    name = "json-indent"
+
+    def dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+def make_text(rng, size):
+    """Gera texto com palavras e acentos, no tamanho aproximado pedido."""
+    words = []
+    total = 0
+    while total < size:
+        word = "".join(rng.choice(string.ascii_lowercase + "áéçõ") for _ in range(rng.randint(2, 10)))
+        words.append(word)
+        total += len(word) + 1
+    return " ".join(words)
+
+
+def make_conversation(messages, message_chars, transcript_chars, seed=42):
+    """Monta uma conversa sintética com uma transcrição longa e mensagens comuns."""
+    rng = random.Random(seed)
+    conversation = {
+        "id": "bench",
+        "title": "Benchmark",
+        "timestamp": "2025-01-01T00:00:00",
+        "messages": []
+    }
+    if transcript_chars:
+        conversation["messages"].append({
+            "message_id": "transcript",
+            "role": "assistant",
+            "content": "**Legendas do vídeo**\n\n" + make_text(rng, transcript_chars),
+            "timestamp": "2025-01-01T00:00:00"
+        })
+    for i in range(messages):
+        conversation["messages"].append({
+            "message_id": f"m{i}",
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": make_text(rng, message_chars),
+            "timestamp": f"2025-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}"
+        })
+    return conversation
+
+
+def bench(serializer, conversation, directory, repeat):
+    """
+    Mede gravação (codificação + escrita atômica) e leitura (leitura + decodificação).
+
+    Returns:
+        dict: Tamanho do arquivo e melhores tempos das repetições
+    """
+    path = os.path.join(directory, f"conversation_bench.{serializer.name}")
+    save_times = []
+    load_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        atomic_write(path, serializer.dumps(conversation), fsync=False)
+        save_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            loaded = serializer.loads(f.read())
+        load_times.append(time.perf_counter() - start)
+
+    assert loaded == conversation, f"{serializer.name}: documento lido difere do gravado"
+    return {"file_bytes": os.path.getsize(path), "save_s": min(save_times), "load_s": min(load_times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara os serializadores de conversas')
+    parser.add_argument('--messages', type=int, default=200, help='Mensagens comuns na conversa')
+    parser.add_argument('--message-chars', type=int, default=800, help='Tamanho de cada mensagem comum')
+    parser.add_argument('--transcript-kb', type=int, default=256, help='Tamanho da transcrição em KB (0 = sem)')
+    parser.add_argument('--repeat', type=int, default=5, help='Repetições (vale o melhor tempo)')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    conversation = make_conversation(args.messages, args.message_chars, args.transcript_kb * 1024)
+    # Base comum por MB: o tamanho do conteúdo em JSON compacto
+    content_mb = len(json.dumps(conversation, ensure_ascii=False).encode('utf-8')) / (1024 * 1024)
+
+    serializers = [IndentedJsonSerializer()] + list(available_serializers().values())
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for serializer in serializers:
+            result = bench(serializer, conversation, directory, args.repeat)
+            result["save_ms_per_mb"] = result["save_s"] * 1000 / content_mb
+            result["load_ms_per_mb"] = result["load_s"] * 1000 / content_mb
+            results[serializer.name] = result
+
+    if args.json:
+        print(json.dumps({"content_mb": content_mb, "results": results}, indent=2))
+        return 0
+
+    print(f"Conversa de {content_mb:.2f} MB ({len(conversation['messages'])} mensagens)")
+    print(f"{'formato':<12} {'arquivo (KB)':>12} {'gravação ms/MB':>15} {'leitura ms/MB':>14}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['file_bytes'] / 1024:>12.1f} "
+              f"{result['save_ms_per_mb']:>15.2f} {result['load_ms_per_mb']:>14.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
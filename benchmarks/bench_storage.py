@@ -0,0 +1,301 @@
+"""
+Benchmark da camada de persistência (utils/chat_storage.py).
+
+Para cada motor de armazenamento e tamanho de base, gera um conjunto sintético de
+conversas em um diretório temporário e mede as operações públicas do chat_storage:
+latência p50/p95/p99, vazão e pico de memória (RSS). Cada combinação roda em um
+processo separado, para que o pico de memória e o estado dos módulos (cache, índice)
+não contaminem as demais.
+
+O resultado é um JSON, para comparar motores e detectar regressões entre versões:
+
+    python benchmarks/bench_storage.py --output resultado.json
+    python benchmarks/bench_storage.py --engines log,sqlite --sizes 1000,10000 --samples 500
+    python benchmarks/bench_storage.py --sizes 100000 --messages 2 --flush-delay 0
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import chat_storage
+from utils.storage_engines import ENGINES, create_engine
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # pragma: no cover - dependência opcional
+    psutil = None
+
+DEFAULT_SIZES = "1000,10000,100000"
+
+
+def peak_rss_kb():
+    """Pico de memória residente do processo em KB, ou None se não for possível medir."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB; macOS, em bytes
+        return peak // 1024 if sys.platform == "darwin" else peak
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) // 1024
+    return None
+
+
+def percentile(sorted_values, fraction):
+    """Percentil pelo método do posto mais próximo."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(durations):
+    """Resume uma lista de durações (segundos) em latências (ms) e vazão."""
+    values = sorted(durations)
+    total = sum(values)
+    return {
+        "samples": len(values),
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "mean_ms": total / len(values) * 1000,
+        "throughput_ops_s": len(values) / total if total > 0 else None
+    }
+
+
+def make_text(rng, size):
+    return "".join(rng.choice(string.ascii_letters + "     áéç") for _ in range(size))
+
+
+def configure(data_dir, engine_name, flush_delay, cache_bytes):
+    """Aponta o chat_storage para um diretório temporário com o motor escolhido."""
+    chat_storage.DATA_DIR = data_dir
+    chat_storage.CONVERSATIONS_DIR = os.path.join(data_dir, "conversations")
+    chat_storage.INDEX_FILE = os.path.join(data_dir, "index.json")
+    chat_storage.BLOBS_DIR = os.path.join(data_dir, "blobs")
+    if flush_delay is not None:
+        chat_storage.CACHE_FLUSH_DELAY = flush_delay
+    if cache_bytes is not None:
+        chat_storage.CACHE_MAX_BYTES = cache_bytes
+    chat_storage.ensure_directories()
+    chat_storage.set_storage_engine(create_engine(engine_name, chat_storage.CONVERSATIONS_DIR))
+    chat_storage.set_conversation_index(None)
+
+
+def populate(conversations, messages, message_chars, seed):
+    """
+    Grava o conjunto sintético diretamente pelo motor e pelo índice, sem passar pelo
+    cache, para que a preparação não domine o tempo total.
+
+    Returns:
+        list: IDs das conversas criadas
+    """
+    rng = random.Random(seed)
+    engine = chat_storage.get_storage_engine()
+    index = chat_storage.get_conversation_index()
+    start = datetime(2024, 1, 1)
+    ids = []
+    for i in range(conversations):
+        conversation_id = f"bench{i:07d}"
+        timestamp = (start + timedelta(minutes=i)).isoformat()
+        conversation = {
+            "id": conversation_id,
+            "title": f"Conversa {i}",
+            "timestamp": timestamp,
+            "messages": [
+                {
+                    "message_id": f"{conversation_id}-{j}",
+                    "role": "user" if j % 2 == 0 else "assistant",
+                    "content": make_text(rng, message_chars),
+                    "timestamp": timestamp
+                }
+                for j in range(messages)
+            ]
+        }
+        engine.save(conversation)
+        index.put({
+            "id": conversation_id,
+            "title": conversation["title"],
+            "timestamp": timestamp,
+            "filename": engine.filename(conversation_id)
+        })
+        ids.append(conversation_id)
+    index.checkpoint()
+    return ids
+
+
+def timed(durations, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    durations.append(time.perf_counter() - start)
+    return result
+
+
+def run_case(engine_name, conversations, args):
+    """Executa todas as medições de um motor e tamanho; roda no processo filho."""
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_storage_") as data_dir:
+        configure(data_dir, engine_name, args.flush_delay, args.cache_bytes)
+
+        setup_start = time.perf_counter()
+        ids = populate(conversations, args.messages, args.message_chars, args.seed)
+        setup_s = time.perf_counter() - setup_start
+
+        samples = min(args.samples, conversations)
+        content = make_text(rng, args.message_chars)
+        operations = {}
+
+        # A listagem inicial inclui a reconciliação única do índice com o diretório
+        history_first = []
+        timed(history_first, chat_storage.get_conversation_history)
+        operations["get_conversation_history_first"] = summarize(history_first)
+
+        durations = []
+        for _ in range(max(1, samples // 10)):
+            timed(durations, chat_storage.get_conversation_history)
+        operations["get_conversation_history"] = summarize(durations)
+
+        durations = []
+        for conversation_id in rng.sample(ids, samples):
+            timed(durations, chat_storage.get_conversation_by_id, conversation_id)
+        operations["get_conversation_by_id"] = summarize(durations)
+
+        durations = []
+        for conversation_id in rng.sample(ids, samples):
+            timed(durations, chat_storage.get_conversation_messages, conversation_id, 0, args.page_size)
+        operations["get_conversation_messages"] = summarize(durations)
+
+        durations = []
+        created = []
+        for _ in range(samples):
+            created.append(timed(durations, chat_storage.create_new_conversation))
+        operations["create_new_conversation"] = summarize(durations)
+
+        durations = []
+        for conversation_id in rng.sample(ids, samples):
+            timed(durations, chat_storage.add_message_to_conversation, conversation_id, content, "user")
+        operations["add_message_to_conversation"] = summarize(durations)
+
+        durations = []
+        for conversation_id in rng.sample(ids, samples):
+            message_id = f"{conversation_id}-0"
+            timed(durations, chat_storage.update_message_in_conversation, conversation_id, message_id, content)
+        operations["update_message_in_conversation"] = summarize(durations)
+
+        durations = []
+        for conversation_id in rng.sample(ids, samples):
+            timed(durations, chat_storage.rename_conversation, conversation_id, "Renomeada")
+        operations["rename_conversation"] = summarize(durations)
+
+        # Tempo para gravar em disco tudo o que o cache acumulou
+        durations = []
+        timed(durations, chat_storage.flush_all)
+        operations["flush_all"] = summarize(durations)
+
+        durations = []
+        for conversation_id in created:
+            timed(durations, chat_storage.delete_conversation, conversation_id)
+        operations["delete_conversation"] = summarize(durations)
+
+        chat_storage.set_storage_engine(None)
+        chat_storage.set_conversation_index(None)
+
+    return {
+        "engine": engine_name,
+        "conversations": conversations,
+        "messages_per_conversation": args.messages,
+        "setup_s": setup_s,
+        "peak_rss_kb": peak_rss_kb(),
+        "operations": operations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark das operações de chat_storage')
+    parser.add_argument('--engines', default=",".join(sorted(ENGINES)),
+                        help='Motores separados por vírgula (padrão: todos)')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Quantidades de conversas, separadas por vírgula')
+    parser.add_argument('--messages', type=int, default=4, help='Mensagens por conversa')
+    parser.add_argument('--message-chars', type=int, default=400, help='Tamanho de cada mensagem')
+    parser.add_argument('--samples', type=int, default=200, help='Amostras por operação')
+    parser.add_argument('--page-size', type=int, default=20, help='Tamanho do lote na paginação')
+    parser.add_argument('--flush-delay', type=float, help='CHAT_CACHE_FLUSH_DELAY (padrão: configuração atual)')
+    parser.add_argument('--cache-bytes', type=int, help='CHAT_CACHE_MAX_BYTES (padrão: configuração atual)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: saída padrão)')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        # Processo filho: um único motor e tamanho, resultado em JSON na saída padrão
+        engine_name, conversations = args.case.split(":")
+        print(json.dumps(run_case(engine_name, int(conversations), args)))
+        return 0
+
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    child_args = [
+        "--messages", str(args.messages),
+        "--message-chars", str(args.message_chars),
+        "--samples", str(args.samples),
+        "--page-size", str(args.page_size),
+        "--seed", str(args.seed)
+    ]
+    if args.flush_delay is not None:
+        child_args += ["--flush-delay", str(args.flush_delay)]
+    if args.cache_bytes is not None:
+        child_args += ["--cache-bytes", str(args.cache_bytes)]
+
+    results = []
+    for engine_name in engines:
+        for conversations in sizes:
+            print(f"[bench] {engine_name} com {conversations} conversas...", file=sys.stderr)
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *child_args, "--case", f"{engine_name}:{conversations}"],
+                capture_output=True, text=True
+            )
+            if completed.returncode != 0:
+                print(completed.stderr, file=sys.stderr)
+                results.append({"engine": engine_name, "conversations": conversations, "error": completed.stderr[-2000:]})
+                continue
+            results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "messages_per_conversation": args.messages,
+            "message_chars": args.message_chars,
+            "samples": args.samples,
+            "flush_delay": args.flush_delay if args.flush_delay is not None else chat_storage.CACHE_FLUSH_DELAY,
+            "cache_bytes": args.cache_bytes if args.cache_bytes is not None else chat_storage.CACHE_MAX_BYTES
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Benchmark da leitura de legendas (utils/subtitle_parser.py).
+
+Gera uma legenda automática sintética no formato do YouTube (pistas em "rolagem",
+com tags de tempo por palavra), com a duração pedida, e compara o parser de
+passada única com a limpeza original por expressões regulares sobre o arquivo
+inteiro, usada como referência. Informa tempo, pico de memória alocada
+(tracemalloc) e o tamanho do texto gerado por cada um.
+
+Uso:
+    python benchmarks/bench_subtitle_parser.py
+    python benchmarks/bench_subtitle_parser.py --hours 6 --repeat 3 --json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.subtitle_parser import subtitle_text
+
+
+def format_time(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{rest:06.3f}"
+
+
+def write_auto_captions(path, hours, seed=42):
+    """
+    Grava uma legenda automática sintética: cada pista repete a linha anterior e
+    acrescenta uma nova, com tags de tempo por palavra, como as do YouTube.
+
+    Returns:
+        int: Tamanho do arquivo em bytes
+    """
+    rng = random.Random(seed)
+    vocabulary = ["".join(rng.choice(string.ascii_lowercase + "áéçõ") for _ in range(rng.randint(2, 9)))
+                  for _ in range(3000)]
+    duration = hours * 3600
+    position = 0.0
+    previous = ""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\nKind: captions\nLanguage: pt\n\n")
+        while position < duration:
+            words = [rng.choice(vocabulary) for _ in range(rng.randint(5, 10))]
+            start, end = position, position + 3.0
+            tagged = words[0] + "".join(
+                f"<{format_time(start + (i + 1) * 0.3)}><c> {word}</c>" for i, word in enumerate(words[1:])
+            )
+            # Pista com a linha nova marcada palavra a palavra
+            f.write(f"{format_time(start)} --> {format_time(end)} align:start position:0%\n")
+            f.write(f"{previous}\n{tagged}\n\n" if previous else f" \n{tagged}\n\n")
+            line = " ".join(words)
+            # Pista curta de transição, só com o texto já dito
+            f.write(f"{format_time(end)} --> {format_time(end + 0.01)} align:start position:0%\n")
+            f.write(f"{line}\n \n\n")
+            previous = line
+            position = end + 0.01
+    return os.path.getsize(path)
+
+
+def legacy_clean(path):
+    """Limpeza original: arquivo inteiro em memória e uma cascata de re.sub."""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    content = re.sub(r'WEBVTT.*\n', '', content)
+    content = re.sub(r'Kind:.*\n', '', content)
+    content = re.sub(r'Language:.*\n', '', content)
+    content = re.sub(r'\d{2}:\d{2}:\d{2}[\.,]\d{3} --> .*\n', '', content)
+    content = re.sub(r'^\d+$', '', content, flags=re.MULTILINE)
+    content = re.sub(r'<[^>]+>', '', content)
+    content = re.sub(r'{\\an\d}', '', content)
+    content = re.sub(r'\[.*?\]', '', content)
+    seen_lines = set()
+    cleaned_lines = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and not line.startswith(('<', '{', '[')) and line not in seen_lines:
+            cleaned_lines.append(line)
+            seen_lines.add(line)
+    return ' '.join(cleaned_lines).strip()
+
+
+def bench(func, path, repeat):
+    """
+    Returns:
+        dict: Melhor tempo, pico de memória alocada e tamanho do texto
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(times), "peak_kb": peak / 1024, "text_chars": len(result), "words": len(result.split())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compara a leitura de legendas longas')
+    parser.add_argument('--hours', type=float, default=3, help='Duração da legenda sintética em horas')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetições (vale o melhor tempo)')
+    parser.add_argument('--json', action='store_true', help='Imprime o resultado em JSON')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "captions.pt.auto.vtt")
+        file_bytes = write_auto_captions(path, args.hours)
+        results = {
+            "regex": bench(legacy_clean, path, args.repeat),
+            "streaming": bench(subtitle_text, path, args.repeat)
+        }
+
+    if args.json:
+        print(json.dumps({"hours": args.hours, "file_bytes": file_bytes, "results": results}, indent=2))
+        return 0
+
+    print(f"Legenda de {args.hours:g} h ({file_bytes / (1024 * 1024):.1f} MB)")
+    print(f"{'parser':<10} {'tempo (s)':>10} {'pico (KB)':>12} {'palavras':>10}")
+    for name, result in results.items():
+        print(f"{name:<10} {result['seconds']:>10.3f} {result['peak_kb']:>12.0f} {result['words']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+Teste de carga de escritas concorrentes no chat_storage (utils/conversation_cache.py).
+
+Várias threads adicionam mensagens à mesma conversa ao mesmo tempo, em cada motor
+de armazenamento, nos casos em que a conversa não está no cache:
+
+- cache desativado (CHAT_CACHE_MAX_BYTES=0, CHAT_CACHE_FLUSH_DELAY=0)
+- conversa recém-despejada do cache: a cada mensagem outra conversa é lida,
+  empurrando a conversa alvo para fora do LRU
+
+Falha (código de saída 1) se as threads não terminarem dentro do tempo limite
+(deadlock) ou se alguma mensagem não tiver sido gravada.
+
+Uso:
+    python benchmarks/stress_conversation_cache.py
+    python benchmarks/stress_conversation_cache.py --threads 8 --messages 500 --engines log
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import chat_storage
+from utils.storage_engines import ENGINES, create_engine
+
+CASES = {
+    # nome: (CHAT_CACHE_MAX_BYTES, CHAT_CACHE_FLUSH_DELAY, lê outra conversa a cada mensagem)
+    "cache_desativado": (0, 0, False),
+    "apos_despejo": (1, 0, True),
+    "apos_despejo_adiado": (1, 0.01, True),
+}
+
+
+def configure(data_dir, engine_name, cache_bytes, flush_delay):
+    """Aponta o chat_storage para um diretório temporário com o motor escolhido."""
+    chat_storage.DATA_DIR = data_dir
+    chat_storage.CONVERSATIONS_DIR = os.path.join(data_dir, "conversations")
+    chat_storage.INDEX_FILE = os.path.join(data_dir, "index.json")
+    chat_storage.BLOBS_DIR = os.path.join(data_dir, "blobs")
+    chat_storage.CACHE_MAX_BYTES = cache_bytes
+    chat_storage.CACHE_FLUSH_DELAY = flush_delay
+    chat_storage.ensure_directories()
+    chat_storage.set_storage_engine(create_engine(engine_name, chat_storage.CONVERSATIONS_DIR))
+    chat_storage.set_conversation_index(None)
+
+
+def run_case(engine_name, case, threads, messages, timeout):
+    """
+    Returns:
+        str: Descrição da falha, ou None se o caso passou
+    """
+    cache_bytes, flush_delay, evict = CASES[case]
+    with tempfile.TemporaryDirectory() as directory:
+        configure(directory, engine_name, cache_bytes, flush_delay)
+        target = chat_storage.create_new_conversation()
+        other = target
+        while other == target:
+            # Os ids vêm do timestamp em milissegundos
+            other = chat_storage.create_new_conversation()
+        chat_storage.add_message_to_conversation(other, "outra conversa", "user")
+        chat_storage.flush_all()
+        errors = []
+
+        def writer(number):
+            try:
+                for i in range(messages):
+                    if evict:
+                        chat_storage.get_conversation_by_id(other)
+                    chat_storage.add_message_to_conversation(target, f"thread {number} mensagem {i}", "user")
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=writer, args=(n,), daemon=True) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout)
+        alive = sum(1 for worker in workers if worker.is_alive())
+        if alive:
+            # Threads presas não podem ser encerradas: o processo sai em seguida
+            return f"{alive} de {threads} threads ainda ativas após {timeout:g} s (deadlock)"
+        if errors:
+            return f"erro nas threads: {errors[0]!r}"
+
+        chat_storage.flush_all()
+        chat_storage.set_storage_engine(None)
+        stored = create_engine(engine_name, chat_storage.CONVERSATIONS_DIR).load(target)
+        written = len(stored["messages"]) if stored else 0
+        chat_storage.set_storage_engine(None)
+        if written != threads * messages:
+            return f"{written} de {threads * messages} mensagens gravadas"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Escritas concorrentes na mesma conversa')
+    parser.add_argument('--engines', default=",".join(sorted(ENGINES)),
+                        help='Motores separados por vírgula (padrão: todos)')
+    parser.add_argument('--cases', default=",".join(CASES), help='Casos separados por vírgula')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=200, help='Mensagens por thread')
+    parser.add_argument('--timeout', type=float, default=30, help='Tempo limite por caso em segundos')
+    args = parser.parse_args()
+
+    failed = False
+    for engine_name in [name.strip() for name in args.engines.split(",") if name.strip()]:
+        for case in [name.strip() for name in args.cases.split(",") if name.strip()]:
+            failure = run_case(engine_name, case, args.threads, args.messages, args.timeout)
+            print(f"{engine_name:<8} {case:<22} {'FALHOU: ' + failure if failure else 'ok'}")
+            if failure:
+                failed = True
+                if "deadlock" in failure:
+                    sys.stdout.flush()
+                    os._exit(1)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Script utilitário para migrar as conversas entre motores de armazenamento.
+
+Lê todas as conversas de data/conversations/ (arquivos .json e .jsonl) e as entradas
+de data/index.json, e grava tudo no motor de destino. Uso típico, para passar a usar
+o SQLite:
+
+    python migrate_storage.py --to sqlite
+    set CHAT_STORAGE_ENGINE=sqlite  (ou export no Linux)
+
+Também converte os arquivos para outro formato de serialização, por exemplo para
+regravar as conversas .json antigas (indentadas) em msgpack:
+
+    python migrate_storage.py --to json --format msgpack
+    set CHAT_STORAGE_ENGINE=json
+    set CHAT_SERIALIZER=msgpack
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from utils import chat_storage
+from utils.serializers import available_serializers, loads as load_document
+from utils.storage_engines import ENGINES, AppendLogEngine, create_engine
+
+def load_index_entries(index_file):
+    """Lê o index.json existente, retornando uma lista vazia se não houver."""
+    try:
+        with open(index_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+def migrate(target_name, delete_source=False, serializer=None):
+    """
+    Copia todas as conversas de arquivos para o motor de destino.
+
+    Args:
+        target_name (str): Nome do motor de destino
+        delete_source (bool): Remove os arquivos de origem após a cópia
+        serializer (str, optional): Formato de serialização do destino
+
+    Returns:
+        int: Número de conversas migradas
+    """
+    conversations_dir = chat_storage.CONVERSATIONS_DIR
+    # O motor de log lê tanto o formato .jsonl quanto o .json antigo
+    source = AppendLogEngine(conversations_dir)
+    target = create_engine(target_name, conversations_dir, serializer)
+
+    index_entries = {entry["id"]: entry for entry in load_index_entries(chat_storage.INDEX_FILE)}
+    ids = source.list_ids()
+
+    migrated = 0
+    for conversation_id in sorted(ids):
+        try:
+            # Lê o arquivo sem passar pelo motor, que converteria o formato antigo em disco
+            json_path = os.path.join(conversations_dir, f"conversation_{conversation_id}.json")
+            if os.path.exists(source.filepath(conversation_id)):
+                conversation = source.load(conversation_id)
+            else:
+                with open(json_path, 'rb') as f:
+                    conversation = load_document(f.read())
+
+            # Mantém o título exibido na barra lateral, registrado no índice
+            entry = index_entries.get(conversation_id)
+            if entry:
+                conversation["title"] = entry.get("title", conversation.get("title", "Nova conversa"))
+
+            target.save(conversation)
+            migrated += 1
+
+            if delete_source and target.name != "log":
+                for path in (source.filepath(conversation_id), json_path):
+                    if os.path.exists(path) and os.path.abspath(path) != os.path.abspath(target.filepath(conversation_id)):
+                        os.remove(path)
+        except Exception as e:
+            print(f"[ERRO] Falha ao migrar conversa {conversation_id}: {str(e)}")
+
+    # Reconstrói o índice do destino a partir das conversas migradas
+    index = target.create_index(chat_storage.INDEX_FILE)
+    for conversation_id in ids:
+        if target.exists(conversation_id):
+            meta = target.load_meta(conversation_id)
+            index.put({
+                "id": conversation_id,
+                "title": meta["title"],
+                "timestamp": meta["timestamp"],
+                "filename": target.filename(conversation_id)
+            })
+    index.checkpoint()
+
+    return migrated
+
+def main():
+    parser = argparse.ArgumentParser(description='Migra as conversas para outro motor de armazenamento')
+    parser.add_argument('--to', dest='target', required=True, choices=sorted(ENGINES),
+                        help='Motor de destino')
+    parser.add_argument('--format', dest='serializer', choices=sorted(available_serializers()),
+                        help='Formato de serialização do destino (padrão: CHAT_SERIALIZER)')
+    parser.add_argument('--delete-source', action='store_true',
+                        help='Remove os arquivos de origem após a migração')
+    args = parser.parse_args()
+
+    serializer = args.serializer or chat_storage.SERIALIZER
+    chat_storage.ensure_directories()
+    print(f"Migrando conversas de {chat_storage.CONVERSATIONS_DIR} para o motor '{args.target}' ({serializer})...")
+    migrated = migrate(args.target, delete_source=args.delete_source, serializer=serializer)
+    print(f"{migrated} conversa(s) migrada(s).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
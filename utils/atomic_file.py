@@ -0,0 +1,39 @@
+"""
+Escrita Atômica de Arquivos
+
+Este módulo fornece atomic_write, usada por todo o armazenamento para substituir
+arquivos inteiros (conversas, logs compactados e índice). O conteúdo é gravado em um
+arquivo temporário no mesmo diretório e só então colocado no lugar do original com
+os.replace, de modo que leitores e processos interrompidos nunca vejam um arquivo
+truncado ou pela metade.
+"""
+
+import os
+import tempfile
+
+
+def atomic_write(path, content, fsync=True, encoding='utf-8'):
+    """
+    Substitui o conteúdo de um arquivo de forma atômica.
+
+    Args:
+        path (str): Caminho do arquivo de destino
+        content (str | bytes): Conteúdo completo do arquivo
+        fsync (bool): Sincroniza o arquivo em disco antes da troca
+        encoding (str): Codificação usada quando content é str
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content.encode(encoding) if isinstance(content, str) else content)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
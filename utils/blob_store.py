@@ -0,0 +1,276 @@
+"""
+Armazenamento Endereçado por Conteúdo (blobs)
+
+Este módulo guarda conteúdos grandes de mensagens (ex.: transcrições de vídeos do
+YouTube) fora dos arquivos de conversa, em data/blobs/. Cada blob é nomeado pelo
+sha256 do conteúdo original, então textos idênticos (a mesma transcrição pedida em
+várias conversas) são gravados uma única vez.
+
+A mensagem guarda apenas uma prévia em content e a referência em "blob":
+    {"sha256": "...", "size": <bytes do conteúdo original>}
+
+Compressão, escolhida por CHAT_BLOB_COMPRESSION:
+- "auto" (padrão): zstd se o pacote opcional zstandard estiver instalado, senão gzip
+- "zstd", "gzip" ou "none"
+A extensão do arquivo indica a compressão usada, então blobs gravados com
+configurações diferentes continuam legíveis.
+
+Como um blob pode ser compartilhado por várias conversas, as mensagens que usam
+cada um são registradas em BlobReferences (data/blobs/refs.json); um blob só é
+removido quando a última mensagem que o referencia é editada ou excluída. A
+referência é registrada antes de o blob ser gravado, e a remoção confere a contagem
+sob o mesmo lock, então um blob reutilizado nunca é removido no meio da gravação.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+from utils.atomic_file import atomic_write
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+# Extensão do arquivo de cada tipo de compressão
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz", "none": ""}
+
+
+def _compress(data, compression):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    return data
+
+
+def _decompress(data, compression):
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if compression == "gzip":
+        return gzip.decompress(data)
+    return data
+
+
+class BlobStore:
+    """
+    Diretório de blobs imutáveis endereçados pelo sha256 do conteúdo.
+    """
+
+    def __init__(self, directory, compression="auto"):
+        """
+        Args:
+            directory (str): Diretório raiz dos blobs
+            compression (str): 'auto', 'zstd', 'gzip' ou 'none'
+        """
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "gzip"
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Compressão desconhecida: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("Compressão zstd requer o pacote zstandard")
+        self.directory = directory
+        self.compression = compression
+
+    def _path(self, digest, compression):
+        # Subdiretórios pelos dois primeiros caracteres evitam diretórios enormes
+        return os.path.join(self.directory, digest[:2], digest + EXTENSIONS[compression])
+
+    def _find(self, digest):
+        """Localiza o arquivo do blob, qualquer que seja a compressão usada ao gravá-lo."""
+        for compression in EXTENSIONS:
+            path = self._path(digest, compression)
+            if os.path.exists(path):
+                return path, compression
+        return None, None
+
+    def put(self, content):
+        """
+        Grava um conteúdo, se ainda não existir um blob idêntico.
+
+        Args:
+            content (str): Conteúdo completo
+
+        Returns:
+            dict: Referência {'sha256', 'size'} a ser guardada na mensagem
+        """
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        if self._find(digest)[0] is None:
+            path = self._path(digest, self.compression)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, _compress(data, self.compression))
+        return {"sha256": digest, "size": len(data)}
+
+    @staticmethod
+    def reference(content):
+        """
+        Calcula a referência de um conteúdo sem gravá-lo.
+
+        Returns:
+            dict: Referência {'sha256', 'size'}, a mesma retornada por put
+        """
+        data = content.encode('utf-8')
+        return {"sha256": hashlib.sha256(data).hexdigest(), "size": len(data)}
+
+    def get(self, digest):
+        """
+        Lê o conteúdo de um blob.
+
+        Returns:
+            str: Conteúdo original
+
+        Raises:
+            FileNotFoundError: Se o blob não existir
+        """
+        path, compression = self._find(digest)
+        if path is None:
+            raise FileNotFoundError(f"Blob não encontrado: {digest}")
+        with open(path, 'rb') as f:
+            return _decompress(f.read(), compression).decode('utf-8')
+
+    def exists(self, digest):
+        """Indica se o blob existe."""
+        return self._find(digest)[0] is not None
+
+    def delete(self, digest):
+        """
+        Remove o blob, qualquer que seja a compressão usada ao gravá-lo.
+
+        Returns:
+            bool: True se algum arquivo foi removido
+        """
+        removed = False
+        for compression in EXTENSIONS:
+            try:
+                os.remove(self._path(digest, compression))
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class BlobReferences:
+    """
+    Quais mensagens referenciam cada blob, persistido em um arquivo JSON:
+        {"conversations": {conversation_id: {message_id: sha256}}}
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Arquivo onde as referências são gravadas
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conversations = {}
+        self._counts = {}
+
+    def load(self):
+        """
+        Lê as referências gravadas.
+
+        Returns:
+            bool: False se o arquivo não existir ou estiver corrompido (é preciso usar rebuild)
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                conversations = json.loads(f.read())["conversations"]
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[ERRO-PYTHON] Referências de blobs inválidas, reconstruindo: {str(e)}")
+            return False
+        with self._lock:
+            self._set_all(conversations)
+        return True
+
+    def rebuild(self, conversations):
+        """
+        Substitui todas as referências e as grava.
+
+        Args:
+            conversations (dict): {conversation_id: {message_id: sha256}}
+        """
+        with self._lock:
+            self._set_all({cid: dict(refs) for cid, refs in conversations.items() if refs})
+            self._save()
+
+    def _set_all(self, conversations):
+        self._conversations = conversations
+        self._counts = {}
+        for refs in conversations.values():
+            for digest in refs.values():
+                self._counts[digest] = self._counts.get(digest, 0) + 1
+
+    def _release(self, digest):
+        """Desconta uma referência; retorna o digest se ele ficou sem referências."""
+        count = self._counts.get(digest, 0) - 1
+        if count > 0:
+            self._counts[digest] = count
+            return None
+        self._counts.pop(digest, None)
+        return digest
+
+    def _save(self):
+        # Com fsync: uma referência perdida permitiria remover um blob ainda em uso
+        atomic_write(self.path, json.dumps({"conversations": self._conversations}))
+
+    def assign(self, conversation_id, message_id, digest):
+        """
+        Registra o blob usado por uma mensagem (None se ela deixou de usar blob).
+
+        Returns:
+            set: Digests que ficaram sem referências (o blob anterior da mensagem),
+                 a remover com collect depois que a alteração da mensagem for gravada
+        """
+        with self._lock:
+            refs = self._conversations.get(conversation_id, {})
+            previous = refs.get(message_id)
+            if previous == digest:
+                return set()
+            if digest is None:
+                del refs[message_id]
+                if not refs:
+                    self._conversations.pop(conversation_id, None)
+            else:
+                refs[message_id] = digest
+                self._conversations[conversation_id] = refs
+                self._counts[digest] = self._counts.get(digest, 0) + 1
+            orphaned = self._release(previous) if previous is not None else None
+            self._save()
+        return {orphaned} if orphaned else set()
+
+    def release_conversation(self, conversation_id):
+        """
+        Remove as referências de uma conversa excluída.
+
+        Returns:
+            set: Digests que ficaram sem referências
+        """
+        with self._lock:
+            refs = self._conversations.pop(conversation_id, None)
+            if not refs:
+                return set()
+            orphaned = {self._release(digest) for digest in refs.values()}
+            self._save()
+        orphaned.discard(None)
+        return orphaned
+
+    def collect(self, store, digests):
+        """
+        Remove do armazenamento os blobs que continuam sem referências. A contagem é
+        conferida sob o lock, então um blob que voltou a ser usado é mantido.
+
+        Returns:
+            int: Quantidade de blobs removidos
+        """
+        removed = 0
+        with self._lock:
+            for digest in digests:
+                if not self._counts.get(digest) and store.delete(digest):
+                    removed += 1
+        return removed
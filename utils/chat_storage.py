@@ -4,6 +4,42 @@ Módulo de Gerenciamento de Conversas
 Este módulo fornece funções para gerenciar o armazenamento persistente de conversas
 em formato JSON. Permite criar, ler, atualizar e excluir conversas e mensagens.
 
+A gravação dos arquivos de conversa é delegada a um motor plugável (ver
+utils/storage_engines.py), escolhido pela variável de ambiente CHAT_STORAGE_ENGINE:
+- "log" (padrão): log append-only em JSON Lines, uma escrita por mensagem
+- "json": formato original, documento JSON reescrito por inteiro
+- "sqlite": banco SQLite em data/chat.sqlite3 (ver migrate_storage.py para importar
+  as conversas existentes)
+
+O formato dos documentos gravados vem de CHAT_SERIALIZER (ver utils/serializers.py):
+"auto" (padrão, orjson se instalado), "json", "orjson" ou "msgpack".
+
+Mensagens maiores que CHAT_BLOB_THRESHOLD bytes (ex.: transcrições do YouTube) são
+gravadas em data/blobs/ (utils/blob_store.py): a conversa guarda só uma prévia e a
+referência, e o conteúdo completo é lido apenas por resolve_message/get_message_content.
+As mensagens que usam cada blob ficam registradas em data/blobs/refs.json
+(BlobReferences, montado percorrendo as conversas apenas se o arquivo não existir);
+um blob é removido quando a última mensagem que o usa é editada ou excluída.
+
+Cada mensagem gravada guarda em "token_count" a contagem de tokens do seu conteúdo
+completo (mesmo quando content guarda só a prévia de um blob), feita pelo
+tokenizador de CHAT_TOKENIZER (utils/tokenizers.py), para que a montagem do
+contexto da IA (utils/context_builder.py) não precise recontar a cada turno.
+
+As conversas carregadas ficam em um cache LRU (utils/conversation_cache.py) limitado
+por CHAT_CACHE_MAX_BYTES. As alterações são gravadas em background, agrupadas em
+janelas de CHAT_CACHE_FLUSH_DELAY segundos; flush_all() grava tudo o que estiver
+pendente e é chamada automaticamente no encerramento do processo.
+
+O histórico (barra lateral) é servido apenas pelo índice em memória. O índice é
+reconciliado com o diretório de conversas uma vez, na primeira consulta, e depois
+somente quando utils/directory_watcher.py detecta arquivos criados ou removidos
+por fora da aplicação; get_conversation_history_page pagina o histórico por cursor.
+
+Concorrência: toda alteração de uma conversa acontece sob o lock dessa conversa
+(_conversation_locks), compatível com greenthreads do Eventlet e com threads comuns.
+Arquivos inteiros são sempre gravados em um temporário e trocados com os.replace.
+
 Principais funcionalidades:
 - Criar novas conversas
 - Adicionar mensagens a conversas existentes
@@ -12,15 +48,280 @@ Principais funcionalidades:
 - Excluir conversas
 """
 
+import atexit
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
 
+from utils.blob_store import BlobReferences, BlobStore
+from utils.concurrency import KeyedLocks
+from utils.conversation_cache import ConversationCache, estimate_message_size
+from utils.conversation_index import decode_cursor, encode_cursor
+from utils.directory_watcher import DirectoryWatcher
+from utils.storage_engines import apply_update, create_engine, set_conversation_memory
+from utils.tokenizers import get_tokenizer as create_tokenizer
+
 # Definição de constantes para armazenamento de dados
 DATA_DIR = "data"
 CONVERSATIONS_DIR = os.path.join(DATA_DIR, "conversations")
 INDEX_FILE = os.path.join(DATA_DIR, "index.json")
+BLOBS_DIR = os.path.join(DATA_DIR, "blobs")
+STORAGE_ENGINE = os.environ.get("CHAT_STORAGE_ENGINE", "log")
+SERIALIZER = os.environ.get("CHAT_SERIALIZER", "auto")
+CACHE_MAX_BYTES = int(os.environ.get("CHAT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_FLUSH_DELAY = float(os.environ.get("CHAT_CACHE_FLUSH_DELAY", "0.2"))
+HISTORY_CHECK_INTERVAL = float(os.environ.get("CHAT_HISTORY_CHECK_INTERVAL", "2.0"))
+HISTORY_PAGE_SIZE = 50
+BLOB_THRESHOLD = int(os.environ.get("CHAT_BLOB_THRESHOLD", str(16 * 1024)))
+BLOB_COMPRESSION = os.environ.get("CHAT_BLOB_COMPRESSION", "auto")
+BLOB_PREVIEW_CHARS = 500
+TOKENIZER = os.environ.get("CHAT_TOKENIZER", "auto")
+
+# Instâncias do motor de armazenamento, do índice e do cache, criadas sob demanda
+_engine = None
+_index = None
+_cache = None
+_history_watcher = None
+_blob_store = None
+_blob_refs = None
+_blob_refs_lock = threading.Lock()
+_tokenizer = None
+
+# Locks por conversa, compartilhados com o cache
+_conversation_locks = KeyedLocks()
+
+def get_storage_engine():
+    """
+    Retorna o motor de armazenamento em uso, criando-o na primeira chamada.
+    
+    Returns:
+        StorageEngine: Motor configurado em STORAGE_ENGINE
+    """
+    global _engine
+    if _engine is None:
+        _engine = create_engine(STORAGE_ENGINE, CONVERSATIONS_DIR, SERIALIZER)
+    return _engine
+
+def set_storage_engine(engine):
+    """
+    Substitui o motor de armazenamento em uso (útil para migrações e benchmarks).
+    
+    Args:
+        engine (StorageEngine): Novo motor, ou None para recriar a partir da configuração
+    """
+    global _engine, _cache, _history_watcher, _blob_refs
+    if _cache is not None:
+        _cache.close()
+        _cache = None
+    _engine = engine
+    _history_watcher = None
+    _blob_refs = None
+
+def get_blob_store():
+    """
+    Retorna o armazenamento de blobs, criando-o na primeira chamada.
+    
+    Returns:
+        BlobStore: Blobs em BLOBS_DIR com a compressão de BLOB_COMPRESSION
+    """
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore(BLOBS_DIR, BLOB_COMPRESSION)
+    return _blob_store
+
+def get_blob_references():
+    """
+    Retorna o registro de referências aos blobs, carregando-o na primeira chamada.
+    Sem o arquivo de referências, ele é montado percorrendo todas as conversas, uma
+    de cada vez sob o lock da conversa; por isso deve ser chamada antes de obter o
+    lock de qualquer conversa.
+    
+    Returns:
+        BlobReferences: Referências gravadas em BLOBS_DIR/refs.json
+    """
+    global _blob_refs
+    if _blob_refs is None:
+        with _blob_refs_lock:
+            if _blob_refs is None:
+                os.makedirs(BLOBS_DIR, exist_ok=True)
+                refs = BlobReferences(os.path.join(BLOBS_DIR, "refs.json"))
+                if not refs.load():
+                    refs.rebuild(_scan_blob_references())
+                _blob_refs = refs
+    return _blob_refs
+
+def _message_blobs(conversation):
+    """Blobs usados pelas mensagens de uma conversa: {message_id: sha256}."""
+    return {
+        message.get("message_id"): message["blob"]["sha256"]
+        for message in conversation.get("messages", [])
+        if message.get("blob")
+    }
+
+def _scan_blob_references():
+    """Lê as referências a blobs de todas as conversas armazenadas."""
+    engine = get_storage_engine()
+    cache = get_conversation_cache()
+    conversations = {}
+    for conversation_id in engine.list_ids():
+        with _conversation_locks.lock(conversation_id):
+            conversation = cache.get(conversation_id)
+            try:
+                if conversation is None:
+                    conversation = engine.load(conversation_id)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                print(f"[ERRO-PYTHON] Falha ao ler blobs da conversa {conversation_id}: {str(e)}")
+                continue
+            conversations[conversation_id] = _message_blobs(conversation)
+    return conversations
+
+def _store_content(content, conversation_id, message_id):
+    """
+    Decide como o conteúdo de uma mensagem será guardado e registra o blob usado por ela
+    (antes de gravá-lo, para que uma remoção concorrente o mantenha).
+    
+    Returns:
+        tuple: (conteúdo ou prévia, referência ao blob ou None, digests que ficaram
+               sem referências e devem ir para _collect_blobs após a gravação)
+    """
+    refs = get_blob_references()
+    if BLOB_THRESHOLD <= 0 or len(content.encode('utf-8')) <= BLOB_THRESHOLD:
+        return content, None, refs.assign(conversation_id, message_id, None)
+    store = get_blob_store()
+    blob = store.reference(content)
+    orphaned = refs.assign(conversation_id, message_id, blob["sha256"])
+    store.put(content)
+    return content[:BLOB_PREVIEW_CHARS], blob, orphaned
+
+def _collect_blobs(digests):
+    """Remove os blobs que continuam sem referências; falhas apenas são registradas."""
+    if not digests:
+        return
+    try:
+        get_blob_references().collect(get_blob_store(), digests)
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Falha ao remover blobs sem referências: {str(e)}")
+
+def get_tokenizer():
+    """
+    Retorna o tokenizador usado nas contagens guardadas nas mensagens.
+    
+    Returns:
+        Tokenizer: Tokenizador de TOKENIZER (ver utils/tokenizers.py)
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = create_tokenizer(TOKENIZER)
+    return _tokenizer
+
+def _token_count(content):
+    """Contagem de tokens a guardar na mensagem: {nome do tokenizador: tokens}."""
+    tokenizer = get_tokenizer()
+    return {tokenizer.name: tokenizer.count(content)}
+
+def resolve_message(message):
+    """
+    Retorna a mensagem com o conteúdo completo, lendo o blob se necessário.
+    A mensagem original (possivelmente em cache) não é alterada.
+    
+    Args:
+        message (dict): Mensagem como armazenada na conversa
+        
+    Returns:
+        dict: A própria mensagem, ou uma cópia com content completo
+    """
+    blob = message.get("blob")
+    if not blob:
+        return message
+    try:
+        content = get_blob_store().get(blob["sha256"])
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Falha ao ler conteúdo da mensagem {message.get('message_id')}: {str(e)}")
+        return message
+    resolved = dict(message, content=content)
+    del resolved["blob"]
+    # Mensagens antigas guardam a contagem de tokens da prévia: descartada para ser refeita
+    if resolved.get("token_count") == _token_count(message.get("content", "")):
+        del resolved["token_count"]
+    return resolved
+
+def get_message_content(conversation_id, message_id):
+    """
+    Recupera o conteúdo completo de uma mensagem.
+    
+    Args:
+        conversation_id (str): ID da conversa
+        message_id (str): ID da mensagem
+        
+    Returns:
+        str: Conteúdo completo ou None se a mensagem não for encontrada
+    """
+    try:
+        for _, message in iter_messages(conversation_id):
+            if message.get("message_id") == message_id:
+                return resolve_message(message)["content"]
+    except FileNotFoundError:
+        pass
+    return None
+
+def get_conversation_cache():
+    """
+    Retorna o cache de conversas, criando-o na primeira chamada.
+    
+    Returns:
+        ConversationCache: Cache LRU com escrita adiada sobre o motor em uso
+    """
+    global _cache
+    if _cache is None:
+        _cache = ConversationCache(
+            get_storage_engine(), CACHE_MAX_BYTES, CACHE_FLUSH_DELAY, locks=_conversation_locks
+        )
+    return _cache
+
+def flush_all():
+    """
+    Grava em disco todas as alterações pendentes no cache de conversas e no índice.
+    Deve ser chamada no encerramento da aplicação.
+    
+    Returns:
+        bool: True se a operação foi bem-sucedida, False caso contrário
+    """
+    ok = True
+    if _cache is not None:
+        ok = _cache.flush_all() and ok
+    if _index is not None:
+        ok = _index.checkpoint() and ok
+    return ok
+
+atexit.register(flush_all)
+
+def get_conversation_index():
+    """
+    Retorna o índice de conversas em memória, carregando-o do disco na primeira chamada.
+    
+    Returns:
+        ConversationIndex: Índice carregado de INDEX_FILE e de seu journal
+    """
+    global _index
+    if _index is None:
+        ensure_directories()
+        _index = get_storage_engine().create_index(INDEX_FILE)
+    return _index
+
+def set_conversation_index(index):
+    """
+    Substitui o índice de conversas em uso (útil para migrações e benchmarks).
+    
+    Args:
+        index (ConversationIndex): Novo índice, ou None para recarregar de INDEX_FILE
+    """
+    global _index, _history_watcher
+    _index = index
+    _history_watcher = None
 
 def ensure_directories():
     """
@@ -56,7 +357,8 @@ def create_new_conversation():
 
 def save_conversation(conversation):
     """
-    Salva uma conversa em seu arquivo JSON correspondente.
+    Salva uma conversa completa, substituindo a versão anterior.
+    A gravação em disco é feita pelo cache em background.
     
     Args:
         conversation (dict): Objeto de conversa com campos id, title, timestamp e messages
@@ -65,12 +367,14 @@ def save_conversation(conversation):
         bool: True se a operação foi bem-sucedida, False caso contrário
     """
     # print(f"[DEBUG-PYTHON] save_conversation em utils/chat_storage.py chamada para conversa ID: {conversation['id']}")
-    filename = f"conversation_{conversation['id']}.json"
-    filepath = os.path.join(CONVERSATIONS_DIR, filename)
-    
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(conversation, f, ensure_ascii=False, indent=2)
+        cache = get_conversation_cache()
+        with _conversation_locks.lock(conversation["id"]):
+            # A regravação completa torna obsoletas as alterações pendentes da versão anterior
+            cache.discard(conversation["id"])
+            conversation = cache.put(conversation)
+            cache.record(conversation, ("save",))
+        cache.sync(conversation["id"])
         # print(f"[DEBUG-PYTHON] Conversa {conversation['id']} salva com sucesso")
         return True
     except Exception as e:
@@ -79,9 +383,11 @@ def save_conversation(conversation):
 
 def update_index(conversation):
     """
-    Atualiza o arquivo de índice com os metadados da conversa.
+    Atualiza o índice com os metadados da conversa.
     O índice contém informações resumidas de todas as conversas para
     carregar rapidamente a lista de conversas sem precisar abrir cada arquivo.
+    A alteração é feita em memória e registrada no journal do índice; o arquivo
+    index.json completo é reescrito apenas nos checkpoints.
     
     Args:
         conversation (dict): Objeto de conversa a ser indexado
@@ -90,30 +396,16 @@ def update_index(conversation):
         bool: True se a operação foi bem-sucedida, False caso contrário
     """
     # print(f"[DEBUG-PYTHON] update_index em utils/chat_storage.py chamada para conversa ID: {conversation['id']}")
-    ensure_directories()
-    
-    try:
-        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # print("[DEBUG-PYTHON] Arquivo de índice não encontrado ou inválido, criando novo")
-        index = []
-    
     entry = {
         "id": conversation["id"],
         "title": conversation.get("title", "Nova conversa"),
         "timestamp": conversation["timestamp"],
-        "filename": f"conversation_{conversation['id']}.json"
+        "filename": get_storage_engine().filename(conversation["id"])
     }
     
-    # Remover entrada antiga se existir
-    index = [item for item in index if item["id"] != conversation["id"]]
-    index.append(entry)
-    index.sort(key=lambda x: x["timestamp"], reverse=True)
-    
     try:
-        with open(INDEX_FILE, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
+        # Substitui a entrada antiga, se existir, mantendo a ordenação por timestamp
+        get_conversation_index().put(entry)
         # print(f"[DEBUG-PYTHON] Índice atualizado com sucesso para conversa {conversation['id']}")
         return True
     except Exception as e:
@@ -123,6 +415,7 @@ def update_index(conversation):
 def get_conversation_by_id(conversation_id):
     """
     Recupera uma conversa específica pelo ID.
+    O objeto retornado é a instância mantida em cache e não deve ser alterado diretamente.
     
     Args:
         conversation_id (str): ID da conversa a ser recuperada
@@ -131,14 +424,13 @@ def get_conversation_by_id(conversation_id):
         dict: Objeto de conversa completo ou None se não encontrada
     """
     # print(f"[DEBUG-PYTHON] get_conversation_by_id em utils/chat_storage.py chamada para ID: {conversation_id}")
-    filename = f"conversation_{conversation_id}.json"
-    filepath = os.path.join(CONVERSATIONS_DIR, filename)
-    
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            conversa = json.load(f)
-            # print(f"[DEBUG-PYTHON] Conversa {conversation_id} carregada com sucesso")
-            return conversa
+        cache = get_conversation_cache()
+        conversa = cache.get(conversation_id)
+        if conversa is None:
+            conversa = cache.put(get_storage_engine().load(conversation_id))
+        # print(f"[DEBUG-PYTHON] Conversa {conversation_id} carregada com sucesso")
+        return conversa
     except FileNotFoundError:
         # print(f"[DEBUG-PYTHON] Conversa {conversation_id} não encontrada")
         return None
@@ -149,40 +441,220 @@ def get_conversation_by_id(conversation_id):
         print(f"[ERRO-PYTHON] Erro ao carregar conversa: {str(e)}")
         return None
 
-def get_conversation_history():
+def get_conversation_messages(conversation_id, offset, limit):
     """
-    Recupera o histórico de todas as conversas a partir do arquivo de índice.
-    Verifica se os arquivos correspondentes ainda existem.
+    Recupera uma faixa de mensagens de uma conversa, para carregamento em lotes.
     
+    Args:
+        conversation_id (str): ID da conversa
+        offset (int): Índice da primeira mensagem
+        limit (int): Número máximo de mensagens
+        
     Returns:
-        list: Lista de metadados de todas as conversas válidas
+        dict: {'messages': lote, 'total': total de mensagens} ou None se não encontrada
     """
-    # print("[DEBUG-PYTHON] get_conversation_history em utils/chat_storage.py chamada")
-    ensure_directories()
+    try:
+        conversation = get_conversation_cache().get(conversation_id)
+        if conversation is not None:
+            messages = conversation["messages"]
+            return {"messages": messages[offset:offset + limit], "total": len(messages)}
+        messages, total = get_storage_engine().load_messages(conversation_id, offset, limit)
+        return {"messages": messages, "total": total}
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Erro ao carregar lote de mensagens: {str(e)}")
+        return None
+
+def iter_messages(conversation_id, after=None, limit=None):
+    """
+    Percorre as mensagens de uma conversa em ordem, sem carregá-la inteira quando
+    ela não está em cache.
     
+    Args:
+        conversation_id (str): ID da conversa
+        after (int, optional): Posição (seq) da última mensagem já lida
+        limit (int, optional): Número máximo de mensagens
+        
+    Yields:
+        tuple: (seq, mensagem)
+    """
+    conversation = get_conversation_cache().get(conversation_id)
+    if conversation is None:
+        yield from get_storage_engine().iter_messages(conversation_id, after=after, limit=limit)
+        return
+    start = 0 if after is None else after + 1
+    end = None if limit is None else start + limit
+    for seq, message in enumerate(conversation["messages"][start:end], start=start):
+        yield seq, message
+
+def _parse_message_cursor(cursor):
+    """Converte um cursor de mensagem (seq em texto) em inteiro, lançando ValueError se inválido."""
     try:
-        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-            index = json.load(f)
-            
-        # Verificar se todos os arquivos ainda existem
-        valid_entries = []
-        for entry in index:
-            filepath = os.path.join(CONVERSATIONS_DIR, entry.get("filename", ""))
-            if os.path.exists(filepath):
-                valid_entries.append(entry)
-            else:
-                # print(f"[DEBUG-PYTHON] Arquivo não encontrado para conversa {entry.get('id')}: {filepath}")
-                pass
+        seq = int(cursor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+    if seq < 0:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return seq
+
+def get_message_page(conversation_id, after=None, before=None, limit=50):
+    """
+    Recupera uma página de mensagens navegando por cursores em vez de offsets.
+    Sem cursor, retorna as primeiras mensagens da conversa.
+    
+    Args:
+        conversation_id (str): ID da conversa
+        after (str, optional): next_cursor da página anterior; retorna as mensagens seguintes
+        before (str, optional): prev_cursor de uma página; retorna as mensagens anteriores
+        limit (int): Número máximo de mensagens
         
-        # print(f"[DEBUG-PYTHON] Histórico de conversas carregado: {len(valid_entries)} conversas válidas")
-        return valid_entries
-    except (FileNotFoundError, json.JSONDecodeError):
-        # print("[DEBUG-PYTHON] Arquivo de índice não encontrado ou inválido")
-        return []
+    Returns:
+        dict: {'messages', 'total', 'next_cursor', 'prev_cursor'} ou None se não encontrada;
+              os cursores são None quando não há mais mensagens naquela direção
+        
+    Raises:
+        ValueError: Se algum cursor for inválido
+    """
+    limit = max(1, limit)
+    if before is not None:
+        end = _parse_message_cursor(before)
+        offset = max(0, end - limit)
+        limit = end - offset
+    else:
+        offset = 0 if after is None else _parse_message_cursor(after) + 1
+    
+    page = get_conversation_messages(conversation_id, offset, limit)
+    if page is None:
+        return None
+    
+    total = page["total"]
+    offset = min(offset, total)
+    end = offset + len(page["messages"])
+    return {
+        "messages": page["messages"],
+        "total": total,
+        "next_cursor": str(end - 1) if offset < end < total else None,
+        "prev_cursor": str(offset) if offset > 0 else None
+    }
+
+def reconcile_conversation_index():
+    """
+    Sincroniza o índice com as conversas efetivamente armazenadas, com uma única
+    listagem do diretório: remove entradas cujos arquivos sumiram e indexa arquivos
+    que não constam no índice (ex.: restaurados de backup).
+    
+    Returns:
+        tuple: (entradas removidas, entradas adicionadas)
+    """
+    engine = get_storage_engine()
+    index = get_conversation_index()
+    cache = get_conversation_cache()
+    stored = engine.list_ids()
+    indexed = {entry["id"] for entry in index.entries()}
+    
+    removed = 0
+    for conversation_id in indexed - stored:
+        # Conversas novas podem estar apenas no cache, aguardando a gravação
+        if conversation_id not in cache and index.remove(conversation_id):
+            removed += 1
+    
+    added = 0
+    for conversation_id in stored - indexed:
+        try:
+            meta = engine.load_meta(conversation_id)
+        except Exception as e:
+            print(f"[ERRO-PYTHON] Falha ao indexar conversa {conversation_id}: {str(e)}")
+            continue
+        if meta and update_index(dict(meta, id=conversation_id)):
+            added += 1
+    
+    return removed, added
+
+def _is_external_change(name, created):
+    """
+    Indica se um arquivo criado ou removido no diretório de conversas exige reconciliar
+    o índice. Ignora temporários de atomic_write, índices .idx e as gravações da própria
+    aplicação: conversas criadas já constam no índice e as excluídas já saíram dele.
+    
+    Args:
+        name (str): Nome do arquivo
+        created (bool): True se o arquivo foi criado (ou renomeado para esse nome)
+    """
+    engine = get_storage_engine()
+    match = engine.FILE_PATTERN.match(name)
+    if match is None:
+        return False
+    conversation_id = match.group(1)
+    indexed = conversation_id in get_conversation_index()
+    if created:
+        return not indexed
+    # Conversões de formato removem o arquivo antigo mantendo a conversa
+    return indexed and not engine.exists(conversation_id)
+
+def _validated_index():
+    """
+    Retorna o índice de conversas, reconciliando-o na primeira chamada e sempre que
+    o diretório de conversas for alterado por fora da aplicação.
+    """
+    global _history_watcher
+    index = get_conversation_index()
+    if _history_watcher is None:
+        # O observador é criado antes da reconciliação para não perder alterações feitas durante ela
+        _history_watcher = DirectoryWatcher(CONVERSATIONS_DIR, HISTORY_CHECK_INTERVAL,
+                                            is_relevant=_is_external_change)
+        reconcile_conversation_index()
+    elif _history_watcher.changed():
+        reconcile_conversation_index()
+    return index
+
+def get_conversation_history():
+    """
+    Recupera o histórico de todas as conversas a partir do índice em memória.
+    
+    Returns:
+        list: Lista de metadados de todas as conversas, da mais recente para a mais antiga
+    """
+    # print("[DEBUG-PYTHON] get_conversation_history em utils/chat_storage.py chamada")
+    try:
+        return _validated_index().entries()
     except Exception as e:
         print(f"[ERRO-PYTHON] Erro ao carregar histórico: {str(e)}")
         return []
 
+def get_conversation_history_page(limit=HISTORY_PAGE_SIZE, cursor=None):
+    """
+    Recupera uma página do histórico de conversas, da mais recente para a mais antiga.
+    
+    Args:
+        limit (int): Número máximo de conversas na página
+        cursor (str, optional): Valor de next_cursor retornado pela página anterior
+        
+    Returns:
+        dict: {'conversations': lista de metadados, 'next_cursor': cursor da próxima página ou None}
+        
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    after = decode_cursor(cursor) if cursor else None
+    entries, last_key = _validated_index().page(max(1, limit), after)
+    return {
+        "conversations": entries,
+        "next_cursor": encode_cursor(last_key) if last_key else None
+    }
+
+def conversation_exists(conversation_id):
+    """
+    Verifica se uma conversa existe, considerando também as ainda não gravadas em disco.
+    
+    Args:
+        conversation_id (str): ID da conversa
+        
+    Returns:
+        bool: True se a conversa existe
+    """
+    return conversation_id in get_conversation_cache() or get_storage_engine().exists(conversation_id)
+
 def add_message_to_conversation(conversation_id, content, role, message_id=None):
     """
     Adiciona uma mensagem a uma conversa existente.
@@ -198,39 +670,63 @@ def add_message_to_conversation(conversation_id, content, role, message_id=None)
         str: ID único da mensagem adicionada
     """
     # print(f"[DEBUG-PYTHON] add_message_to_conversation em utils/chat_storage.py chamada para conversa {conversation_id}, role: {role}")
-    
-    conversation = get_conversation_by_id(conversation_id)
-    
-    if not conversation:
-        # print(f"[DEBUG-PYTHON] Criando nova conversa para ID: {conversation_id}")
-        conversation = {
-            "id": conversation_id,
-            "title": "Nova conversa",
-            "timestamp": datetime.now().isoformat(),
-            "messages": []
-        }
+    ensure_directories()
+    cache = get_conversation_cache()
     
     # Usar o message_id fornecido ou gerar um novo
     if message_id is None:
         message_id = str(uuid.uuid4())  # Gera um ID único no formato de string
     
-    message = {
-        "message_id": message_id,
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    conversation["messages"].append(message)
-    conversation["timestamp"] = datetime.now().isoformat()
-    
-    # Definir título automaticamente com base na primeira mensagem do usuário
-    if role == "user" and len([m for m in conversation["messages"] if m["role"] == "user"]) == 1:
-        conversation["title"] = content[:30] + "..." if len(content) > 30 else content
-        # print(f"[DEBUG-PYTHON] Título da conversa atualizado para: {conversation['title']}")
+    # Carregado antes do lock da conversa (ver get_blob_references)
+    get_blob_references()
+    with _conversation_locks.lock(conversation_id):
+        conversation = get_conversation_by_id(conversation_id)
+        is_new = not conversation
+        
+        if is_new:
+            # print(f"[DEBUG-PYTHON] Criando nova conversa para ID: {conversation_id}")
+            cache.discard(conversation_id)
+            conversation = cache.put({
+                "id": conversation_id,
+                "title": "Nova conversa",
+                "timestamp": datetime.now().isoformat(),
+                "messages": []
+            })
+        
+        message = {
+            "message_id": message_id,
+            "role": role,
+            "content": content,
+            "timestamp": datetime.now().isoformat()
+        }
+        # Conteúdos grandes vão para o armazenamento de blobs; a conversa guarda a prévia
+        message["content"], blob, _ = _store_content(content, conversation_id, message_id)
+        if blob:
+            message["blob"] = blob
+        # A contagem considera o texto completo, que é o enviado ao modelo (ver resolve_message)
+        message["token_count"] = _token_count(content)
+        
+        # Definir título automaticamente com base na primeira mensagem do usuário
+        new_title = None
+        if role == "user" and not any(m["role"] == "user" for m in conversation["messages"]):
+            new_title = content[:30] + "..." if len(content) > 30 else content
+            conversation["title"] = new_title
+            # print(f"[DEBUG-PYTHON] Título da conversa atualizado para: {new_title}")
+        
+        conversation["messages"].append(message)
+        conversation["timestamp"] = message["timestamp"]
+        
+        try:
+            # Conversas novas são gravadas por inteiro; as demais recebem apenas a mensagem
+            op = ("save",) if is_new else ("append", message, new_title)
+            cache.record(conversation, op, size_delta=estimate_message_size(message))
+        except Exception as e:
+            print(f"[ERRO-PYTHON] Falha ao salvar mensagem: {str(e)}")
+        
+        update_index(conversation)
     
-    save_conversation(conversation)
-    update_index(conversation)
+    # Adições concorrentes à mesma conversa são gravadas juntas (group commit)
+    cache.sync(conversation_id)
     # print(f"[DEBUG-PYTHON] Mensagem {message_id} adicionada com sucesso à conversa {conversation_id}")
     
     return message_id  # Retorna o ID da mensagem para uso posterior
@@ -248,24 +744,43 @@ def update_message_in_conversation(conversation_id, message_id, new_content):
         bool: True se a mensagem foi atualizada com sucesso, False caso contrário
     """
     # print(f"[DEBUG-PYTHON] update_message_in_conversation chamada para mensagem {message_id} na conversa {conversation_id}")
+    cache = get_conversation_cache()
+    updated_at = datetime.now().isoformat()
     
-    conversation = get_conversation_by_id(conversation_id)
-    
-    if not conversation:
+    if not conversation_exists(conversation_id):
         print(f"[ERRO-PYTHON] Conversa não encontrada: {conversation_id}")
         return False
     
-    # Procura a mensagem pelo ID
-    for message in conversation["messages"]:
-        if message.get("message_id") == message_id:
-            # Atualiza o conteúdo da mensagem
-            message["content"] = new_content
-            message["updated_at"] = datetime.now().isoformat()
-            
-            # Salva a conversa atualizada
-            save_conversation(conversation)
+    try:
+        updated = False
+        stored_content, blob, orphaned = _store_content(new_content, conversation_id, message_id)
+        token_count = _token_count(new_content)
+        with _conversation_locks.lock(conversation_id):
+            conversation = cache.get(conversation_id)
+            if conversation is None:
+                # Fora do cache: o motor atualiza a mensagem sem carregar a conversa inteira
+                updated = get_storage_engine().update_message(
+                    conversation_id, message_id, stored_content, updated_at, blob, token_count
+                )
+            else:
+                # Procura a mensagem pelo ID
+                for message in conversation["messages"]:
+                    if message.get("message_id") == message_id:
+                        size_delta = len(stored_content) - len(message.get("content", ""))
+                        apply_update(message, stored_content, updated_at, blob, token_count)
+                        op = ("update", message_id, stored_content, updated_at, blob, token_count)
+                        cache.record(conversation, op, size_delta=size_delta)
+                        updated = True
+                        break
+        if updated:
+            cache.sync(conversation_id)
+            # O blob anterior só é removido depois que a mensagem deixou de apontar para ele
+            _collect_blobs(orphaned)
             # print(f"[DEBUG-PYTHON] Mensagem {message_id} atualizada com sucesso")
             return True
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Falha ao atualizar mensagem: {str(e)}")
+        return False
     
     print(f"[ERRO-PYTHON] Mensagem {message_id} não encontrada na conversa {conversation_id}")
     return False
@@ -280,32 +795,25 @@ def delete_conversation(conversation_id):
     Returns:
         bool: True se a conversa foi excluída com sucesso, False caso contrário
     """
-    filename = f"conversation_{conversation_id}.json"
-    filepath = os.path.join(CONVERSATIONS_DIR, filename)
-    
     try:
-        # Remove o arquivo da conversa se existir
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        cache = get_conversation_cache()
+        refs = get_blob_references()
+        with cache.exclusive(conversation_id):
+            # Descarta a conversa do cache, incluindo alterações ainda não gravadas
+            cache.discard(conversation_id)
             
-        # Remove a entrada do índice
-        try:
-            with open(INDEX_FILE, 'r', encoding='utf-8') as f:
-                index = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            index = []
+            # Remove o arquivo da conversa se existir
+            get_storage_engine().delete(conversation_id)
             
-        # Filtra a conversa do índice
-        index = [item for item in index if item["id"] != conversation_id]
-        
-        # Salva o índice atualizado
-        with open(INDEX_FILE, 'w', encoding='utf-8') as f:
-            json.dump(index, f, ensure_ascii=False, indent=2)
-        
-        return True
+        # Remove a entrada do índice
+        get_conversation_index().remove(conversation_id)
     except Exception as e:
         print(f"[ERRO] Falha ao excluir conversa: {str(e)}")
         return False
+    
+    # Blobs usados apenas por esta conversa
+    _collect_blobs(refs.release_conversation(conversation_id))
+    return True
 
 def rename_conversation(conversation_id, new_title):
     """
@@ -318,8 +826,7 @@ def rename_conversation(conversation_id, new_title):
     Returns:
         bool: True se a conversa foi renomeada com sucesso, False caso contrário
     """
-    conversation = get_conversation_by_id(conversation_id)
-    if not conversation:
+    if not conversation_exists(conversation_id):
         print(f"[ERRO] Conversa {conversation_id} não existe")
         return False
         
@@ -329,17 +836,26 @@ def rename_conversation(conversation_id, new_title):
         if not new_title or len(new_title) > 100:
             print("[ERRO] Título inválido ou muito longo")
             return False
-            
-        conversation["title"] = new_title
-        conversation["timestamp"] = datetime.now().isoformat() # Atualiza timestamp
         
-        # Salva as alterações
-        save_success = save_conversation(conversation)
-        if not save_success:
-            print("[ERRO] Falha ao salvar conversa")
-            return False
+        timestamp = datetime.now().isoformat() # Atualiza timestamp
+        cache = get_conversation_cache()
+        
+        with _conversation_locks.lock(conversation_id):
+            conversation = cache.get(conversation_id)
+            
+            # Salva as alterações
+            if conversation is not None:
+                conversation["title"] = new_title
+                conversation["timestamp"] = timestamp
+                cache.record(conversation, ("meta", new_title, timestamp))
+            else:
+                conversation = {"id": conversation_id, "title": new_title, "timestamp": timestamp}
+                if not get_storage_engine().set_meta(conversation_id, new_title, timestamp):
+                    print("[ERRO] Falha ao salvar conversa")
+                    return False
             
-        index_success = update_index(conversation)
+            index_success = update_index(conversation)
+        cache.sync(conversation_id)
         if not index_success:
             print("[ERRO] Falha ao atualizar índice")
             return False
@@ -348,3 +864,68 @@ def rename_conversation(conversation_id, new_title):
     except Exception as e:
         print(f"[ERRO] Falha ao renomear conversa: {str(e)}")
         return False
+
+def get_conversation_memory(conversation_id):
+    """
+    Recupera o resumo acumulado das mensagens antigas da conversa.
+    
+    Args:
+        conversation_id (str): ID da conversa
+        
+    Returns:
+        dict: {'summary', 'covered', 'updated_at'} ou None se não houver resumo
+    """
+    conversation = get_conversation_by_id(conversation_id)
+    return conversation.get("memory") if conversation else None
+
+def update_conversation_memory(conversation_id, memory):
+    """
+    Substitui o resumo acumulado da conversa (ver utils/conversation_memory.py).
+    
+    Args:
+        conversation_id (str): ID da conversa
+        memory (dict): {'summary', 'covered', 'updated_at'}, ou None para remover
+        
+    Returns:
+        bool: True se o resumo foi gravado, False caso contrário
+    """
+    cache = get_conversation_cache()
+    try:
+        with _conversation_locks.lock(conversation_id):
+            conversation = cache.get(conversation_id)
+            if conversation is not None:
+                previous = conversation.get("memory") or {}
+                size_delta = len((memory or {}).get("summary", "")) - len(previous.get("summary", ""))
+                set_conversation_memory(conversation, memory)
+                cache.record(conversation, ("memory", memory), size_delta=size_delta)
+            elif not get_storage_engine().set_memory(conversation_id, memory):
+                print(f"[ERRO-PYTHON] Conversa não encontrada: {conversation_id}")
+                return False
+        cache.sync(conversation_id)
+        return True
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Falha ao salvar resumo da conversa: {str(e)}")
+        return False
+
+def compact_conversation(conversation_id):
+    """
+    Compacta o armazenamento de uma conversa, dobrando edições acumuladas.
+    Sem efeito para motores que já reescrevem o arquivo inteiro.
+    
+    Args:
+        conversation_id (str): ID da conversa a ser compactada
+        
+    Returns:
+        bool: True se a operação foi bem-sucedida, False caso contrário
+    """
+    engine = get_storage_engine()
+    if not hasattr(engine, "compact") or not conversation_exists(conversation_id):
+        return False
+    try:
+        cache = get_conversation_cache()
+        cache.flush(conversation_id)
+        with cache.exclusive(conversation_id):
+            return engine.compact(conversation_id)
+    except Exception as e:
+        print(f"[ERRO-PYTHON] Falha ao compactar conversa: {str(e)}")
+        return False
@@ -0,0 +1,47 @@
+"""
+Locks por Chave
+
+Este módulo fornece KeyedLocks, um conjunto de locks reentrantes criados sob demanda
+para cada chave (por exemplo, o ID de uma conversa). Operações sobre conversas
+diferentes não competem entre si; operações sobre a mesma conversa são serializadas.
+
+Os locks são criados pelo módulo threading no momento do uso. Com o monkey patching
+do Eventlet (init_eventlet.py) eles passam a ser locks de greenthreads; sem ele são
+locks comuns de threads, então o mesmo código vale para os dois modelos.
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+class KeyedLocks:
+    """
+    Locks reentrantes por chave, descartados quando ninguém mais os utiliza.
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        # chave -> [lock, número de usuários]
+        self._locks = {}
+
+    @contextmanager
+    def lock(self, key):
+        """
+        Context manager que mantém o lock da chave durante o bloco.
+
+        Args:
+            key: Chave a ser protegida (ex.: ID da conversa)
+        """
+        with self._guard:
+            slot = self._locks.get(key)
+            if slot is None:
+                slot = self._locks[key] = [threading.RLock(), 0]
+            slot[1] += 1
+        try:
+            with slot[0]:
+                yield
+        finally:
+            with self._guard:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    del self._locks[key]
@@ -0,0 +1,92 @@
+"""
+Montagem do Contexto Enviado à IA
+
+Este módulo escolhe quais mensagens do histórico acompanham cada pedido ao modelo.
+Em vez de um número fixo de mensagens, o histórico é preenchido das mensagens mais
+novas para as mais antigas até esgotar um orçamento de tokens:
+- uma mensagem maior que max_message_tokens (ex.: uma transcrição colada) entra
+  truncada, com um marcador, em vez de ocupar o contexto inteiro;
+- a mensagem mais antiga que não couber por inteiro entra truncada se ainda sobrar
+  espaço razoável (min_fill_tokens); depois dela, o histórico para.
+
+A contagem de tokens de cada mensagem é guardada na própria mensagem, no campo
+"token_count" ({nome do tokenizador: tokens do conteúdo completo}), ao ser gravada
+pelo chat_storage; mensagens antigas, sem o campo, são contadas na hora. Mensagens
+com o conteúdo em blob devem chegar já resolvidas (chat_storage.resolve_message).
+"""
+
+# Marcador acrescentado ao conteúdo truncado
+TRUNCATION_MARKER = "\n\n[...conteúdo truncado...]"
+
+
+def message_tokens(message, tokenizer):
+    """
+    Retorna os tokens do conteúdo de uma mensagem, usando a contagem guardada quando
+    ela foi feita pelo mesmo tokenizador.
+
+    Args:
+        message (dict): Mensagem como armazenada na conversa
+        tokenizer: Tokenizador (ver utils/tokenizers.py)
+
+    Returns:
+        int: Número de tokens de message['content']
+    """
+    cached = message.get("token_count")
+    if isinstance(cached, dict) and tokenizer.name in cached:
+        return cached[tokenizer.name]
+    return tokenizer.count(message.get("content", ""))
+
+
+class ContextBuilder:
+    """
+    Seleciona o histórico que cabe em um orçamento de tokens.
+    """
+
+    def __init__(self, tokenizer, budget, max_message_tokens=None, min_fill_tokens=64):
+        """
+        Args:
+            tokenizer: Tokenizador (ver utils/tokenizers.py)
+            budget (int): Tokens disponíveis para o histórico
+            max_message_tokens (int, optional): Limite por mensagem; padrão: metade do orçamento
+            min_fill_tokens (int): Espaço mínimo para incluir truncada a mensagem que não cabe
+        """
+        self.tokenizer = tokenizer
+        self.budget = budget
+        self.max_message_tokens = max_message_tokens if max_message_tokens is not None else budget // 2
+        self.min_fill_tokens = min_fill_tokens
+
+    def _truncate(self, content, max_tokens):
+        marker_tokens = self.tokenizer.count(TRUNCATION_MARKER)
+        return self.tokenizer.truncate(content, max(0, max_tokens - marker_tokens)) + TRUNCATION_MARKER
+
+    def build(self, messages, reserved_tokens=0):
+        """
+        Monta o histórico a enviar.
+
+        Args:
+            messages (list): Mensagens da conversa, da mais antiga para a mais nova
+            reserved_tokens (int): Tokens do orçamento já ocupados (ex.: prompt de sistema)
+
+        Returns:
+            tuple: (mensagens no formato da API {'role', 'content'} da mais antiga para
+                    a mais nova, total de tokens usados)
+        """
+        remaining = self.budget - reserved_tokens
+        selected = []
+        for message in reversed(messages):
+            if remaining <= 0:
+                break
+            if message.get("role") not in ("user", "assistant"):
+                continue
+            content = message.get("content", "")
+            tokens = message_tokens(message, self.tokenizer)
+            limit = min(self.max_message_tokens, remaining)
+            if tokens > limit:
+                if limit < self.min_fill_tokens and selected:
+                    break
+                content = self._truncate(content, limit)
+                tokens = self.tokenizer.count(content)
+            selected.append({"role": message["role"], "content": content})
+            remaining -= tokens
+        selected.reverse()
+        return selected, self.budget - reserved_tokens - remaining
@@ -0,0 +1,276 @@
+"""
+Cache de Conversas com Escrita Adiada (write-behind)
+
+Este módulo mantém em memória as conversas já carregadas, em um cache LRU limitado
+por tamanho aproximado em bytes. As alterações feitas pelo chat_storage são aplicadas
+diretamente no objeto em cache e registradas como operações pendentes; uma thread de
+escrita em background agrupa as operações de cada conversa e as grava com uma única
+chamada a StorageEngine.commit (uma escrita sincronizada em disco por conversa).
+
+Várias mensagens adicionadas dentro da janela de agrupamento (flush_delay) viram,
+portanto, uma única escrita. flush_all() grava tudo o que estiver pendente e deve
+ser chamado no encerramento da aplicação.
+
+Concorrência: cada conversa tem dois locks (KeyedLocks):
+- o lock de estado, mantido pelo chat_storage enquanto altera o objeto em cache e
+  pelo cache apenas enquanto retira as operações pendentes e copia a lista de mensagens
+- o lock de commit, que ordena as gravações da conversa em disco
+A ordem é sempre commit → estado. Uma conversa fora do cache é gravada por record()
+com o lock de estado já obtido, então essa gravação nunca usa o lock de commit: ela
+apenas aguarda (em _committing) um commit da mesma conversa que já tenha saído do
+lock de estado, e nenhum commit novo começa enquanto o lock de estado está ocupado.
+O lock global do cache protege apenas a estrutura LRU e nunca é mantido durante a
+escrita em disco. Quem chega enquanto outra gravação da mesma conversa está em
+andamento deixa suas operações na fila e elas seguem juntas no próximo commit
+(group commit), em vez de uma escrita por chamada.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+from utils.concurrency import KeyedLocks
+
+# Tamanho fixo estimado por mensagem além do conteúdo (chaves, ids e timestamps)
+MESSAGE_OVERHEAD_BYTES = 160
+
+
+def estimate_message_size(message):
+    """Estima o tamanho em memória de uma mensagem."""
+    return len(message.get("content", "")) + MESSAGE_OVERHEAD_BYTES
+
+
+def estimate_conversation_size(conversation):
+    """Estima o tamanho em memória de uma conversa completa."""
+    return MESSAGE_OVERHEAD_BYTES + sum(estimate_message_size(m) for m in conversation.get("messages", []))
+
+
+class ConversationCache:
+    """
+    Cache LRU de conversas com gravação adiada das alterações.
+    """
+
+    def __init__(self, engine, max_bytes, flush_delay, locks=None):
+        """
+        Args:
+            engine (StorageEngine): Motor usado para carregar e gravar as conversas
+            max_bytes (int): Tamanho máximo aproximado do cache; 0 desativa o cache
+            flush_delay (float): Janela de agrupamento em segundos; 0 grava imediatamente
+            locks (KeyedLocks, optional): Locks de estado por conversa compartilhados com o chamador
+        """
+        self.engine = engine
+        self.max_bytes = max_bytes
+        self.flush_delay = flush_delay
+        self.locks = locks or KeyedLocks()
+        self._commit_locks = KeyedLocks()
+
+        self._lock = threading.RLock()
+        self._wakeup = threading.Condition(self._lock)
+        # id -> {"conversation", "size", "ops"}
+        self._entries = OrderedDict()
+        self._size = 0
+        self._dirty = set()
+        # Conversas com StorageEngine.commit em andamento em flush()
+        self._committing = set()
+        self._committed = threading.Condition(self._lock)
+        self._writer = None
+        self._closed = False
+
+    # ---- Leitura ----
+
+    def get(self, conversation_id):
+        """Retorna a conversa em cache (marcando-a como recente) ou None."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return None
+            self._entries.move_to_end(conversation_id)
+            return entry["conversation"]
+
+    def put(self, conversation):
+        """
+        Armazena uma conversa recém-carregada do disco.
+
+        Returns:
+            dict: O objeto efetivamente mantido no cache
+        """
+        with self._lock:
+            existing = self._entries.get(conversation["id"])
+            if existing is not None:
+                # Outra requisição carregou antes: a versão em cache pode ter alterações pendentes
+                self._entries.move_to_end(conversation["id"])
+                return existing["conversation"]
+            if self.max_bytes <= 0:
+                return conversation
+            size = estimate_conversation_size(conversation)
+            self._entries[conversation["id"]] = {
+                "conversation": conversation, "size": size, "ops": [], "committing": False
+            }
+            self._size += size
+            self._evict()
+            return conversation
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self._entries
+
+    # ---- Escrita ----
+
+    def record(self, conversation, op, size_delta=0):
+        """
+        Registra uma operação já aplicada ao objeto da conversa e agenda a gravação.
+        Deve ser chamado com o lock de estado da conversa (self.locks); depois de
+        liberá-lo, o chamador deve chamar sync() para concluir a gravação.
+
+        Args:
+            conversation (dict): Conversa alterada (a mesma instância mantida no cache)
+            op (tuple): Operação no formato de StorageEngine.commit
+            size_delta (int): Variação estimada do tamanho da conversa
+        """
+        conversation_id = conversation["id"]
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            cached = entry is not None and entry["conversation"] is conversation
+            if cached:
+                entry["ops"].append(op)
+                entry["size"] += size_delta
+                self._size += size_delta
+                self._entries.move_to_end(conversation_id)
+                self._dirty.add(conversation_id)
+                if self.flush_delay > 0:
+                    self._ensure_writer()
+                    self._wakeup.notify()
+
+        if not cached:
+            # Fora do cache (ou cache desativado): grava imediatamente, depois de um
+            # eventual commit da versão anterior em cache (ex.: despejada ou descartada)
+            with self._lock:
+                while conversation_id in self._committing:
+                    self._committed.wait()
+            self.engine.commit(conversation, [op])
+
+    def sync(self, conversation_id):
+        """
+        Conclui a gravação de operações registradas, conforme a política do cache:
+        com flush_delay > 0 a thread de escrita cuida disso; com 0 grava agora.
+        Não deve ser chamado com o lock de estado da conversa.
+        """
+        if self.flush_delay <= 0:
+            return self.flush(conversation_id)
+        return True
+
+    def exclusive(self, conversation_id):
+        """
+        Context manager que bloqueia gravações e alterações da conversa durante o bloco
+        (ex.: exclusão), respeitando a ordem dos locks usada por flush.
+        """
+        stack = ExitStack()
+        stack.enter_context(self._commit_locks.lock(conversation_id))
+        stack.enter_context(self.locks.lock(conversation_id))
+        return stack
+
+    def discard(self, conversation_id):
+        """Remove a conversa do cache descartando operações pendentes (ex.: exclusão)."""
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None:
+                self._size -= entry["size"]
+            self._dirty.discard(conversation_id)
+
+    def flush(self, conversation_id):
+        """
+        Grava imediatamente as operações pendentes de uma conversa.
+
+        Todas as operações acumuladas até o momento em que o lock de commit é obtido
+        seguem em um único commit; quem chegar depois de uma gravação que já incluiu
+        suas operações encontra a fila vazia e retorna sem escrever.
+
+        Returns:
+            bool: True se a operação foi bem-sucedida, False caso contrário
+        """
+        with self._commit_locks.lock(conversation_id):
+            with self.locks.lock(conversation_id):
+                with self._lock:
+                    entry = self._entries.get(conversation_id)
+                    self._dirty.discard(conversation_id)
+                    if entry is None or not entry["ops"]:
+                        return True
+                    ops, entry["ops"] = entry["ops"], []
+                    entry["committing"] = True
+                    self._committing.add(conversation_id)
+                # Cópia rasa: novas mensagens podem ser adicionadas durante a escrita
+                conversation = entry["conversation"]
+                snapshot = dict(conversation, messages=list(conversation.get("messages", [])))
+
+            try:
+                self.engine.commit(snapshot, ops)
+                ok = True
+            except Exception as e:
+                print(f"[ERRO-PYTHON] Falha ao gravar conversa {conversation_id}: {str(e)}")
+                ok = False
+
+            with self._lock:
+                entry["committing"] = False
+                self._committing.discard(conversation_id)
+                self._committed.notify_all()
+                if not ok:
+                    # Mantém as operações para a próxima tentativa
+                    entry["ops"] = ops + entry["ops"]
+                    self._dirty.add(conversation_id)
+                self._evict()
+            return ok
+
+    def flush_all(self):
+        """
+        Grava todas as operações pendentes.
+
+        Returns:
+            bool: True se todas as gravações foram bem-sucedidas
+        """
+        with self._lock:
+            dirty = list(self._dirty)
+        ok = True
+        for conversation_id in dirty:
+            ok = self.flush(conversation_id) and ok
+        return ok
+
+    def close(self):
+        """Grava tudo o que estiver pendente e encerra a thread de escrita."""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        return self.flush_all()
+
+    def _evict(self):
+        """
+        Remove as conversas menos usadas até respeitar o limite. Deve ser chamado com o lock.
+        Conversas com alterações pendentes ou em gravação são mantidas até a escrita terminar.
+        """
+        if self._size <= self.max_bytes:
+            return
+        for conversation_id in list(self._entries):
+            if self._size <= self.max_bytes or len(self._entries) <= 1:
+                break
+            entry = self._entries[conversation_id]
+            if entry["ops"] or entry["committing"]:
+                continue
+            del self._entries[conversation_id]
+            self._size -= entry["size"]
+
+    # ---- Thread de escrita ----
+
+    def _ensure_writer(self):
+        if self._writer is None or not self._writer.is_alive():
+            self._writer = threading.Thread(target=self._writer_loop, name="conversation-cache-writer", daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self):
+        while True:
+            with self._lock:
+                while not self._dirty and not self._closed:
+                    self._wakeup.wait()
+                if self._closed:
+                    return
+            # Janela de agrupamento: operações que chegarem nesse intervalo vão na mesma escrita
+            time.sleep(self.flush_delay)
+            self.flush_all()
@@ -0,0 +1,267 @@
+"""
+Índice de Conversas em Memória
+
+Este módulo mantém o índice de conversas (id, título, timestamp e arquivo) em memória,
+carregado uma única vez a partir de data/index.json. Cada alteração é registrada em um
+journal append-only (data/index.journal) e o arquivo de índice completo só é reescrito
+periodicamente, por um checkpoint executado em background.
+
+Estruturas em memória:
+- dicionário id -> entrada, para busca e substituição diretas
+- lista ordenada de chaves (timestamp, id), mantida com bisect, para listar as
+  conversas da mais recente para a mais antiga sem reordenar tudo a cada alteração
+
+Formato do journal (uma linha JSON por operação, idempotentes):
+- {"op": "put", "entry": {...}}
+- {"op": "delete", "id": "..."}
+
+A paginação por cursor (page) usa a própria chave (timestamp, id) da última entrada
+retornada, codificada em uma string opaca por encode_cursor.
+"""
+
+import base64
+import json
+import os
+import threading
+from bisect import bisect_left, insort
+
+from utils.atomic_file import atomic_write
+
+# Número de operações no journal que dispara um checkpoint em background
+CHECKPOINT_EVERY = 500
+
+
+def encode_cursor(key):
+    """
+    Codifica a chave (timestamp, id) de uma entrada como cursor de paginação.
+
+    Args:
+        key (tuple): Chave (timestamp, id) da última entrada de uma página
+
+    Returns:
+        str: Cursor opaco, seguro para uso em URLs
+    """
+    raw = json.dumps(list(key), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica um cursor gerado por encode_cursor.
+
+    Returns:
+        tuple: Chave (timestamp, id)
+
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, conversation_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor}")
+    return (str(timestamp), str(conversation_id))
+
+
+class ConversationIndex:
+    """
+    Índice incremental de conversas com persistência por journal + checkpoint.
+    """
+
+    def __init__(self, index_file, journal_file=None, checkpoint_every=CHECKPOINT_EVERY):
+        """
+        Args:
+            index_file (str): Caminho do arquivo de índice completo (index.json)
+            journal_file (str, optional): Caminho do journal; padrão é <index_file sem extensão>.journal
+            checkpoint_every (int): Operações acumuladas antes de um checkpoint automático
+        """
+        self.index_file = index_file
+        self.journal_file = journal_file or os.path.splitext(index_file)[0] + ".journal"
+        self.checkpoint_every = checkpoint_every
+
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._entries = {}
+        self._order = []
+        self._journal_ops = 0
+        self._checkpoint_thread = None
+
+        self._load()
+
+    # ---- Carregamento ----
+
+    def _rotated_journal(self):
+        return self.journal_file + ".1"
+
+    def _load(self):
+        """Carrega o índice completo e reaplica os journals pendentes."""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    self._put(entry)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        # O journal rotacionado só existe se um checkpoint foi interrompido
+        for path in (self._rotated_journal(), self.journal_file):
+            self._journal_ops += self._replay_journal(path)
+
+    def _replay_journal(self, path):
+        applied = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if op.get("op") == "put":
+                        self._put(op["entry"])
+                    elif op.get("op") == "delete":
+                        self._delete(op["id"])
+                    applied += 1
+        except FileNotFoundError:
+            pass
+        return applied
+
+    # ---- Operações em memória ----
+
+    @staticmethod
+    def _key(entry):
+        return (entry.get("timestamp", ""), entry["id"])
+
+    def _put(self, entry):
+        old = self._entries.get(entry["id"])
+        if old is not None:
+            self._remove_key(self._key(old))
+        self._entries[entry["id"]] = entry
+        insort(self._order, self._key(entry))
+
+    def _delete(self, conversation_id):
+        old = self._entries.pop(conversation_id, None)
+        if old is not None:
+            self._remove_key(self._key(old))
+        return old is not None
+
+    def _remove_key(self, key):
+        position = bisect_left(self._order, key)
+        if position < len(self._order) and self._order[position] == key:
+            del self._order[position]
+
+    # ---- API pública ----
+
+    def put(self, entry):
+        """
+        Insere ou substitui a entrada de uma conversa.
+
+        Args:
+            entry (dict): Entrada com id, title, timestamp e filename
+        """
+        with self._lock:
+            self._put(entry)
+            self._journal({"op": "put", "entry": entry})
+
+    def remove(self, conversation_id):
+        """
+        Remove a entrada de uma conversa.
+
+        Returns:
+            bool: True se a entrada existia
+        """
+        with self._lock:
+            removed = self._delete(conversation_id)
+            if removed:
+                self._journal({"op": "delete", "id": conversation_id})
+            return removed
+
+    def get(self, conversation_id):
+        """Retorna a entrada da conversa ou None."""
+        return self._entries.get(conversation_id)
+
+    def entries(self):
+        """
+        Lista as entradas da conversa mais recente para a mais antiga.
+
+        Returns:
+            list: Cópia da lista de entradas ordenada por timestamp decrescente
+        """
+        with self._lock:
+            return [self._entries[key[1]] for key in reversed(self._order)]
+
+    def page(self, limit, after=None):
+        """
+        Lista uma página de entradas, da mais recente para a mais antiga.
+
+        Args:
+            limit (int): Número máximo de entradas
+            after (tuple, optional): Chave (timestamp, id) da última entrada da página anterior
+
+        Returns:
+            tuple: (lista de entradas, chave da última entrada ou None se não houver mais)
+        """
+        with self._lock:
+            end = len(self._order) if after is None else bisect_left(self._order, tuple(after))
+            start = max(0, end - limit)
+            keys = self._order[start:end]
+            entries = [self._entries[key[1]] for key in reversed(keys)]
+        return entries, (keys[0] if start > 0 and keys else None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, conversation_id):
+        return conversation_id in self._entries
+
+    # ---- Persistência ----
+
+    def _journal(self, op):
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(op, ensure_ascii=False, separators=(',', ':')) + "\n")
+        self._journal_ops += 1
+        if self._journal_ops >= self.checkpoint_every:
+            self.checkpoint_async()
+
+    def checkpoint_async(self):
+        """Dispara um checkpoint em background, se nenhum estiver em andamento."""
+        with self._lock:
+            if self._checkpoint_thread is not None and self._checkpoint_thread.is_alive():
+                return
+            self._checkpoint_thread = threading.Thread(
+                target=self.checkpoint, name="conversation-index-checkpoint", daemon=True
+            )
+            self._checkpoint_thread.start()
+
+    def checkpoint(self):
+        """
+        Grava o índice completo em disco e descarta o journal já incorporado.
+
+        Apenas a captura do estado e a rotação do journal acontecem sob o lock; a escrita
+        do arquivo é feita fora dele, então novas operações continuam sendo registradas
+        no journal novo enquanto o checkpoint roda.
+
+        Returns:
+            bool: True se a operação foi bem-sucedida, False caso contrário
+        """
+        with self._checkpoint_lock:
+            with self._lock:
+                snapshot = [self._entries[key[1]] for key in reversed(self._order)]
+                rotated = self._rotated_journal()
+                if os.path.exists(self.journal_file):
+                    if os.path.exists(rotated):
+                        # Checkpoint anterior falhou: preserva as operações ainda não gravadas
+                        with open(self.journal_file, 'r', encoding='utf-8') as src, \
+                                open(rotated, 'a', encoding='utf-8') as dst:
+                            dst.write(src.read())
+                        os.remove(self.journal_file)
+                    else:
+                        os.replace(self.journal_file, rotated)
+                self._journal_ops = 0
+
+            try:
+                atomic_write(self.index_file, json.dumps(snapshot, ensure_ascii=False, indent=2))
+                if os.path.exists(rotated):
+                    os.remove(rotated)
+                return True
+            except Exception as e:
+                print(f"[ERRO-PYTHON] Falha no checkpoint do índice: {str(e)}")
+                return False
@@ -0,0 +1,179 @@
+"""
+Memória de Conversas Longas (compactação por resumo)
+
+Em conversas longas, reenviar as mensagens antigas a cada turno faz o tempo de
+processamento do prompt crescer com a conversa. Este módulo mantém, no campo
+"memory" da conversa, um resumo acumulado das mensagens antigas:
+
+    {"summary": "...", "covered": <mensagens já resumidas>, "updated_at": "..."}
+
+Quando as mensagens ainda não resumidas (fora as MEMORY_KEEP_RECENT mais recentes)
+chegam a MEMORY_MIN_BATCH, e a conversa já passou de MEMORY_THRESHOLD mensagens, o
+MemoryCompactor pede ao modelo, em background, um novo resumo a partir do resumo
+anterior e apenas das mensagens novas; o resumo nunca é refeito do zero. Na montagem
+do contexto (app.py), o resumo substitui as mensagens que ele cobre.
+
+Configuração por variáveis de ambiente:
+- CHAT_MEMORY_THRESHOLD: mensagens a partir das quais a conversa é resumida (padrão 20; 0 desativa)
+- CHAT_MEMORY_KEEP_RECENT: mensagens recentes sempre enviadas na íntegra (padrão 8)
+- CHAT_MEMORY_MIN_BATCH: mensagens novas acumuladas antes de atualizar o resumo (padrão 6)
+"""
+
+import os
+import threading
+from datetime import datetime
+
+from utils.chat_storage import get_conversation_by_id, resolve_message, update_conversation_memory
+
+MEMORY_THRESHOLD = int(os.environ.get("CHAT_MEMORY_THRESHOLD", "20"))
+MEMORY_KEEP_RECENT = int(os.environ.get("CHAT_MEMORY_KEEP_RECENT", "8"))
+MEMORY_MIN_BATCH = int(os.environ.get("CHAT_MEMORY_MIN_BATCH", "6"))
+# Caracteres de cada mensagem incluídos no pedido de resumo
+MEMORY_MESSAGE_CHARS = 2000
+
+ROLE_LABELS = {"user": "Usuário", "assistant": "Assistente"}
+
+
+def covered_messages(conversation):
+    """
+    Retorna quantas mensagens do início da conversa o resumo acumulado cobre.
+
+    Returns:
+        int: 0 se a conversa não tiver resumo
+    """
+    memory = conversation.get("memory") or {}
+    return min(memory.get("covered", 0), len(conversation.get("messages", [])))
+
+
+def build_summary_prompt(previous_summary, messages):
+    """
+    Monta o pedido de atualização incremental do resumo.
+
+    Args:
+        previous_summary (str): Resumo atual (vazio na primeira compactação)
+        messages (list): Mensagens novas a incorporar
+
+    Returns:
+        str: Prompt para o modelo
+    """
+    lines = []
+    for message in messages:
+        content = message.get("content", "")
+        if len(content) > MEMORY_MESSAGE_CHARS:
+            content = content[:MEMORY_MESSAGE_CHARS] + "..."
+        lines.append(f"{ROLE_LABELS.get(message.get('role'), message.get('role'))}: {content}")
+    new_messages = "\n\n".join(lines)
+
+    if previous_summary:
+        return f"""Abaixo está o resumo de uma conversa até certo ponto, seguido das mensagens trocadas depois dele. Atualize o resumo incorporando as novas mensagens, preservando fatos, decisões, nomes e pedidos do usuário que ainda possam ser relevantes. Responda apenas com o resumo atualizado, em português.
+
+Resumo atual:
+{previous_summary}
+
+Novas mensagens:
+{new_messages}
+
+Resumo atualizado:"""
+    return f"""Resuma a conversa abaixo preservando fatos, decisões, nomes e pedidos do usuário que possam ser relevantes para continuar a conversa. Responda apenas com o resumo, em português.
+
+{new_messages}
+
+Resumo:"""
+
+
+class MemoryCompactor:
+    """
+    Atualiza em background o resumo acumulado das conversas longas.
+    """
+
+    def __init__(self, summarize_fn, threshold=MEMORY_THRESHOLD, keep_recent=MEMORY_KEEP_RECENT,
+                 min_batch=MEMORY_MIN_BATCH, spawn=None):
+        """
+        Args:
+            summarize_fn (callable): Recebe o prompt e retorna o texto do resumo
+            threshold (int): Mensagens a partir das quais a conversa é resumida (0 desativa)
+            keep_recent (int): Mensagens recentes que nunca entram no resumo
+            min_batch (int): Mensagens novas necessárias para atualizar o resumo
+            spawn (callable, optional): Inicia uma tarefa em background, como
+                                        socketio.start_background_task; padrão: thread
+        """
+        self.summarize_fn = summarize_fn
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.min_batch = max(1, min_batch)
+        self.spawn = spawn
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def pending_range(self, conversation):
+        """
+        Retorna a faixa de mensagens que deve entrar no resumo agora.
+
+        Returns:
+            tuple: (início, fim) ou None se a conversa não precisar de compactação
+        """
+        total = len(conversation.get("messages", []))
+        if self.threshold <= 0 or total < self.threshold:
+            return None
+        start = covered_messages(conversation)
+        end = total - self.keep_recent
+        if end - start < self.min_batch:
+            return None
+        return start, end
+
+    def compact(self, conversation_id):
+        """
+        Atualiza o resumo da conversa, se houver mensagens suficientes a incorporar.
+
+        Returns:
+            bool: True se o resumo foi atualizado
+        """
+        conversation = get_conversation_by_id(conversation_id)
+        if not conversation:
+            return False
+        pending = self.pending_range(conversation)
+        if pending is None:
+            return False
+        start, end = pending
+        previous = (conversation.get("memory") or {}).get("summary", "") if start else ""
+        # Conteúdo completo das mensagens guardadas em blobs, não apenas a prévia
+        messages = [resolve_message(message) for message in conversation["messages"][start:end]]
+
+        summary = (self.summarize_fn(build_summary_prompt(previous, messages)) or "").strip()
+        if not summary:
+            return False
+        return update_conversation_memory(conversation_id, {
+            "summary": summary,
+            "covered": end,
+            "updated_at": datetime.now().isoformat()
+        })
+
+    def _run(self, conversation_id):
+        try:
+            self.compact(conversation_id)
+        except Exception as e:
+            print(f"[ERRO-PYTHON] Falha ao resumir a conversa {conversation_id}: {str(e)}")
+        finally:
+            with self._lock:
+                self._running.discard(conversation_id)
+
+    def schedule(self, conversation_id):
+        """
+        Agenda a compactação da conversa em background, se ela precisar e ainda não
+        houver uma em andamento para a mesma conversa.
+
+        Returns:
+            bool: True se uma tarefa foi iniciada
+        """
+        conversation = get_conversation_by_id(conversation_id)
+        if not conversation or self.pending_range(conversation) is None:
+            return False
+        with self._lock:
+            if conversation_id in self._running:
+                return False
+            self._running.add(conversation_id)
+        if self.spawn is not None:
+            self.spawn(self._run, conversation_id)
+        else:
+            threading.Thread(target=self._run, args=(conversation_id,), name="memory-compactor", daemon=True).start()
+        return True
@@ -0,0 +1,110 @@
+"""
+Detecção de Alterações em Diretórios
+
+Este módulo fornece DirectoryWatcher, usado pelo chat_storage para saber quando o
+diretório de conversas foi alterado por fora da aplicação (arquivos copiados,
+removidos ou restaurados de backup) e o índice em memória precisa ser reconciliado.
+
+Usa inotify (pacote opcional inotify_simple) quando disponível; caso contrário,
+compara o mtime do diretório, que muda sempre que um arquivo é criado, removido
+ou renomeado dentro dele. Em ambos os casos a verificação é limitada a uma vez a
+cada min_interval segundos.
+
+A própria aplicação também cria, renomeia e remove arquivos no diretório (arquivos
+temporários de atomic_write, índices .idx, conversas novas). Com um filtro
+is_relevant, cada arquivo criado ou removido é avaliado individualmente e apenas
+as alterações relevantes contam; no modo mtime isso exige listar o diretório
+quando o mtime muda, para saber quais arquivos entraram e saíram.
+"""
+
+import os
+import time
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # pragma: no cover - depende da plataforma
+    INotify = None
+
+
+class DirectoryWatcher:
+    """
+    Indica se o conteúdo de um diretório mudou desde a última verificação.
+    """
+
+    def __init__(self, path, min_interval=2.0, is_relevant=None):
+        """
+        Args:
+            path (str): Diretório observado
+            min_interval (float): Intervalo mínimo, em segundos, entre verificações
+            is_relevant (callable, optional): Recebe (nome do arquivo, criado) e indica
+                                              se a alteração conta; sem ele todas contam
+        """
+        self.path = path
+        self.min_interval = min_interval
+        self.is_relevant = is_relevant
+        self._last_check = 0.0
+        self._inotify = None
+        self._mtime = self._read_mtime()
+        self._names = None
+
+        if INotify is not None:
+            try:
+                self._inotify = INotify()
+                self._inotify.add_watch(
+                    path,
+                    inotify_flags.CREATE | inotify_flags.DELETE | inotify_flags.MOVED_FROM | inotify_flags.MOVED_TO
+                )
+            except OSError:
+                self._inotify = None
+        if self._inotify is None and is_relevant is not None:
+            self._names = self._read_names()
+
+    @property
+    def mode(self):
+        """Mecanismo em uso: 'inotify' ou 'mtime'."""
+        return "inotify" if self._inotify is not None else "mtime"
+
+    def _read_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_names(self):
+        try:
+            return set(os.listdir(self.path))
+        except FileNotFoundError:
+            return set()
+
+    def changed(self):
+        """
+        Verifica se houve alteração desde a última chamada.
+
+        Returns:
+            bool: True se arquivos foram criados, removidos ou renomeados no diretório
+                  (apenas os aceitos por is_relevant, quando informado)
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.min_interval:
+            return False
+        self._last_check = now
+
+        if self._inotify is not None:
+            # Leitura não bloqueante: apenas consome os eventos acumulados
+            events = self._inotify.read(timeout=0)
+            if self.is_relevant is None:
+                return bool(events)
+            created_mask = inotify_flags.CREATE | inotify_flags.MOVED_TO
+            return any(self.is_relevant(event.name, bool(event.mask & created_mask)) for event in events)
+
+        mtime = self._read_mtime()
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        if self.is_relevant is None:
+            return True
+        names = self._read_names()
+        created, removed = names - self._names, self._names - names
+        self._names = names
+        return (any(self.is_relevant(name, True) for name in created)
+                or any(self.is_relevant(name, False) for name in removed))
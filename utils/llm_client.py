@@ -0,0 +1,193 @@
+"""
+Cliente HTTP da API do LLM (Ollama, endpoint compatível com OpenAI)
+
+Este módulo concentra as chamadas ao modelo feitas pelo app.py. Um único LLMClient
+é compartilhado pela aplicação: a requests.Session mantém um pool de conexões
+keep-alive com o servidor, então cada turno de chat e cada bloco de resumo reutiliza
+uma conexão já aberta em vez de abrir uma nova conexão TCP.
+
+Configuração por variáveis de ambiente:
+- LLM_POOL_SIZE: conexões mantidas no pool (padrão 10)
+- LLM_CONNECT_TIMEOUT: tempo máximo para conectar, em segundos (padrão 5)
+- LLM_READ_TIMEOUT: tempo máximo sem receber dados, em segundos (padrão 120)
+
+AsyncLLMClient oferece a mesma interface de streaming sobre httpx (pacote opcional),
+para chamadores baseados em asyncio.
+"""
+
+import json
+import logging
+import os
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - dependência opcional
+    httpx = None
+
+logger = logging.getLogger('llm_client')
+
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.environ.get("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("LLM_READ_TIMEOUT", "120"))
+
+
+class LLMResponseError(Exception):
+    """Resposta da API com status HTTP diferente de 200."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Erro na API: {status_code} - {text[:200]}")
+        self.status_code = status_code
+        self.text = text
+
+
+def parse_stream_line(line):
+    """
+    Interpreta uma linha do streaming (Server-Sent Events no formato da OpenAI).
+
+    Args:
+        line (bytes | str): Linha recebida, sem o terminador
+
+    Returns:
+        tuple: (trecho de conteúdo ou None, True se for o marcador de fim)
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if line.startswith('data: '):
+        line = line[6:]
+    if line == '[DONE]':
+        return None, True
+
+    data = json.loads(line)
+    choices = data.get('choices') or []
+    if choices:
+        content = choices[0].get('delta', {}).get('content')
+        if content:
+            return content, False
+    return None, False
+
+
+class LLMClient:
+    """
+    Cliente síncrono com pool de conexões keep-alive.
+    """
+
+    def __init__(self, api_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        """
+        Args:
+            api_url (str): URL do endpoint de chat completions
+            pool_size (int): Conexões mantidas abertas com o servidor
+            connect_timeout (float): Tempo máximo para conectar, em segundos
+            read_timeout (float): Tempo máximo sem receber dados, em segundos
+        """
+        self.api_url = api_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+    def complete(self, payload):
+        """
+        Envia uma requisição sem streaming e retorna o JSON da resposta.
+
+        Raises:
+            requests.exceptions.RequestException: Em falhas de conexão ou status de erro
+        """
+        response = self.session.post(self.api_url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def stream_chat(self, payload, on_response=None):
+        """
+        Envia uma requisição com streaming e produz os trechos de conteúdo gerados.
+        A resposta é sempre fechada ao final (ou se o consumidor parar antes), o que
+        devolve a conexão ao pool.
+
+        Args:
+            payload (dict): Corpo da requisição
+            on_response (callable, optional): Recebe a resposta assim que aberta; quem
+                cancela a geração pode fechá-la de outra thread, interrompendo a leitura
+
+        Yields:
+            str: Trechos de conteúdo na ordem em que chegam
+
+        Raises:
+            LLMResponseError: Se a API responder com status diferente de 200
+            requests.exceptions.RequestException: Em falhas de conexão
+        """
+        with self.session.post(self.api_url, json=payload, stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise LLMResponseError(response.status_code, response.text)
+            if on_response:
+                on_response(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                try:
+                    content, done = parse_stream_line(line)
+                except ValueError as e:
+                    logger.error(f"Erro ao processar linha do streaming: {str(e)}")
+                    continue
+                if done:
+                    break
+                if content:
+                    yield content
+
+    def close(self):
+        """Fecha as conexões do pool."""
+        self.session.close()
+
+
+class AsyncLLMClient:
+    """
+    Cliente assíncrono (asyncio) sobre httpx, com pool de conexões keep-alive.
+    Requer o pacote httpx.
+    """
+
+    def __init__(self, api_url, pool_size=POOL_SIZE, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+        if httpx is None:
+            raise RuntimeError("AsyncLLMClient requer o pacote httpx")
+        self.api_url = api_url
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            headers={"Content-Type": "application/json"}
+        )
+
+    async def complete(self, payload):
+        """Envia uma requisição sem streaming e retorna o JSON da resposta."""
+        response = await self.client.post(self.api_url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def stream_chat(self, payload):
+        """
+        Envia uma requisição com streaming e produz os trechos de conteúdo gerados.
+
+        Yields:
+            str: Trechos de conteúdo na ordem em que chegam
+        """
+        async with self.client.stream("POST", self.api_url, json=payload) as response:
+            if response.status_code != 200:
+                text = (await response.aread()).decode('utf-8', errors='replace')
+                raise LLMResponseError(response.status_code, text)
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                try:
+                    content, done = parse_stream_line(line)
+                except ValueError as e:
+                    logger.error(f"Erro ao processar linha do streaming: {str(e)}")
+                    continue
+                if done:
+                    break
+                if content:
+                    yield content
+
+    async def close(self):
+        """Fecha as conexões do pool."""
+        await self.client.aclose()
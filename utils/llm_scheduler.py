@@ -0,0 +1,223 @@
+"""
+Agendador de Chamadas ao LLM
+
+Cada mensagem do chat e cada bloco do /youtube_resumo chamavam o Ollama assim que
+chegavam. Com mais chamadas simultâneas do que o servidor atende
+(OLLAMA_NUM_PARALLEL), as excedentes ficam disputando o modelo e a vazão total
+cai. Este módulo limita as chamadas em andamento e organiza as demais em uma fila:
+
+- Classes de prioridade: PRIORITY_INTERACTIVE (chat) sempre passa à frente de
+  PRIORITY_BATCH (resumos de vídeos, resumo acumulado das conversas).
+- Dentro de cada classe, a fila alterna entre as conversas (round-robin), para
+  que um resumo com dezenas de blocos não bloqueie outra conversa.
+- Quem aguarda é avisado da sua posição na fila sempre que ela muda.
+- Admissão: com LLM_MAX_QUEUE chamadas aguardando, novas chamadas são recusadas
+  com LLMQueueFull.
+- O tempo de espera na fila é medido por classe (ver LLMScheduler.metrics).
+- Uma chamada cancelada (CancelToken de utils/streaming.py) enquanto aguarda sai
+  da fila com GenerationCancelled.
+
+Configuração por variáveis de ambiente:
+- LLM_MAX_INFLIGHT: chamadas simultâneas ao modelo (padrão OLLAMA_NUM_PARALLEL ou 4)
+- LLM_MAX_QUEUE: chamadas aguardando na fila (padrão 64)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from utils.streaming import GenerationCancelled
+
+MAX_INFLIGHT = int(os.environ.get("LLM_MAX_INFLIGHT", os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "64"))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BATCH: "batch"}
+
+
+class LLMQueueFull(Exception):
+    """A fila de chamadas ao modelo está cheia."""
+
+
+class _Ticket:
+    def __init__(self, conversation_id, priority):
+        self.conversation_id = conversation_id
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.admitted = False
+
+
+class LLMScheduler:
+    """
+    Limita as chamadas simultâneas ao modelo, com fila por prioridade e por conversa.
+    """
+
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE):
+        """
+        Args:
+            max_inflight (int): Chamadas simultâneas ao modelo
+            max_queue (int): Chamadas aguardando na fila
+        """
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max_queue
+        self._condition = threading.Condition()
+        self._inflight = 0
+        self._waiting = 0
+        # Por prioridade: conversa -> fila de tickets, na ordem do round-robin
+        self._queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self._stats = {
+            priority: {"admitted": 0, "rejected": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+    @contextmanager
+    def slot(self, conversation_id=None, priority=PRIORITY_INTERACTIVE, on_position=None, cancel=None):
+        """
+        Aguarda a vez de chamar o modelo e ocupa uma vaga até o fim do bloco with.
+
+        Args:
+            conversation_id: Conversa da chamada (para alternar entre conversas)
+            priority (int): PRIORITY_INTERACTIVE ou PRIORITY_BATCH
+            on_position (callable, optional): Recebe a posição na fila (1 = próxima)
+                                              sempre que ela muda enquanto aguarda
+            cancel (CancelToken, optional): Desiste da vaga se cancelado enquanto aguarda
+
+        Raises:
+            LLMQueueFull: Se a fila estiver cheia
+            GenerationCancelled: Se cancelado antes de conseguir a vaga
+        """
+        self._acquire(conversation_id, priority, on_position, cancel)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, conversation_id, priority, on_position, cancel):
+        if cancel is not None and cancel.is_cancelled():
+            raise GenerationCancelled()
+        ticket = _Ticket(conversation_id, priority)
+        with self._condition:
+            if self._inflight < self.max_inflight and self._waiting == 0:
+                self._admit(ticket)
+                return
+            if self._waiting >= self.max_queue:
+                self._stats[priority]["rejected"] += 1
+                raise LLMQueueFull("Fila de chamadas ao modelo cheia")
+            self._queues[priority].setdefault(conversation_id, deque()).append(ticket)
+            self._waiting += 1
+
+        last_position = None
+        remove_callback = cancel.on_cancel(self._wake) if cancel is not None else None
+        try:
+            while True:
+                with self._condition:
+                    if ticket.admitted:
+                        return
+                    if cancel is not None and cancel.is_cancelled():
+                        raise GenerationCancelled()
+                    position = self._position(ticket)
+                    if position == last_position:
+                        self._condition.wait()
+                        continue
+                # Avisa fora do lock: o callback pode emitir eventos
+                last_position = position
+                if on_position:
+                    on_position(position)
+        except BaseException:
+            with self._condition:
+                if ticket.admitted:
+                    self._inflight -= 1
+                    self._dispatch()
+                else:
+                    self._remove(ticket)
+            raise
+        finally:
+            if remove_callback:
+                remove_callback()
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def _admit(self, ticket):
+        wait = time.monotonic() - ticket.enqueued
+        stats = self._stats[ticket.priority]
+        stats["admitted"] += 1
+        stats["wait_seconds"] += wait
+        stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+        ticket.admitted = True
+        self._inflight += 1
+
+    def _next_ticket(self):
+        for priority in sorted(self._queues):
+            conversations = self._queues[priority]
+            if conversations:
+                conversation_id, tickets = next(iter(conversations.items()))
+                ticket = tickets.popleft()
+                # A conversa vai para o fim da fila da sua classe
+                del conversations[conversation_id]
+                if tickets:
+                    conversations[conversation_id] = tickets
+                return ticket
+        return None
+
+    def _dispatch(self):
+        admitted = False
+        while self._inflight < self.max_inflight and self._waiting:
+            ticket = self._next_ticket()
+            self._waiting -= 1
+            self._admit(ticket)
+            admitted = True
+        if admitted:
+            self._condition.notify_all()
+
+    def _remove(self, ticket):
+        tickets = self._queues[ticket.priority].get(ticket.conversation_id)
+        if tickets and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.priority][ticket.conversation_id]
+            self._waiting -= 1
+            self._condition.notify_all()
+
+    def _position(self, ticket):
+        """Posição do ticket (1 = próximo) na ordem em que a fila seria atendida."""
+        position = 1
+        for priority in sorted(self._queues):
+            conversations = self._queues[priority]
+            if priority < ticket.priority:
+                position += sum(len(tickets) for tickets in conversations.values())
+                continue
+            # Round-robin: antes do ticket k de uma conversa saem até k tickets de
+            # cada conversa e, na rodada k, os das conversas à frente dela
+            rounds = conversations[ticket.conversation_id].index(ticket)
+            ahead = True
+            for conversation_id, tickets in conversations.items():
+                if conversation_id == ticket.conversation_id:
+                    ahead = False
+                position += min(len(tickets), rounds + 1 if ahead else rounds)
+            break
+        return position
+
+    def _release(self):
+        with self._condition:
+            self._inflight -= 1
+            self._dispatch()
+
+    def metrics(self):
+        """
+        Returns:
+            dict: Chamadas em andamento e aguardando, e por classe de prioridade as
+                  admitidas, recusadas e o tempo de espera na fila (total, médio e máximo)
+        """
+        with self._condition:
+            result = {"inflight": self._inflight, "queued": self._waiting, "max_inflight": self.max_inflight}
+            for priority, name in PRIORITY_NAMES.items():
+                stats = dict(self._stats[priority])
+                stats["queued"] = sum(len(tickets) for tickets in self._queues[priority].values())
+                stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["admitted"] if stats["admitted"] else 0.0
+                result[name] = stats
+        return result
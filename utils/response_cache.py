@@ -0,0 +1,173 @@
+"""
+Cache de Respostas do LLM
+
+Pedir duas vezes o resumo do mesmo vídeo (ou repetir o pedido após uma falha no
+meio) gerava de novo todos os resumos de blocos. Este módulo guarda em disco as
+respostas de chamadas determinísticas (prompts autocontidos, sem histórico), com a
+chave sendo o sha256 de (modelo, mensagens, temperature, max_tokens).
+
+Cada resposta é um arquivo JSON em <diretório>/<2 primeiros caracteres>/<chave>.json
+com {"created", "content"}. Uma leitura atualiza o mtime do arquivo, que serve de
+ordem LRU: quando o total passa de max_bytes, as entradas menos usadas são removidas.
+Entradas mais antigas que ttl segundos são descartadas ao serem lidas.
+
+Desativado por padrão; configuração por variáveis de ambiente:
+- LLM_CACHE_ENABLED: "1" ativa o cache (padrão "0")
+- LLM_CACHE_DIR: diretório das entradas (padrão data/llm_cache)
+- LLM_CACHE_MAX_BYTES: tamanho máximo em disco (padrão 64 MB)
+- LLM_CACHE_TTL: validade das entradas em segundos (padrão 7 dias)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.atomic_file import atomic_write
+
+CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "0") == "1"
+CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join("data", "llm_cache"))
+CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Ao exceder o limite, remove entradas até ficar nesta fração dele
+EVICTION_TARGET = 0.9
+
+
+def cache_key(payload):
+    """
+    Calcula a chave de uma chamada a partir dos campos que determinam a resposta.
+
+    Args:
+        payload (dict): Payload enviado à API de chat completions
+
+    Returns:
+        str: sha256 em hexadecimal
+    """
+    relevant = {
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens")
+    }
+    data = json.dumps(relevant, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Respostas completas do modelo em disco, com despejo LRU por tamanho e validade.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        """
+        Args:
+            directory (str): Diretório das entradas
+            max_bytes (int): Tamanho máximo do cache em disco
+            ttl (float): Validade das entradas em segundos (0 = sem validade)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _entries(self):
+        """Lista (mtime, tamanho, caminho) de todas as entradas em disco."""
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def get(self, key):
+        """
+        Retorna a resposta guardada para a chave.
+
+        Returns:
+            Conteúdo guardado (o texto da resposta, no caso do LLM) ou None se
+            ausente, expirado ou ilegível
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = json.loads(f.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except ValueError:
+            with self._lock:
+                self._remove(path)
+            self.misses += 1
+            return None
+
+        if self.ttl > 0 and time.time() - entry.get("created", 0) > self.ttl:
+            with self._lock:
+                self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            # Marca o uso para a ordem LRU
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry.get("content")
+
+    def put(self, key, content):
+        """
+        Guarda uma resposta completa, removendo as entradas menos usadas se o cache
+        passar do tamanho máximo.
+        """
+        data = json.dumps({"created": time.time(), "content": content}, ensure_ascii=False).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            if os.path.exists(path):
+                self._remove(path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data, fsync=False)
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        target = self.max_bytes * EVICTION_TARGET
+        entries = self._entries()
+        self._size = sum(size for _, size, _ in entries)
+        for _, _, path in sorted(entries):
+            if self._size <= target:
+                break
+            self._remove(path)
+
+    def clear(self):
+        """Remove todas as entradas."""
+        with self._lock:
+            for _, _, path in self._entries():
+                self._remove(path)
+            self._size = 0
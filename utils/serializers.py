@@ -0,0 +1,141 @@
+"""
+Serializadores de Conversas
+
+Este módulo abstrai a codificação dos documentos gravados pelos motores de
+armazenamento (utils/storage_engines.py), escolhida pela variável de ambiente
+CHAT_SERIALIZER:
+- "auto" (padrão): orjson se estiver instalado, senão json da biblioteca padrão
+- "json": json da biblioteca padrão, sem indentação
+- "orjson": mesmo formato JSON, codificado pelo pacote opcional orjson
+- "msgpack": formato binário do pacote opcional msgpack
+
+O formato de um arquivo é detectado pelos primeiros bytes: documentos msgpack são
+gravados com o prefixo MSGPACK_MAGIC e todo o resto é lido como JSON, então os
+arquivos antigos (JSON indentado) continuam legíveis com qualquer configuração.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependência opcional
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dependência opcional
+    msgpack = None
+
+# Prefixo que identifica documentos msgpack em disco
+MSGPACK_MAGIC = b"\x00CHMP1"
+
+
+class JsonSerializer:
+    """JSON compacto com o módulo json da biblioteca padrão."""
+
+    name = "json"
+    binary = False
+
+    def dumps(self, obj):
+        """Codifica o objeto em bytes."""
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        """Decodifica bytes (ou str) gerados por dumps."""
+        return json.loads(data)
+
+
+class OrjsonSerializer(JsonSerializer):
+    """JSON compacto com orjson; lê e grava o mesmo formato de JsonSerializer."""
+
+    name = "orjson"
+
+    def dumps(self, obj):
+        return orjson.dumps(obj)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class MsgpackSerializer:
+    """Formato binário msgpack, com o prefixo MSGPACK_MAGIC."""
+
+    name = "msgpack"
+    binary = True
+
+    def dumps(self, obj):
+        return MSGPACK_MAGIC + msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data):
+        if not data.startswith(MSGPACK_MAGIC):
+            raise ValueError("Documento sem o prefixo msgpack")
+        return msgpack.unpackb(data[len(MSGPACK_MAGIC):], raw=False)
+
+
+def available_serializers():
+    """
+    Lista os serializadores utilizáveis neste ambiente.
+
+    Returns:
+        dict: nome -> instância
+    """
+    serializers = {"json": JsonSerializer()}
+    if orjson is not None:
+        serializers["orjson"] = OrjsonSerializer()
+    if msgpack is not None:
+        serializers["msgpack"] = MsgpackSerializer()
+    return serializers
+
+
+def get_serializer(name=None):
+    """
+    Retorna o serializador pelo nome.
+
+    Args:
+        name (str, optional): 'auto', 'json', 'orjson' ou 'msgpack'; None equivale a 'auto'
+
+    Returns:
+        Serializer: Instância do serializador
+
+    Raises:
+        ValueError: Se o nome for desconhecido ou a dependência não estiver instalada
+    """
+    serializers = available_serializers()
+    if name in (None, "auto"):
+        return serializers.get("orjson") or serializers["json"]
+    try:
+        return serializers[name]
+    except KeyError:
+        raise ValueError(f"Serializador indisponível: {name}")
+
+
+def text_serializer(serializer=None):
+    """
+    Retorna um serializador JSON textual, para formatos orientados a linhas (ex.: o log
+    JSON Lines). Mantém o serializador informado se ele já for textual.
+    """
+    if serializer is not None and not serializer.binary:
+        return serializer
+    return get_serializer("auto")
+
+
+def detect_serializer(data):
+    """
+    Identifica o formato de um documento pelos primeiros bytes.
+
+    Returns:
+        Serializer: Serializador capaz de ler o documento
+
+    Raises:
+        ValueError: Se o documento for msgpack e o pacote não estiver instalado
+    """
+    if data.startswith(MSGPACK_MAGIC):
+        if msgpack is None:
+            raise ValueError("Documento msgpack, mas o pacote msgpack não está instalado")
+        return MsgpackSerializer()
+    return get_serializer("auto")
+
+
+def loads(data):
+    """Decodifica um documento em qualquer formato suportado."""
+    return detect_serializer(data).loads(data)
@@ -0,0 +1,1238 @@
+"""
+Motores de Armazenamento de Conversas
+
+Este módulo define os motores (engines) plugáveis usados por utils/chat_storage.py
+para persistir conversas em disco. Todos expõem a mesma interface, de modo que o
+restante da aplicação não precisa saber qual formato está em uso.
+
+Motores disponíveis:
+- JsonFileEngine: formato original, um arquivo conversation_<id>.json reescrito
+  por inteiro a cada alteração
+- AppendLogEngine: log append-only em JSON Lines (conversation_<id>.jsonl), onde
+  adicionar uma mensagem é uma única escrita do tamanho da mensagem
+- SqliteEngine: banco SQLite (data/chat.sqlite3) em modo WAL, com tabelas
+  conversations e messages; paginação e edição viram consultas de uma linha/faixa
+
+Formato do log (uma linha JSON por registro):
+- {"type": "header", "id", "title", "timestamp", "version", "memory"?}  primeira linha
+- {"type": "message", "message": {...}}                      nova mensagem
+- {"type": "update", "message_id", "content", "updated_at", "blob"?, "token_count"?}  edição de mensagem
+- {"type": "meta", "title", "timestamp"}                     alteração de metadados
+- {"type": "memory", "memory"}                              resumo acumulado da conversa
+
+Edições e alterações de metadados são acumuladas no final do log e periodicamente
+"dobradas" (compactação) em um novo log contendo apenas o cabeçalho e as mensagens.
+
+Índice de posições do log (conversation_<id>.idx, binário): um cabeçalho com o
+tamanho do log coberto e uma entrada de tamanho fixo por mensagem com a posição em
+bytes do registro da mensagem e da sua última edição. Ler uma página de mensagens
+custa alguns seeks no log, sem interpretar o arquivo inteiro. O índice é derivado
+do log: se estiver ausente ou desatualizado (ex.: após uma queda), é reconstruído.
+
+A codificação dos documentos vem de utils/serializers.py: o JsonFileEngine grava no
+formato configurado (JSON compacto ou msgpack) e lê qualquer formato suportado; o log
+usa sempre JSON, codificado com orjson quando disponível.
+
+Mensagens com conteúdo grande guardam em content apenas uma prévia e, no campo
+"blob", a referência ao conteúdo completo (ver utils/blob_store.py). O campo
+"token_count" guarda a contagem de tokens de content (ver utils/context_builder.py).
+Os motores apenas persistem esses campos, sem interpretá-los. O mesmo vale para o
+campo "memory" da conversa, o resumo acumulado das mensagens antigas
+(ver utils/conversation_memory.py).
+
+Operações de escrita agrupáveis (usadas por commit e pelo cache de conversas):
+- ("append", message, title)
+- ("update", message_id, content, updated_at, blob, token_count)
+- ("meta", title, timestamp)
+- ("memory", memory)  substitui o resumo acumulado (dict ou None)
+- ("save",)  regrava a conversa completa
+"""
+
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+from array import array
+
+from utils.atomic_file import atomic_write
+from utils.conversation_index import ConversationIndex
+from utils.serializers import get_serializer, loads as load_document, text_serializer
+
+# Quantidade de registros de edição/metadados tolerada antes de compactar o log
+LOG_COMPACTION_THRESHOLD = 50
+LOG_FORMAT_VERSION = 1
+
+# Formato do índice de posições: (assinatura, tamanho do log coberto) + entradas
+# (posição do registro da mensagem, posição da última edição ou -1)
+OFFSET_INDEX_MAGIC = b"CHATIDX1"
+OFFSET_INDEX_HEADER = struct.Struct("<8sQ")
+OFFSET_INDEX_ENTRY = struct.Struct("<qq")
+
+
+def apply_update(message, content, updated_at, blob=None, token_count=None):
+    """
+    Aplica a edição de uma mensagem: novo conteúdo (ou prévia), referência ao blob e
+    contagem de tokens. Sem blob ou sem contagem, os valores anteriores são removidos.
+    """
+    message["content"] = content
+    message["updated_at"] = updated_at
+    if blob:
+        message["blob"] = blob
+    else:
+        message.pop("blob", None)
+    if token_count:
+        message["token_count"] = token_count
+    else:
+        message.pop("token_count", None)
+
+
+def set_conversation_memory(conversation, memory):
+    """Substitui (ou remove, com None) o resumo acumulado da conversa."""
+    if memory:
+        conversation["memory"] = memory
+    else:
+        conversation.pop("memory", None)
+
+
+def build_meta(conversation):
+    """
+    Gera o resumo de metadados de uma conversa completa.
+
+    Args:
+        conversation (dict): Objeto de conversa com campos id, title, timestamp e messages
+
+    Returns:
+        dict: Metadados com id, title, timestamp, message_count e user_message_count
+    """
+    messages = conversation.get("messages", [])
+    return {
+        "id": conversation["id"],
+        "title": conversation.get("title", "Nova conversa"),
+        "timestamp": conversation["timestamp"],
+        "message_count": len(messages),
+        "user_message_count": sum(1 for m in messages if m.get("role") == "user")
+    }
+
+
+class StorageEngine:
+    """
+    Interface comum dos motores de armazenamento de conversas.
+    """
+
+    name = "base"
+    # Nomes de arquivo reconhecidos como conversas deste motor (grupo 1 = ID)
+    FILE_PATTERN = re.compile(r'^conversation_(.+)\.json$')
+
+    def __init__(self, conversations_dir, serializer=None):
+        """
+        Args:
+            conversations_dir (str): Diretório onde os arquivos de conversa são gravados
+            serializer (str, optional): Nome do serializador (ver utils/serializers.py)
+        """
+        self.conversations_dir = conversations_dir
+        self.serializer = get_serializer(serializer)
+
+    def filename(self, conversation_id):
+        """Nome do arquivo principal da conversa neste motor."""
+        raise NotImplementedError
+
+    def filepath(self, conversation_id):
+        """Caminho completo do arquivo principal da conversa neste motor."""
+        return os.path.join(self.conversations_dir, self.filename(conversation_id))
+
+    def exists(self, conversation_id):
+        """Indica se a conversa existe no armazenamento."""
+        return os.path.exists(self.filepath(conversation_id))
+
+    def list_ids(self):
+        """
+        Lista os IDs de todas as conversas armazenadas, com uma única leitura do diretório.
+
+        Returns:
+            set: IDs das conversas
+        """
+        ids = set()
+        try:
+            with os.scandir(self.conversations_dir) as it:
+                for item in it:
+                    match = self.FILE_PATTERN.match(item.name)
+                    if match:
+                        ids.add(match.group(1))
+        except FileNotFoundError:
+            pass
+        return ids
+
+    def load(self, conversation_id):
+        """Carrega a conversa completa. Lança FileNotFoundError se ela não existir."""
+        raise NotImplementedError
+
+    def load_messages(self, conversation_id, offset, limit):
+        """
+        Carrega uma faixa de mensagens da conversa, para paginação.
+
+        Args:
+            conversation_id (str): ID da conversa
+            offset (int): Índice da primeira mensagem
+            limit (int): Número máximo de mensagens
+
+        Returns:
+            tuple: (lista de mensagens, total de mensagens da conversa)
+        """
+        messages = self.load(conversation_id)["messages"]
+        return messages[offset:offset + limit], len(messages)
+
+    def iter_messages(self, conversation_id, after=None, limit=None, batch_size=100):
+        """
+        Percorre as mensagens da conversa em ordem, lendo-as em lotes com load_messages.
+
+        Args:
+            conversation_id (str): ID da conversa
+            after (int, optional): Posição (seq) da última mensagem já lida
+            limit (int, optional): Número máximo de mensagens
+            batch_size (int): Mensagens lidas por acesso ao armazenamento
+
+        Yields:
+            tuple: (seq, mensagem)
+        """
+        seq = 0 if after is None else after + 1
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = batch_size if remaining is None else min(batch_size, remaining)
+            messages, total = self.load_messages(conversation_id, seq, size)
+            for message in messages:
+                yield seq, message
+                seq += 1
+            if remaining is not None:
+                remaining -= len(messages)
+            if not messages or seq >= total:
+                return
+
+    def create_index(self, index_file):
+        """Cria o índice de conversas adequado a este motor."""
+        return ConversationIndex(index_file)
+
+    def load_meta(self, conversation_id):
+        """
+        Carrega apenas os metadados da conversa (ver build_meta).
+        Motores que mantêm estado em memória podem sobrescrever para evitar a leitura completa.
+        """
+        try:
+            return build_meta(self.load(conversation_id))
+        except FileNotFoundError:
+            return None
+
+    def save(self, conversation):
+        """Grava a conversa completa, substituindo o conteúdo anterior."""
+        raise NotImplementedError
+
+    def append_message(self, conversation_id, message, title=None):
+        """
+        Adiciona uma mensagem ao final da conversa, criando-a se necessário.
+        O timestamp da conversa passa a ser o da mensagem.
+
+        Args:
+            conversation_id (str): ID da conversa
+            message (dict): Mensagem completa (message_id, role, content, timestamp)
+            title (str, optional): Novo título da conversa, se deve ser alterado
+        """
+        raise NotImplementedError
+
+    def update_message(self, conversation_id, message_id, content, updated_at, blob=None, token_count=None):
+        """
+        Substitui o conteúdo de uma mensagem (ver apply_update).
+        Retorna False se ela não existir.
+        """
+        raise NotImplementedError
+
+    def set_meta(self, conversation_id, title, timestamp):
+        """Altera título e timestamp da conversa. Retorna False se ela não existir."""
+        raise NotImplementedError
+
+    def set_memory(self, conversation_id, memory):
+        """Substitui o resumo acumulado da conversa. Retorna False se ela não existir."""
+        raise NotImplementedError
+
+    def delete(self, conversation_id):
+        """Remove a conversa do armazenamento."""
+        raise NotImplementedError
+
+    def commit(self, conversation, ops):
+        """
+        Aplica um grupo de operações pendentes de uma conversa de uma só vez.
+        A implementação padrão aplica uma a uma; os motores sobrescrevem para
+        gravar o grupo inteiro em uma única escrita sincronizada em disco.
+
+        Args:
+            conversation (dict): Estado atual da conversa, já com as operações aplicadas
+            ops (list): Operações na ordem em que ocorreram (ver docstring do módulo)
+        """
+        conversation_id = conversation["id"]
+        for op in ops:
+            kind = op[0]
+            if kind == "save":
+                self.save(conversation)
+            elif kind == "append":
+                self.append_message(conversation_id, op[1], title=op[2])
+            elif kind == "update":
+                self.update_message(conversation_id, *op[1:])
+            elif kind == "meta":
+                self.set_meta(conversation_id, op[1], op[2])
+            elif kind == "memory":
+                self.set_memory(conversation_id, op[1])
+        return True
+
+
+class JsonFileEngine(StorageEngine):
+    """
+    Motor original: cada conversa é um documento JSON completo, reescrito a cada alteração
+    (em um arquivo temporário que substitui o original atomicamente).
+    """
+
+    name = "json"
+
+    def filename(self, conversation_id):
+        return f"conversation_{conversation_id}.json"
+
+    def load(self, conversation_id):
+        with open(self.filepath(conversation_id), 'rb') as f:
+            # O formato é detectado pelo conteúdo: arquivos antigos continuam legíveis
+            return load_document(f.read())
+
+    def save(self, conversation, fsync=False):
+        atomic_write(self.filepath(conversation["id"]), self.serializer.dumps(conversation), fsync=fsync)
+        return True
+
+    def commit(self, conversation, ops):
+        # O documento já reflete todas as operações: basta uma regravação
+        return self.save(conversation, fsync=True)
+
+    def append_message(self, conversation_id, message, title=None):
+        try:
+            conversation = self.load(conversation_id)
+        except FileNotFoundError:
+            conversation = {
+                "id": conversation_id,
+                "title": "Nova conversa",
+                "timestamp": message["timestamp"],
+                "messages": []
+            }
+        conversation["messages"].append(message)
+        conversation["timestamp"] = message["timestamp"]
+        if title is not None:
+            conversation["title"] = title
+        return self.save(conversation)
+
+    def update_message(self, conversation_id, message_id, content, updated_at, blob=None, token_count=None):
+        conversation = self.load(conversation_id)
+        for message in conversation["messages"]:
+            if message.get("message_id") == message_id:
+                apply_update(message, content, updated_at, blob, token_count)
+                return self.save(conversation)
+        return False
+
+    def set_meta(self, conversation_id, title, timestamp):
+        conversation = self.load(conversation_id)
+        conversation["title"] = title
+        conversation["timestamp"] = timestamp
+        return self.save(conversation)
+
+    def set_memory(self, conversation_id, memory):
+        conversation = self.load(conversation_id)
+        set_conversation_memory(conversation, memory)
+        return self.save(conversation)
+
+    def delete(self, conversation_id):
+        filepath = self.filepath(conversation_id)
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        return True
+
+
+class AppendLogEngine(StorageEngine):
+    """
+    Motor append-only: cada conversa é um log JSON Lines.
+
+    O motor mantém em memória um pequeno estado por conversa (metadados, mapa
+    message_id -> posição, posições em bytes dos registros e número de registros
+    pendentes de compactação), montado na primeira escrita ou consulta de metadados
+    (load() não o altera, para não disputar com um commit em andamento). A partir daí
+    adicionar ou editar uma mensagem é uma única escrita em modo append, sem reler
+    o arquivo. As posições também são gravadas no índice conversation_<id>.idx, que
+    permite paginar conversas que ainda não foram carregadas.
+
+    Conversas ainda no formato antigo (conversation_<id>.json) continuam legíveis e
+    são convertidas para o log na primeira escrita.
+    """
+
+    name = "log"
+    # Inclui as conversas ainda no formato antigo
+    FILE_PATTERN = re.compile(r'^conversation_(.+)\.jsonl?$')
+
+    def __init__(self, conversations_dir, serializer=None, compaction_threshold=LOG_COMPACTION_THRESHOLD):
+        super().__init__(conversations_dir, serializer)
+        self.compaction_threshold = compaction_threshold
+        # Cada registro ocupa uma linha: o log exige um formato textual
+        self._codec = text_serializer(self.serializer)
+        self._legacy = JsonFileEngine(conversations_dir, serializer)
+        self._states = {}
+
+    def filename(self, conversation_id):
+        return f"conversation_{conversation_id}.jsonl"
+
+    def exists(self, conversation_id):
+        return os.path.exists(self.filepath(conversation_id)) or self._legacy.exists(conversation_id)
+
+    def offset_index_path(self, conversation_id):
+        """Caminho do índice de posições da conversa."""
+        return os.path.join(self.conversations_dir, f"conversation_{conversation_id}.idx")
+
+    # ---- Leitura ----
+
+    def _encode(self, record):
+        return self._codec.dumps(record) + b"\n"
+
+    def _replay(self, conversation_id):
+        """
+        Lê o log inteiro e reconstrói a conversa e o estado em memória.
+
+        Returns:
+            tuple: (conversa, estado) ou (None, None) se o log não existir
+        """
+        conversation = None
+        message_index = {}
+        message_offsets = array('q')
+        update_offsets = array('q')
+        pending = 0
+        needs_newline = False
+        size = 0
+
+        with open(self.filepath(conversation_id), 'rb') as f:
+            for line_number, line in enumerate(f, start=1):
+                position = size
+                size += len(line)
+                needs_newline = not line.endswith(b"\n")
+                if not line.strip():
+                    continue
+                try:
+                    record = self._codec.loads(line)
+                except ValueError:
+                    # Linha truncada por uma escrita interrompida: ignora e segue
+                    print(f"[ERRO-PYTHON] Registro inválido na linha {line_number} do log da conversa {conversation_id}")
+                    continue
+
+                kind = record.get("type")
+                if kind == "header":
+                    conversation = {
+                        "id": record["id"],
+                        "title": record.get("title", "Nova conversa"),
+                        "timestamp": record["timestamp"],
+                        "messages": []
+                    }
+                    set_conversation_memory(conversation, record.get("memory"))
+                elif conversation is None:
+                    continue
+                elif kind == "message":
+                    message = record["message"]
+                    message_index[message.get("message_id")] = len(conversation["messages"])
+                    conversation["messages"].append(message)
+                    conversation["timestamp"] = message["timestamp"]
+                    message_offsets.append(position)
+                    update_offsets.append(-1)
+                elif kind == "update":
+                    seq = message_index.get(record["message_id"])
+                    if seq is not None:
+                        apply_update(
+                            conversation["messages"][seq], record["content"], record["updated_at"],
+                            record.get("blob"), record.get("token_count")
+                        )
+                        update_offsets[seq] = position
+                    pending += 1
+                elif kind == "meta":
+                    conversation["title"] = record["title"]
+                    conversation["timestamp"] = record["timestamp"]
+                    pending += 1
+                elif kind == "memory":
+                    set_conversation_memory(conversation, record.get("memory"))
+                    pending += 1
+
+        if conversation is None:
+            return None, None
+
+        state = build_meta(conversation)
+        state["memory"] = conversation.get("memory")
+        state["message_index"] = message_index
+        state["message_offsets"] = message_offsets
+        state["update_offsets"] = update_offsets
+        state["pending"] = pending
+        state["needs_newline"] = needs_newline
+        state["size"] = size
+        return conversation, state
+
+    def load(self, conversation_id):
+        """
+        Lê a conversa completa. Não altera o estado em memória, que pertence ao
+        caminho de escrita: uma leitura concorrente com um commit não pode
+        substituí-lo por uma versão anterior ao append.
+        """
+        if not os.path.exists(self.filepath(conversation_id)):
+            if self._legacy.exists(conversation_id):
+                return self._legacy.load(conversation_id)
+            raise FileNotFoundError(self.filepath(conversation_id))
+
+        conversation, _ = self._replay(conversation_id)
+        if conversation is None:
+            raise json.JSONDecodeError("Log sem cabeçalho", "", 0)
+        return conversation
+
+    def load_messages(self, conversation_id, offset, limit):
+        """
+        Lê apenas as mensagens pedidas, localizando-as pelas posições em memória ou
+        pelo índice de posições. Sem índice válido, monta o estado em memória (uma
+        leitura completa do log, que também reconstrói o índice).
+        """
+        if not os.path.exists(self.filepath(conversation_id)):
+            return super().load_messages(conversation_id, offset, limit)
+
+        state = self._states.get(conversation_id)
+        located = None
+        if state is None:
+            located = self._read_offset_index(conversation_id, offset, limit)
+            if located is None:
+                state = self._get_state(conversation_id)
+        if state is not None:
+            end = offset + limit
+            located = (
+                list(zip(state["message_offsets"][offset:end], state["update_offsets"][offset:end])),
+                len(state["message_offsets"])
+            )
+
+        if located is not None:
+            entries, total = located
+            try:
+                return self._read_messages_at(conversation_id, entries), total
+            except (ValueError, KeyError):
+                print(f"[ERRO-PYTHON] Índice de posições inconsistente para a conversa {conversation_id}; relendo o log")
+
+        return super().load_messages(conversation_id, offset, limit)
+
+    def _read_messages_at(self, conversation_id, entries):
+        """
+        Lê mensagens do log a partir das posições (mensagem, última edição).
+        Lança ValueError se alguma posição não apontar para o registro esperado.
+        """
+        messages = []
+        with open(self.filepath(conversation_id), 'rb') as f:
+            for message_offset, update_offset in entries:
+                f.seek(message_offset)
+                record = self._codec.loads(f.readline())
+                if record.get("type") != "message":
+                    raise ValueError("Posição não aponta para uma mensagem")
+                message = record["message"]
+                if update_offset >= 0:
+                    f.seek(update_offset)
+                    update = self._codec.loads(f.readline())
+                    if update.get("type") != "update" or update.get("message_id") != message.get("message_id"):
+                        raise ValueError("Posição não aponta para a edição da mensagem")
+                    apply_update(
+                        message, update["content"], update["updated_at"], update.get("blob"), update.get("token_count")
+                    )
+                messages.append(message)
+        return messages
+
+    # ---- Índice de posições ----
+
+    def _offset_index_current(self, conversation_id, size):
+        """Indica se o índice de posições existe e cobre exatamente o log atual."""
+        try:
+            with open(self.offset_index_path(conversation_id), 'rb') as f:
+                header = f.read(OFFSET_INDEX_HEADER.size)
+        except FileNotFoundError:
+            return False
+        if len(header) != OFFSET_INDEX_HEADER.size:
+            return False
+        magic, covered = OFFSET_INDEX_HEADER.unpack(header)
+        return magic == OFFSET_INDEX_MAGIC and covered == size
+
+    def _read_offset_index(self, conversation_id, offset, limit):
+        """
+        Lê do índice de posições apenas as entradas da faixa pedida.
+
+        Returns:
+            tuple: (lista de (posição da mensagem, posição da edição), total de mensagens)
+                   ou None se o índice estiver ausente ou desatualizado
+        """
+        try:
+            with open(self.offset_index_path(conversation_id), 'rb') as f:
+                header = f.read(OFFSET_INDEX_HEADER.size)
+                if len(header) != OFFSET_INDEX_HEADER.size:
+                    return None
+                magic, covered = OFFSET_INDEX_HEADER.unpack(header)
+                if magic != OFFSET_INDEX_MAGIC or covered != os.path.getsize(self.filepath(conversation_id)):
+                    return None
+                total = (os.fstat(f.fileno()).st_size - OFFSET_INDEX_HEADER.size) // OFFSET_INDEX_ENTRY.size
+                offset = min(offset, total)
+                count = max(0, min(limit, total - offset))
+                f.seek(OFFSET_INDEX_HEADER.size + offset * OFFSET_INDEX_ENTRY.size)
+                raw = f.read(count * OFFSET_INDEX_ENTRY.size)
+        except FileNotFoundError:
+            return None
+        if len(raw) != count * OFFSET_INDEX_ENTRY.size:
+            return None
+        return list(OFFSET_INDEX_ENTRY.iter_unpack(raw)), total
+
+    def _write_offset_index(self, conversation_id, state):
+        """Regrava o índice de posições inteiro a partir do estado em memória."""
+        entries = b"".join(
+            OFFSET_INDEX_ENTRY.pack(m, u) for m, u in zip(state["message_offsets"], state["update_offsets"])
+        )
+        try:
+            # O índice é derivado do log e pode ser reconstruído: dispensa o fsync
+            atomic_write(
+                self.offset_index_path(conversation_id),
+                OFFSET_INDEX_HEADER.pack(OFFSET_INDEX_MAGIC, state["size"]) + entries,
+                fsync=False
+            )
+        except OSError as e:
+            print(f"[ERRO-PYTHON] Falha ao gravar índice de posições da conversa {conversation_id}: {str(e)}")
+
+    def _patch_offset_index(self, conversation_id, state, first_new, updated):
+        """
+        Atualiza no lugar as entradas alteradas por uma escrita em append:
+        as mensagens a partir de first_new e as edições das posições em updated.
+        O cabeçalho, com o novo tamanho do log, é gravado por último.
+        """
+        path = self.offset_index_path(conversation_id)
+        message_offsets = state["message_offsets"]
+        update_offsets = state["update_offsets"]
+        try:
+            with open(path, 'r+b') as f:
+                for seq in sorted(updated):
+                    if seq < first_new:
+                        f.seek(OFFSET_INDEX_HEADER.size + seq * OFFSET_INDEX_ENTRY.size)
+                        f.write(OFFSET_INDEX_ENTRY.pack(message_offsets[seq], update_offsets[seq]))
+                if first_new < len(message_offsets):
+                    f.seek(OFFSET_INDEX_HEADER.size + first_new * OFFSET_INDEX_ENTRY.size)
+                    f.write(b"".join(
+                        OFFSET_INDEX_ENTRY.pack(message_offsets[seq], update_offsets[seq])
+                        for seq in range(first_new, len(message_offsets))
+                    ))
+                f.seek(0)
+                f.write(OFFSET_INDEX_HEADER.pack(OFFSET_INDEX_MAGIC, state["size"]))
+        except FileNotFoundError:
+            self._write_offset_index(conversation_id, state)
+
+    def _get_state(self, conversation_id):
+        """
+        Retorna o estado em memória da conversa, convertendo arquivos antigos para o log.
+        Retorna None se a conversa não existir.
+        """
+        state = self._states.get(conversation_id)
+        if state is not None:
+            return state
+
+        if not os.path.exists(self.filepath(conversation_id)):
+            if not self._legacy.exists(conversation_id):
+                return None
+            # Conversão única do formato antigo para o log
+            self.save(self._legacy.load(conversation_id))
+            return self._states[conversation_id]
+
+        conversation, state = self._replay(conversation_id)
+        if conversation is None:
+            raise json.JSONDecodeError("Log sem cabeçalho", "", 0)
+        # Se outra chamada já montou o estado (e talvez gravou depois da leitura), ele prevalece
+        installed = self._states.setdefault(conversation_id, state)
+        if installed is state and not self._offset_index_current(conversation_id, state["size"]):
+            self._write_offset_index(conversation_id, state)
+        return installed
+
+    def load_meta(self, conversation_id):
+        state = self._get_state(conversation_id)
+        if state is None:
+            return None
+        return {key: state[key] for key in ("id", "title", "timestamp", "message_count", "user_message_count")}
+
+    # ---- Escrita ----
+
+    def _append_records(self, conversation_id, records, fsync=False):
+        """
+        Grava os registros no final do log em uma única escrita e atualiza as posições.
+
+        Args:
+            records (list): Pares (seq da mensagem afetada ou None, registro)
+        """
+        state = self._states[conversation_id]
+        chunks = [b"\n"] if state["needs_newline"] else []
+        with open(self.filepath(conversation_id), 'ab') as f:
+            position = f.seek(0, os.SEEK_END) + len(chunks)
+            new_messages = []
+            new_updates = {}
+            for seq, record in records:
+                data = self._encode(record)
+                if record["type"] == "message":
+                    new_messages.append(position)
+                elif record["type"] == "update":
+                    new_updates[seq] = position
+                chunks.append(data)
+                position += len(data)
+            f.write(b"".join(chunks))
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        state["needs_newline"] = False
+        state["size"] = position
+
+        # As posições só passam a valer depois que a escrita foi concluída
+        first_new = len(state["message_offsets"])
+        for message_offset in new_messages:
+            state["message_offsets"].append(message_offset)
+            state["update_offsets"].append(-1)
+        for seq, update_offset in new_updates.items():
+            state["update_offsets"][seq] = update_offset
+        self._patch_offset_index(conversation_id, state, first_new, new_updates)
+
+    def _records_for(self, conversation_id, ops):
+        """
+        Converte operações em registros do log, atualizando o estado em memória.
+        Edições de mensagens inexistentes são descartadas.
+
+        Returns:
+            list: Pares (seq da mensagem afetada ou None, registro)
+        """
+        state = self._states[conversation_id]
+        records = []
+        for op in ops:
+            kind = op[0]
+            if kind == "append":
+                _, message, title = op
+                records.append((state["message_count"], {"type": "message", "message": message}))
+                state["message_index"][message.get("message_id")] = state["message_count"]
+                state["message_count"] += 1
+                if message.get("role") == "user":
+                    state["user_message_count"] += 1
+                state["timestamp"] = message["timestamp"]
+                if title is not None:
+                    records.append((None, {"type": "meta", "title": title, "timestamp": message["timestamp"]}))
+                    state["title"] = title
+                    state["pending"] += 1
+            elif kind == "update":
+                _, message_id, content, updated_at, blob, token_count = op
+                seq = state["message_index"].get(message_id)
+                if seq is None:
+                    continue
+                record = {
+                    "type": "update",
+                    "message_id": message_id,
+                    "content": content,
+                    "updated_at": updated_at
+                }
+                if blob:
+                    record["blob"] = blob
+                if token_count:
+                    record["token_count"] = token_count
+                records.append((seq, record))
+                state["pending"] += 1
+            elif kind == "meta":
+                _, title, timestamp = op
+                records.append((None, {"type": "meta", "title": title, "timestamp": timestamp}))
+                state["title"] = title
+                state["timestamp"] = timestamp
+                state["pending"] += 1
+            elif kind == "memory":
+                records.append((None, {"type": "memory", "memory": op[1]}))
+                state["memory"] = op[1]
+                state["pending"] += 1
+        return records
+
+    def _write_ops(self, conversation_id, ops, fsync=False):
+        records = self._records_for(conversation_id, ops)
+        if records:
+            self._append_records(conversation_id, records, fsync=fsync)
+        self._maybe_compact(conversation_id, fsync=fsync)
+        return bool(records)
+
+    def save(self, conversation, fsync=False):
+        """Reescreve o log compactado (cabeçalho + mensagens) e substitui o anterior atomicamente."""
+        conversation_id = conversation["id"]
+        filepath = self.filepath(conversation_id)
+        records = [{
+            "type": "header",
+            "id": conversation_id,
+            "title": conversation.get("title", "Nova conversa"),
+            "timestamp": conversation["timestamp"],
+            "version": LOG_FORMAT_VERSION
+        }]
+        if conversation.get("memory"):
+            records[0]["memory"] = conversation["memory"]
+        records.extend({"type": "message", "message": message} for message in conversation.get("messages", []))
+
+        chunks = [self._encode(record) for record in records]
+        atomic_write(filepath, b"".join(chunks), fsync=fsync)
+
+        # O arquivo antigo deixa de ser a fonte de verdade após a conversão
+        if self._legacy.exists(conversation_id):
+            self._legacy.delete(conversation_id)
+
+        state = build_meta(conversation)
+        state["memory"] = conversation.get("memory")
+        state["message_index"] = {
+            m.get("message_id"): i for i, m in enumerate(conversation.get("messages", []))
+        }
+        # Posições de cada mensagem no log recém-gravado (o cabeçalho ocupa a primeira linha)
+        state["message_offsets"] = array('q')
+        position = len(chunks[0])
+        for chunk in chunks[1:]:
+            state["message_offsets"].append(position)
+            position += len(chunk)
+        state["update_offsets"] = array('q', [-1]) * len(state["message_offsets"])
+        state["pending"] = 0
+        state["needs_newline"] = False
+        state["size"] = position
+        self._states[conversation_id] = state
+        self._write_offset_index(conversation_id, state)
+        return True
+
+    def compact(self, conversation_id, fsync=True):
+        """
+        Dobra edições e alterações de metadados em um novo log. As mensagens são lidas
+        pelas posições do estado em memória (sem reler o log inteiro), e o novo log é
+        gravado com o mesmo fsync da escrita que disparou a compactação.
+        """
+        state = self._get_state(conversation_id)
+        if state is None:
+            return False
+        conversation = {
+            "id": conversation_id,
+            "title": state["title"],
+            "timestamp": state["timestamp"],
+            "messages": self._read_messages_at(
+                conversation_id, zip(state["message_offsets"], state["update_offsets"])
+            )
+        }
+        set_conversation_memory(conversation, state.get("memory"))
+        return self.save(conversation, fsync=fsync)
+
+    def _maybe_compact(self, conversation_id, fsync=False):
+        if self._states[conversation_id]["pending"] >= self.compaction_threshold:
+            try:
+                self.compact(conversation_id, fsync=fsync)
+            except (OSError, ValueError, KeyError) as e:
+                # Os registros já foram gravados: a compactação fica para a próxima escrita
+                print(f"[ERRO-PYTHON] Falha ao compactar o log da conversa {conversation_id}: {str(e)}")
+
+    def append_message(self, conversation_id, message, title=None):
+        if self._get_state(conversation_id) is None:
+            self.save({
+                "id": conversation_id,
+                "title": "Nova conversa",
+                "timestamp": message["timestamp"],
+                "messages": []
+            })
+        self._write_ops(conversation_id, [("append", message, title)])
+        return True
+
+    def update_message(self, conversation_id, message_id, content, updated_at, blob=None, token_count=None):
+        if self._get_state(conversation_id) is None:
+            return False
+        return self._write_ops(conversation_id, [("update", message_id, content, updated_at, blob, token_count)])
+
+    def set_meta(self, conversation_id, title, timestamp):
+        if self._get_state(conversation_id) is None:
+            return False
+        return self._write_ops(conversation_id, [("meta", title, timestamp)])
+
+    def set_memory(self, conversation_id, memory):
+        if self._get_state(conversation_id) is None:
+            return False
+        return self._write_ops(conversation_id, [("memory", memory)])
+
+    def commit(self, conversation, ops):
+        """Grava o grupo de operações com uma única escrita e um único fsync."""
+        conversation_id = conversation["id"]
+        if any(op[0] == "save" for op in ops) or self._get_state(conversation_id) is None:
+            # O estado em memória já contém tudo: uma regravação completa basta
+            return self.save(conversation, fsync=True)
+        self._write_ops(conversation_id, ops, fsync=True)
+        return True
+
+    def delete(self, conversation_id):
+        self._states.pop(conversation_id, None)
+        for path in (self.filepath(conversation_id), self.offset_index_path(conversation_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._legacy.delete(conversation_id)
+        return True
+
+
+class SqliteEngine(StorageEngine):
+    """
+    Motor baseado no módulo sqlite3 da biblioteca padrão.
+
+    Usa uma única conexão (protegida por lock) em modo WAL, o que permite leituras
+    concorrentes com a escrita. As consultas são strings constantes, então o cache de
+    statements do sqlite3 reaproveita os comandos já preparados.
+
+    Campos da mensagem além de message_id, role, content, timestamp e updated_at são
+    preservados na coluna extra (JSON).
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            user_message_count INTEGER NOT NULL DEFAULT 0,
+            memory TEXT
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            message_id TEXT,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            updated_at TEXT,
+            extra TEXT,
+            PRIMARY KEY (conversation_id, seq)
+        );
+        CREATE INDEX IF NOT EXISTS idx_messages_message_id ON messages (conversation_id, message_id);
+        CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (conversation_id, timestamp);
+        CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations (timestamp);
+    """
+
+    MESSAGE_COLUMNS = ("message_id", "role", "content", "timestamp", "updated_at")
+
+    def __init__(self, conversations_dir, serializer=None, database_path=None):
+        """
+        Args:
+            conversations_dir (str): Diretório das conversas (usado para localizar o banco)
+            serializer (str, optional): Ignorado; as mensagens ficam em colunas do banco
+            database_path (str, optional): Caminho do banco; padrão é <data>/chat.sqlite3
+        """
+        super().__init__(conversations_dir, serializer)
+        self.database_path = database_path or os.path.join(
+            os.path.dirname(os.path.abspath(conversations_dir)), "chat.sqlite3"
+        )
+        os.makedirs(os.path.dirname(self.database_path), exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.database_path, check_same_thread=False, cached_statements=256)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+        # Bancos criados antes da coluna memory
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(conversations)")}
+        if "memory" not in columns:
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN memory TEXT")
+
+    def filename(self, conversation_id):
+        return os.path.basename(self.database_path)
+
+    def exists(self, conversation_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row is not None
+
+    def list_ids(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT id FROM conversations").fetchall()
+        return {row["id"] for row in rows}
+
+    def create_index(self, index_file):
+        return SqliteConversationIndex(self)
+
+    # ---- Conversão de linhas ----
+
+    def _message_to_row(self, conversation_id, seq, message):
+        extra = {k: v for k, v in message.items() if k not in self.MESSAGE_COLUMNS}
+        return (
+            conversation_id, seq, message.get("message_id"), message["role"], message["content"],
+            message["timestamp"], message.get("updated_at"),
+            json.dumps(extra, ensure_ascii=False) if extra else None
+        )
+
+    @staticmethod
+    def _row_to_message(row):
+        message = {
+            "message_id": row["message_id"],
+            "role": row["role"],
+            "content": row["content"],
+            "timestamp": row["timestamp"]
+        }
+        if row["updated_at"] is not None:
+            message["updated_at"] = row["updated_at"]
+        if row["extra"]:
+            message.update(json.loads(row["extra"]))
+        return message
+
+    # ---- Leitura ----
+
+    def _conversation_row(self, conversation_id):
+        row = self._conn.execute(
+            "SELECT id, title, timestamp, message_count, user_message_count FROM conversations WHERE id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"Conversa não encontrada: {conversation_id}")
+        return row
+
+    def load(self, conversation_id):
+        with self._lock:
+            row = self._conversation_row(conversation_id)
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY seq", (conversation_id,)
+            ).fetchall()
+            memory = self._conn.execute(
+                "SELECT memory FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()["memory"]
+        conversation = {
+            "id": row["id"],
+            "title": row["title"],
+            "timestamp": row["timestamp"],
+            "messages": [self._row_to_message(r) for r in rows]
+        }
+        set_conversation_memory(conversation, json.loads(memory) if memory else None)
+        return conversation
+
+    def load_meta(self, conversation_id):
+        with self._lock:
+            try:
+                return dict(self._conversation_row(conversation_id))
+            except FileNotFoundError:
+                return None
+
+    def load_messages(self, conversation_id, offset, limit):
+        with self._lock:
+            row = self._conversation_row(conversation_id)
+            # seq é contínuo a partir de 0: a faixa é lida pela chave primária, sem OFFSET
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (conversation_id, offset, offset + limit)
+            ).fetchall()
+        return [self._row_to_message(r) for r in rows], row["message_count"]
+
+    # ---- Escrita ----
+
+    # Os métodos _op_* executam dentro da transação aberta pelo chamador
+
+    def _op_save(self, conversation):
+        conversation_id = conversation["id"]
+        meta = build_meta(conversation)
+        self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        memory = conversation.get("memory")
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations (id, title, timestamp, message_count, user_message_count, memory) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (conversation_id, meta["title"], meta["timestamp"], meta["message_count"], meta["user_message_count"],
+             json.dumps(memory, ensure_ascii=False) if memory else None)
+        )
+        self._conn.executemany(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [self._message_to_row(conversation_id, seq, m) for seq, m in enumerate(conversation.get("messages", []))]
+        )
+        return True
+
+    def _op_append(self, conversation_id, message, title):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO conversations (id, title, timestamp) VALUES (?, 'Nova conversa', ?)",
+            (conversation_id, message["timestamp"])
+        )
+        seq = self._conn.execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()[0]
+        self._conn.execute(
+            "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._message_to_row(conversation_id, seq, message)
+        )
+        self._conn.execute(
+            "UPDATE conversations SET timestamp = ?, title = COALESCE(?, title), "
+            "message_count = message_count + 1, user_message_count = user_message_count + ? WHERE id = ?",
+            (message["timestamp"], title, 1 if message.get("role") == "user" else 0, conversation_id)
+        )
+        return True
+
+    def _op_update(self, conversation_id, message_id, content, updated_at, blob=None, token_count=None):
+        row = self._conn.execute(
+            "SELECT extra FROM messages WHERE conversation_id = ? AND message_id = ?",
+            (conversation_id, message_id)
+        ).fetchone()
+        if row is None:
+            return False
+        # Blob e contagem de tokens ficam junto dos demais campos extras da mensagem
+        extra = json.loads(row["extra"]) if row["extra"] else {}
+        for key, value in (("blob", blob), ("token_count", token_count)):
+            if value:
+                extra[key] = value
+            else:
+                extra.pop(key, None)
+        self._conn.execute(
+            "UPDATE messages SET content = ?, updated_at = ?, extra = ? WHERE conversation_id = ? AND message_id = ?",
+            (content, updated_at, json.dumps(extra, ensure_ascii=False) if extra else None, conversation_id, message_id)
+        )
+        return True
+
+    def _op_meta(self, conversation_id, title, timestamp):
+        cursor = self._conn.execute(
+            "UPDATE conversations SET title = ?, timestamp = ? WHERE id = ?",
+            (title, timestamp, conversation_id)
+        )
+        return cursor.rowcount > 0
+
+    def _op_memory(self, conversation_id, memory):
+        cursor = self._conn.execute(
+            "UPDATE conversations SET memory = ? WHERE id = ?",
+            (json.dumps(memory, ensure_ascii=False) if memory else None, conversation_id)
+        )
+        return cursor.rowcount > 0
+
+    def save(self, conversation):
+        with self._lock, self._conn:
+            return self._op_save(conversation)
+
+    def append_message(self, conversation_id, message, title=None):
+        with self._lock, self._conn:
+            return self._op_append(conversation_id, message, title)
+
+    def update_message(self, conversation_id, message_id, content, updated_at, blob=None, token_count=None):
+        with self._lock, self._conn:
+            return self._op_update(conversation_id, message_id, content, updated_at, blob, token_count)
+
+    def set_meta(self, conversation_id, title, timestamp):
+        with self._lock, self._conn:
+            return self._op_meta(conversation_id, title, timestamp)
+
+    def set_memory(self, conversation_id, memory):
+        with self._lock, self._conn:
+            return self._op_memory(conversation_id, memory)
+
+    def commit(self, conversation, ops):
+        """Aplica o grupo de operações em uma única transação."""
+        conversation_id = conversation["id"]
+        with self._lock, self._conn:
+            if any(op[0] == "save" for op in ops):
+                return self._op_save(conversation)
+            for op in ops:
+                kind = op[0]
+                if kind == "append":
+                    self._op_append(conversation_id, op[1], op[2])
+                elif kind == "update":
+                    self._op_update(conversation_id, *op[1:])
+                elif kind == "meta":
+                    self._op_meta(conversation_id, op[1], op[2])
+                elif kind == "memory":
+                    self._op_memory(conversation_id, op[1])
+        return True
+
+    def delete(self, conversation_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        return True
+
+
+class SqliteConversationIndex:
+    """
+    Índice de conversas servido diretamente pela tabela conversations do SqliteEngine.
+    Expõe a mesma interface de ConversationIndex.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def _entry(self, row):
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "timestamp": row["timestamp"],
+            "filename": self.engine.filename(row["id"])
+        }
+
+    def put(self, entry):
+        with self.engine._lock, self.engine._conn:
+            # Cria a linha se a conversa ainda estiver apenas no cache de escrita
+            self.engine._conn.execute(
+                "INSERT INTO conversations (id, title, timestamp) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET title = excluded.title, timestamp = excluded.timestamp",
+                (entry["id"], entry.get("title", "Nova conversa"), entry["timestamp"])
+            )
+
+    def remove(self, conversation_id):
+        # A linha da conversa é removida pelo próprio SqliteEngine.delete
+        return True
+
+    def get(self, conversation_id):
+        with self.engine._lock:
+            row = self.engine._conn.execute(
+                "SELECT id, title, timestamp FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def entries(self):
+        with self.engine._lock:
+            rows = self.engine._conn.execute(
+                "SELECT id, title, timestamp FROM conversations ORDER BY timestamp DESC, id DESC"
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def page(self, limit, after=None):
+        with self.engine._lock:
+            if after is None:
+                rows = self.engine._conn.execute(
+                    "SELECT id, title, timestamp FROM conversations "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ?", (limit + 1,)
+                ).fetchall()
+            else:
+                rows = self.engine._conn.execute(
+                    "SELECT id, title, timestamp FROM conversations "
+                    "WHERE timestamp < ? OR (timestamp = ? AND id < ?) "
+                    "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                    (after[0], after[0], after[1], limit + 1)
+                ).fetchall()
+        entries = [self._entry(row) for row in rows[:limit]]
+        has_more = len(rows) > limit
+        return entries, ((entries[-1]["timestamp"], entries[-1]["id"]) if has_more else None)
+
+    def __len__(self):
+        with self.engine._lock:
+            return self.engine._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def __contains__(self, conversation_id):
+        return self.engine.exists(conversation_id)
+
+    def checkpoint(self):
+        """Incorpora o WAL ao arquivo principal do banco."""
+        with self.engine._lock:
+            self.engine._conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return True
+
+
+ENGINES = {
+    JsonFileEngine.name: JsonFileEngine,
+    AppendLogEngine.name: AppendLogEngine,
+    SqliteEngine.name: SqliteEngine,
+}
+
+
+def create_engine(name, conversations_dir, serializer=None):
+    """
+    Instancia o motor de armazenamento pelo nome.
+
+    Args:
+        name (str): Nome do motor ('json', 'log' ou 'sqlite')
+        conversations_dir (str): Diretório das conversas
+        serializer (str, optional): Nome do serializador (ver utils/serializers.py)
+
+    Returns:
+        StorageEngine: Instância do motor escolhido
+    """
+    try:
+        engine_class = ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Motor de armazenamento desconhecido: {name}")
+    return engine_class(conversations_dir, serializer)
@@ -0,0 +1,517 @@
+"""
+Emissão de Trechos em Streaming
+
+O modelo produz a resposta em trechos de poucos caracteres, e cada trecho virava
+um evento Socket.IO (e uma linha de log). Com várias conversas ao mesmo tempo isso
+significa milhares de quadros pequenos por segundo. Este módulo agrupa os trechos
+de uma mensagem em quadros:
+
+- Um quadro é enviado quando passa o tempo (STREAM_FRAME_MS desde o primeiro
+  trecho pendente) ou o tamanho (STREAM_FRAME_BYTES) do quadro. O prazo é
+  cumprido por uma tarefa em background mesmo que o modelo pare de produzir
+  trechos (ex.: pausa antes de um bloco de código), para o texto pendente não
+  ficar parado até o próximo trecho.
+- O primeiro trecho sai imediatamente, para o cliente ver o início da resposta
+  sem atraso, e um fim de frase antecipa o envio quando já há algum texto
+  pendente (STREAM_MIN_SENTENCE_BYTES).
+- Se os clientes não estão dando conta (fila de envio acima de
+  STREAM_MAX_BACKLOG pacotes, ou o envio em si demora mais que um quadro), o
+  orçamento de tempo e tamanho dobra, até STREAM_MAX_BACKOFF vezes, e a produção
+  pausa por um quadro para a fila escoar; com os envios em dia ele volta ao normal.
+
+Configuração por variáveis de ambiente:
+- STREAM_FRAME_MS: tempo máximo de um trecho pendente, em ms (padrão 30)
+- STREAM_FRAME_BYTES: tamanho máximo de um quadro (padrão 512)
+- STREAM_MIN_SENTENCE_BYTES: tamanho mínimo para enviar em fim de frase (padrão 48)
+- STREAM_MAX_BACKLOG: pacotes na fila de um cliente considerados atraso (padrão 64)
+- STREAM_MAX_BACKOFF: multiplicador máximo do orçamento sob atraso (padrão 8)
+
+O texto já recebido de cada mensagem fica em um StreamBuffer: os trechos são
+guardados em uma lista e unidos uma única vez ao final, em vez de concatenar a
+string inteira a cada trecho (custo quadrático em respostas com milhares de
+trechos).
+
+As mensagens em andamento ficam em um StreamRegistry. Cada quadro enviado recebe
+um número de sequência (seq), e um cliente que reconecta no meio da resposta pede
+só os quadros a partir do último seq que recebeu, em vez de recarregar a conversa.
+As sessões concluídas (ou com erro) continuam disponíveis por STREAM_SESSION_TTL
+segundos, e o texto guardado nelas é limitado a STREAM_REGISTRY_MAX_BYTES. Sessões
+em andamento nunca são descartadas, mesmo paradas (ex.: aguardando na fila do
+modelo): resume_stream e o cancelamento precisam encontrá-las até o fim.
+
+- STREAM_SESSION_TTL: validade das sessões após a conclusão (padrão 300)
+- STREAM_REGISTRY_MAX_BYTES: texto máximo guardado em sessões concluídas (padrão 32 MB)
+
+Cada sessão tem um CancelToken: cancelar a geração (pedido do cliente ou sala
+vazia) executa os callbacks registrados, que fecham as respostas HTTP em
+andamento, e quem aguarda na fila do modelo desiste (GenerationCancelled).
+
+- STREAM_ABANDON_GRACE: segundos com a sala da conversa vazia até as gerações
+  serem canceladas (padrão 10; dá tempo de o cliente reconectar)
+"""
+
+import os
+import threading
+import time
+
+STREAM_FRAME_MS = float(os.environ.get("STREAM_FRAME_MS", "30"))
+STREAM_FRAME_BYTES = int(os.environ.get("STREAM_FRAME_BYTES", "512"))
+STREAM_MIN_SENTENCE_BYTES = int(os.environ.get("STREAM_MIN_SENTENCE_BYTES", "48"))
+STREAM_MAX_BACKLOG = int(os.environ.get("STREAM_MAX_BACKLOG", "64"))
+STREAM_MAX_BACKOFF = int(os.environ.get("STREAM_MAX_BACKOFF", "8"))
+STREAM_SESSION_TTL = float(os.environ.get("STREAM_SESSION_TTL", "300"))
+STREAM_REGISTRY_MAX_BYTES = int(os.environ.get("STREAM_REGISTRY_MAX_BYTES", str(32 * 1024 * 1024)))
+STREAM_ABANDON_GRACE = float(os.environ.get("STREAM_ABANDON_GRACE", "10"))
+
+SENTENCE_BOUNDARY = ('.', '!', '?', '…', ':', ';', '\n')
+
+
+class StreamBuffer:
+    """
+    Texto de uma mensagem em construção, como uma lista de trechos.
+
+    append é O(1); snapshot une os trechos recebidos até o momento (para clientes
+    que entram no meio da resposta) e guarda o resultado como um único trecho, de
+    modo que o texto já unido não é unido de novo na próxima chamada.
+    """
+
+    def __init__(self, initial=""):
+        self._chunks = [initial] if initial else []
+        self._length = len(initial)
+        self._lock = threading.Lock()
+
+    def append(self, chunk):
+        """Acrescenta um trecho ao final."""
+        if chunk:
+            with self._lock:
+                self._chunks.append(chunk)
+                self._length += len(chunk)
+
+    def __iadd__(self, chunk):
+        self.append(chunk)
+        return self
+
+    def snapshot(self):
+        """
+        Returns:
+            str: Texto recebido até o momento
+        """
+        with self._lock:
+            if len(self._chunks) > 1:
+                self._chunks = ["".join(self._chunks)]
+            return self._chunks[0] if self._chunks else ""
+
+    def getvalue(self):
+        """Texto completo (mesmo que snapshot; usado ao final da mensagem)."""
+        return self.snapshot()
+
+    def __str__(self):
+        return self.snapshot()
+
+    def __len__(self):
+        return self._length
+
+    def __bool__(self):
+        return self._length > 0
+
+
+class ChunkEmitter:
+    """
+    Agrupa os trechos de uma mensagem em quadros e os envia por send(quadro).
+    """
+
+    def __init__(self, send, frame_ms=STREAM_FRAME_MS, frame_bytes=STREAM_FRAME_BYTES,
+                 min_sentence_bytes=STREAM_MIN_SENTENCE_BYTES, backlog=None,
+                 max_backlog=STREAM_MAX_BACKLOG, max_backoff=STREAM_MAX_BACKOFF,
+                 sleep=time.sleep, clock=time.monotonic, spawn=None):
+        """
+        Args:
+            send (callable): Envia um quadro (str) ao cliente
+            frame_ms (float): Tempo máximo de um trecho pendente, em ms
+            frame_bytes (int): Tamanho máximo de um quadro em bytes
+            min_sentence_bytes (int): Tamanho mínimo para enviar em fim de frase
+            backlog (callable, optional): Retorna quantos pacotes aguardam envio
+                                          no cliente mais atrasado
+            max_backlog (int): Fila a partir da qual o cliente é considerado atrasado
+            max_backoff (int): Multiplicador máximo do orçamento sob atraso
+            sleep (callable): Pausa cooperativa (socketio.sleep com eventlet)
+            clock (callable): Relógio monotônico em segundos
+            spawn (callable, optional): Inicia uma tarefa em background
+                                        (socketio.start_background_task com eventlet);
+                                        sem ele o prazo só é verificado quando chega
+                                        um novo trecho
+        """
+        self.send = send
+        self.frame_seconds = frame_ms / 1000.0
+        self.frame_bytes = max(1, frame_bytes)
+        self.min_sentence_bytes = min_sentence_bytes
+        self.backlog = backlog
+        self.max_backlog = max_backlog
+        self.max_backoff = max(1, max_backoff)
+        self.sleep = sleep
+        self.clock = clock
+        self.spawn = spawn
+        # Protege os trechos pendentes e mantém a ordem dos quadros entre push e o prazo
+        self._lock = threading.Lock()
+        self._timer_active = False
+        self._closed = False
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_since = None
+        self._backoff = 1
+        self.chunks = 0
+        self.frames = 0
+        self.bytes = 0
+        self.send_seconds = 0.0
+        self.throttled = 0
+
+    def push(self, chunk):
+        """
+        Acrescenta um trecho, enviando o quadro se o orçamento foi atingido.
+
+        Returns:
+            str: Quadro enviado ou None se o trecho ficou pendente
+        """
+        if not chunk:
+            return None
+        now = self.clock()
+        with self._lock:
+            self._pending.append(chunk)
+            self._pending_bytes += len(chunk.encode('utf-8'))
+            self.chunks += 1
+            if self._pending_since is None:
+                self._pending_since = now
+            flush = self._should_flush(chunk, now)
+            start_timer = not flush and self.spawn is not None and not self._timer_active
+            if start_timer:
+                self._timer_active = True
+        if flush:
+            return self.flush()
+        if start_timer:
+            self.spawn(self._deadline_loop)
+        return None
+
+    def _should_flush(self, chunk, now):
+        if self.frames == 0:
+            # Primeiro trecho sem espera
+            return True
+        if self._pending_bytes >= self.frame_bytes * self._backoff:
+            return True
+        if now - self._pending_since >= self.frame_seconds * self._backoff:
+            return True
+        return (self._backoff == 1 and self._pending_bytes >= self.min_sentence_bytes
+                and chunk.rstrip(' ').endswith(SENTENCE_BOUNDARY))
+
+    def flush(self):
+        """
+        Envia o que estiver pendente.
+
+        Returns:
+            str: Quadro enviado ou None se não havia nada pendente
+        """
+        with self._lock:
+            if not self._pending:
+                return None
+            frame = "".join(self._pending)
+            size = self._pending_bytes
+            self._pending = []
+            self._pending_bytes = 0
+            self._pending_since = None
+
+            # O envio fica dentro do lock para os quadros saírem na ordem
+            start = self.clock()
+            self.send(frame)
+            elapsed = self.clock() - start
+            self.frames += 1
+            self.bytes += size
+            self.send_seconds += elapsed
+
+            backlog = self.backlog() if self.backlog else 0
+            pause = 0
+            if elapsed > self.frame_seconds or backlog > self.max_backlog:
+                # Clientes atrasados: quadros maiores e uma pausa para a fila escoar
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                self.throttled += 1
+                pause = self.frame_seconds * self._backoff
+            elif self._backoff > 1:
+                self._backoff //= 2
+        if pause:
+            self.sleep(pause)
+        return frame
+
+    def _deadline_loop(self):
+        """Envia o texto pendente quando vence o prazo, enquanto houver algo pendente."""
+        while True:
+            with self._lock:
+                if self._closed or not self._pending:
+                    self._timer_active = False
+                    return
+                remaining = self._pending_since + self.frame_seconds * self._backoff - self.clock()
+            if remaining > 0:
+                self.sleep(remaining)
+            else:
+                self.flush()
+
+    def close(self):
+        """Envia o restante ao fim da mensagem e encerra a tarefa do prazo."""
+        with self._lock:
+            self._closed = True
+        return self.flush()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Trechos recebidos, quadros e bytes enviados, tempo gasto enviando
+                  e quantas vezes o envio foi desacelerado
+        """
+        return {
+            "chunks": self.chunks,
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "send_seconds": self.send_seconds,
+            "throttled": self.throttled
+        }
+
+
+class GenerationCancelled(Exception):
+    """A geração foi cancelada antes de começar."""
+
+
+class CancelToken:
+    """
+    Sinal de cancelamento compartilhado entre quem cancela e quem está gerando.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.reason = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def is_cancelled(self):
+        return self.event.is_set()
+
+    def on_cancel(self, callback):
+        """
+        Registra um callback chamado no cancelamento (imediatamente, se já cancelado).
+
+        Returns:
+            callable: Remove o callback (para quando o recurso já foi liberado)
+        """
+        with self._lock:
+            if not self.event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def cancel(self, reason=None):
+        """
+        Cancela e executa os callbacks registrados.
+
+        Returns:
+            bool: False se já estava cancelado
+        """
+        with self._lock:
+            if self.event.is_set():
+                return False
+            self.reason = reason
+            self.event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+        return True
+
+
+class StreamSession:
+    """
+    Mensagem em streaming: o texto já enviado e onde começa cada quadro.
+    """
+
+    def __init__(self, message_id, conversation_id, clock=time.monotonic):
+        self.message_id = message_id
+        self.conversation_id = conversation_id
+        self.content = StreamBuffer()
+        self.complete = False
+        self.error = None
+        self.cancel_token = CancelToken()
+        self.clock = clock
+        self.updated = clock()
+        # Posição no texto em que começa cada quadro (índice = seq)
+        self._offsets = []
+        self._lock = threading.Lock()
+
+    def add_frame(self, frame):
+        """
+        Registra um quadro enviado ao cliente.
+
+        Returns:
+            int: Número de sequência do quadro
+        """
+        with self._lock:
+            seq = len(self._offsets)
+            self._offsets.append(len(self.content))
+            self.content.append(frame)
+            self.updated = self.clock()
+            return seq
+
+    @property
+    def next_seq(self):
+        """Número de sequência do próximo quadro."""
+        return len(self._offsets)
+
+    def replay(self, from_seq=0):
+        """
+        Texto enviado a partir de um quadro.
+
+        Args:
+            from_seq (int): Primeiro quadro que o cliente não recebeu
+
+        Returns:
+            tuple: (texto a partir de from_seq, seq do próximo quadro)
+        """
+        with self._lock:
+            next_seq = len(self._offsets)
+            from_seq = max(0, from_seq)
+            if from_seq >= next_seq:
+                return "", next_seq
+            return self.content.snapshot()[self._offsets[from_seq]:], next_seq
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.is_cancelled()
+
+    def cancel(self, reason=None):
+        """
+        Cancela a geração da mensagem; o texto já gerado é mantido.
+
+        Returns:
+            bool: False se a mensagem já estava concluída ou cancelada
+        """
+        if self.complete:
+            return False
+        return self.cancel_token.cancel(reason)
+
+    def finish(self, error=None):
+        """Marca a mensagem como concluída (ou interrompida por erro)."""
+        self.complete = True
+        self.error = error
+        self.updated = self.clock()
+
+
+class StreamRegistry:
+    """
+    Sessões de streaming por message_id, com validade e limite de memória.
+    """
+
+    def __init__(self, ttl=STREAM_SESSION_TTL, max_bytes=STREAM_REGISTRY_MAX_BYTES, clock=time.monotonic):
+        """
+        Args:
+            ttl (float): Segundos após a conclusão até a sessão ser descartada
+            max_bytes (int): Texto máximo guardado somando as sessões concluídas
+            clock (callable): Relógio monotônico em segundos
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def start(self, message_id, conversation_id):
+        """
+        Cria a sessão de uma mensagem (substituindo uma anterior com o mesmo id).
+
+        Returns:
+            StreamSession: Sessão criada
+        """
+        session = StreamSession(message_id, conversation_id, clock=self.clock)
+        with self._lock:
+            self._sessions[message_id] = session
+        self.evict()
+        return session
+
+    def get(self, message_id):
+        """
+        Returns:
+            StreamSession: Sessão da mensagem ou None se não existir ou tiver expirado
+        """
+        self.evict()
+        return self._sessions.get(message_id)
+
+    def finish(self, message_id, error=None):
+        """Marca a sessão como concluída; ela fica disponível por mais ttl segundos."""
+        session = self._sessions.get(message_id)
+        if session is not None:
+            session.finish(error)
+        self.evict()
+
+    def cancel(self, message_id, reason=None):
+        """
+        Cancela a geração de uma mensagem.
+
+        Returns:
+            bool: True se havia uma geração em andamento
+        """
+        session = self._sessions.get(message_id)
+        return session.cancel(reason) if session is not None else False
+
+    def cancel_conversation(self, conversation_id, reason=None):
+        """
+        Cancela todas as gerações em andamento de uma conversa.
+
+        Returns:
+            int: Quantas foram canceladas
+        """
+        return sum(1 for session in self.active(conversation_id) if session.cancel(reason))
+
+    def discard(self, message_id):
+        """Remove a sessão imediatamente."""
+        with self._lock:
+            self._sessions.pop(message_id, None)
+
+    def active(self, conversation_id):
+        """
+        Returns:
+            list: Sessões em andamento da conversa
+        """
+        return [session for session in list(self._sessions.values())
+                if session.conversation_id == conversation_id and not session.complete]
+
+    def evict(self):
+        """
+        Remove as sessões concluídas há mais de ttl segundos e, se o texto guardado
+        nas concluídas passar de max_bytes, as mais antigas entre elas. Sessões em
+        andamento são sempre mantidas.
+        """
+        now = self.clock()
+        with self._lock:
+            finished = []
+            for message_id, session in list(self._sessions.items()):
+                if not session.complete:
+                    continue
+                if now - session.updated > self.ttl:
+                    del self._sessions[message_id]
+                else:
+                    finished.append(session)
+            total = sum(len(session.content) for session in finished)
+            if total <= self.max_bytes:
+                return
+            for session in sorted(finished, key=lambda item: item.updated):
+                if total <= self.max_bytes:
+                    break
+                total -= len(session.content)
+                del self._sessions[session.message_id]
+
+    def __contains__(self, message_id):
+        return message_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
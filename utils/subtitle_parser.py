@@ -0,0 +1,135 @@
+"""
+Leitura de Legendas WebVTT/SRT
+
+Este módulo converte arquivos de legenda em texto corrido em uma única passada,
+linha a linha, sem carregar o arquivo inteiro nem aplicar várias substituições
+sobre o conteúdo completo. O arquivo é lido em blocos separados por linhas em
+branco: blocos sem linha de tempo (cabeçalho WEBVTT, NOTE, STYLE, REGION) são
+ignorados, e nas pistas (cues) as linhas antes da linha de tempo são
+identificadores e as seguintes são o texto.
+
+As legendas automáticas do YouTube repetem a linha anterior em cada pista (efeito
+"rolagem"), então as duplicatas são sempre próximas: basta comparar cada linha com
+uma janela das últimas DEDUP_WINDOW linhas emitidas, em vez de um conjunto com
+todas as linhas do arquivo.
+
+Cada linha de texto é produzida como um Segment com o início e o fim (em segundos)
+da pista em que apareceu pela primeira vez, para quem precisar dos tempos.
+"""
+
+import html
+import re
+from collections import deque, namedtuple
+
+# Linhas recentes comparadas para descartar repetições
+DEDUP_WINDOW = 8
+
+Segment = namedtuple("Segment", ["start", "end", "text"])
+
+# "00:01:02.345 --> 00:01:04.000 align:start" (VTT) ou "00:01:02,345 --> 00:01:04,000" (SRT);
+# as horas são opcionais no VTT
+TIMING_PATTERN = re.compile(
+    r'^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s*-->\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+# Tags de formatação e de tempo (<c>, <i>, <00:00:01.234>), posicionamento ({\an8})
+# e anotações entre colchetes ([Música])
+MARKUP_PATTERN = re.compile(r'<[^>]*>|\{\\an\d\}|\[[^\]]*\]')
+
+
+def parse_timestamp(value):
+    """
+    Converte um tempo de legenda (HH:MM:SS.mmm, MM:SS.mmm ou com vírgula) em segundos.
+
+    Args:
+        value (str): Tempo no formato da legenda
+
+    Returns:
+        float: Tempo em segundos
+    """
+    parts = value.replace(',', '.').split(':')
+    seconds = float(parts[-1])
+    minutes = int(parts[-2]) if len(parts) >= 2 else 0
+    hours = int(parts[-3]) if len(parts) >= 3 else 0
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def clean_line(line):
+    """Remove marcações de uma linha de texto da legenda."""
+    return html.unescape(MARKUP_PATTERN.sub('', line)).strip()
+
+
+def _decode(raw):
+    # Decodificação por linha: arquivos com alguns bytes inválidos não exigem reler tudo
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', errors='replace')
+
+
+def iter_segments(lines, dedup_window=DEDUP_WINDOW):
+    """
+    Percorre as linhas de uma legenda e produz as linhas de texto, sem repetições.
+
+    Args:
+        lines (iterable): Linhas do arquivo (bytes ou str), como um arquivo aberto
+        dedup_window (int): Linhas recentes comparadas para descartar repetições
+
+    Yields:
+        Segment: (início, fim, texto) de cada linha de texto nova
+    """
+    recent = deque(maxlen=max(1, dedup_window))
+    timing = None
+    cue_has_text = False
+
+    for raw in lines:
+        line = _decode(raw) if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n').lstrip('\ufeff')
+
+        if not line.strip():
+            # Fim do bloco. As legendas do YouTube trazem uma linha com um espaço logo
+            # após a linha de tempo, que não encerra a pista.
+            if timing is None or cue_has_text:
+                timing = None
+            continue
+
+        match = TIMING_PATTERN.match(line)
+        if match:
+            timing = (parse_timestamp(match.group(1)), parse_timestamp(match.group(2)))
+            cue_has_text = False
+            continue
+        if timing is None:
+            # Antes da linha de tempo: cabeçalho, NOTE/STYLE ou identificador da pista
+            continue
+
+        cue_has_text = True
+        text = clean_line(line)
+        if not text or text in recent:
+            continue
+        recent.append(text)
+        yield Segment(timing[0], timing[1], text)
+
+
+def parse_subtitle_file(path, dedup_window=DEDUP_WINDOW):
+    """
+    Lê um arquivo de legenda em uma única passada.
+
+    Args:
+        path (str): Caminho do arquivo .vtt ou .srt
+        dedup_window (int): Linhas recentes comparadas para descartar repetições
+
+    Returns:
+        list: Segments na ordem do arquivo
+    """
+    with open(path, 'rb') as f:
+        return list(iter_segments(f, dedup_window))
+
+
+def subtitle_text(path, dedup_window=DEDUP_WINDOW):
+    """
+    Lê um arquivo de legenda e retorna o texto corrido.
+
+    Returns:
+        str: Linhas de texto unidas por espaço
+    """
+    with open(path, 'rb') as f:
+        return ' '.join(segment.text for segment in iter_segments(f, dedup_window))
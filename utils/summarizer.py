@@ -0,0 +1,181 @@
+"""
+Resumo Map-Reduce de Transcrições
+
+Este módulo implementa o resumo em blocos usado pelo /youtube_resumo. Os blocos da
+transcrição são resumidos em paralelo (map) por um número limitado de workers, igual
+ao número de requisições que o Ollama atende simultaneamente (OLLAMA_NUM_PARALLEL),
+e um passo final (reduce) gera um resumo geral a partir dos resumos dos blocos.
+
+Os blocos podem vir de um gerador (ex.: iter_chunks de utils/transcript_chunker.py):
+cada worker pede o próximo bloco quando fica livre, então só os blocos em andamento
+ficam em memória e o total só é conhecido quando o gerador termina.
+
+Mesmo com os blocos sendo gerados fora de ordem, os eventos são produzidos na ordem
+dos blocos: o trecho do bloco atual é repassado assim que chega e os trechos dos
+blocos seguintes ficam em um buffer de reordenação até que chegue a vez deles.
+
+Eventos produzidos por MapReduceSummarizer.run (tuplas):
+- ("block_start", índice, bloco)
+- ("block_chunk", índice, trecho)
+- ("block_error", índice, exceção)
+- ("block_end", índice, resumo completo do bloco)
+- ("reduce_start",)
+- ("reduce_chunk", trecho)
+
+Os workers são threads comuns (greenthreads quando o Eventlet está ativo). Se o
+consumidor parar de ler os eventos, os workers encerram as chamadas em andamento
+e não iniciam novos blocos.
+"""
+
+import os
+import queue
+import threading
+
+from utils.streaming import StreamBuffer
+
+# Requisições simultâneas atendidas pelo Ollama (mesma variável usada pelo servidor)
+SUMMARY_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+
+
+class MapReduceSummarizer:
+    """
+    Resume uma sequência de blocos em paralelo e combina os resultados.
+    """
+
+    def __init__(self, map_fn, reduce_fn=None, concurrency=SUMMARY_CONCURRENCY):
+        """
+        Args:
+            map_fn (callable): Recebe um bloco e retorna um iterável de trechos do resumo
+            reduce_fn (callable, optional): Recebe a lista de resumos dos blocos e retorna
+                                            um iterável de trechos do resumo geral
+            concurrency (int): Número máximo de blocos resumidos ao mesmo tempo
+        """
+        self.map_fn = map_fn
+        self.reduce_fn = reduce_fn
+        self.concurrency = max(1, concurrency)
+
+    def _next_chunk(self, source, state):
+        """Retira o próximo bloco da fonte, com seu índice; (None, None) ao final."""
+        with state["lock"]:
+            if state["exhausted"]:
+                return None, None
+            try:
+                chunk = next(source)
+            except StopIteration:
+                state["exhausted"] = True
+                return None, None
+            except Exception as e:
+                # O erro da fonte é repassado por run, que o relança
+                state["exhausted"] = True
+                state["error"] = e
+                return None, None
+            index = state["pulled"]
+            state["pulled"] += 1
+            return index, chunk
+
+    def _worker(self, source, state, results, stop):
+        while not stop.is_set():
+            index, chunk = self._next_chunk(source, state)
+            if index is None:
+                results.put((None, "exhausted", None))
+                return
+            results.put((index, "start", chunk))
+            try:
+                pieces = self.map_fn(chunk)
+                try:
+                    for piece in pieces:
+                        if stop.is_set():
+                            break
+                        results.put((index, "chunk", piece))
+                finally:
+                    # Encerra o gerador (e a resposta HTTP) se a leitura parou no meio
+                    close = getattr(pieces, "close", None)
+                    if close:
+                        close()
+            except Exception as e:
+                results.put((index, "error", e))
+            results.put((index, "done", None))
+
+    def run(self, chunks):
+        """
+        Resume os blocos, produzindo os eventos na ordem dos blocos.
+
+        Args:
+            chunks (iterable): Blocos de texto a resumir, lidos sob demanda
+
+        Yields:
+            tuple: Eventos descritos na documentação do módulo
+        """
+        source = iter(chunks)
+        state = {"lock": threading.Lock(), "pulled": 0, "exhausted": False, "error": None}
+        results = queue.Queue()
+        stop = threading.Event()
+
+        for _ in range(self.concurrency):
+            threading.Thread(
+                target=self._worker, args=(source, state, results, stop),
+                name="summary-worker", daemon=True
+            ).start()
+
+        # Blocos em andamento e resumos, por índice
+        blocks = {}
+        summaries = {}
+        buffered = {}
+        errors = {}
+        done = set()
+        current = 0
+        announced = False
+        total = None
+
+        try:
+            while total is None or current < total:
+                index, kind, payload = results.get()
+                if kind == "exhausted":
+                    if state["error"] is not None:
+                        raise state["error"]
+                    if total is None:
+                        with state["lock"]:
+                            total = state["pulled"]
+                elif kind == "start":
+                    blocks[index] = payload
+                    summaries[index] = StreamBuffer()
+                elif kind == "chunk":
+                    summaries[index].append(payload)
+                    if index == current and announced:
+                        yield ("block_chunk", index, payload)
+                    else:
+                        # Buffer de reordenação: o bloco ainda não é o da vez
+                        buffered.setdefault(index, []).append(payload)
+                elif kind == "error":
+                    errors[index] = payload
+                elif kind == "done":
+                    done.add(index)
+
+                # Avança pelos blocos já iniciados e concluídos, liberando o que estava no buffer
+                while True:
+                    if not announced and current in blocks:
+                        yield ("block_start", current, blocks[current])
+                        announced = True
+                        for piece in buffered.pop(current, []):
+                            yield ("block_chunk", current, piece)
+                    if not announced or current not in done:
+                        break
+                    if current in errors:
+                        yield ("block_error", current, errors[current])
+                    summaries[current] = summaries[current].getvalue()
+                    yield ("block_end", current, summaries[current])
+                    # O bloco já foi resumido: não precisa mais ficar em memória
+                    del blocks[current]
+                    current += 1
+                    announced = False
+        finally:
+            stop.set()
+
+        if self.reduce_fn is None:
+            return
+        block_summaries = [summaries[i] for i in range(total) if i not in errors and summaries[i].strip()]
+        if len(block_summaries) < 2:
+            return
+        yield ("reduce_start",)
+        for piece in self.reduce_fn(block_summaries):
+            yield ("reduce_chunk", piece)
@@ -0,0 +1,93 @@
+"""
+Contagem de Tokens
+
+Este módulo estima quantos tokens um texto ocupa no contexto do modelo, para que o
+histórico enviado à IA caiba em um orçamento de tokens (ver utils/context_builder.py).
+O tokenizador é escolhido pela variável de ambiente CHAT_TOKENIZER:
+- "auto" (padrão): tiktoken se estiver instalado, senão a estimativa por caracteres
+- "chars": estimativa rápida de ~4 caracteres por token, sem dependências
+- "tiktoken": contagem exata do codificador cl100k_base (pacote opcional tiktoken);
+  não é o tokenizador do Gemma, mas erra bem menos que a estimativa em textos longos
+
+As contagens guardadas nas mensagens ficam associadas ao nome do tokenizador, então
+trocar a configuração apenas faz com que elas sejam recalculadas.
+"""
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - dependência opcional
+    tiktoken = None
+
+# Caracteres por token usados pela estimativa
+CHARS_PER_TOKEN = 4
+
+
+class CharEstimateTokenizer:
+    """Estimativa de ~4 caracteres por token; custo desprezível."""
+
+    name = "chars"
+
+    def count(self, text):
+        """Retorna o número estimado de tokens do texto."""
+        if not text:
+            return 0
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def truncate(self, text, max_tokens):
+        """Retorna o começo do texto com no máximo max_tokens tokens."""
+        return text[:max(0, max_tokens) * CHARS_PER_TOKEN]
+
+
+class TiktokenTokenizer:
+    """Contagem pelo codificador cl100k_base do tiktoken."""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding="cl100k_base"):
+        self.encoding = tiktoken.get_encoding(encoding)
+
+    def count(self, text):
+        if not text:
+            return 0
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text, max_tokens):
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max(0, max_tokens)])
+
+
+def available_tokenizers():
+    """
+    Lista os tokenizadores utilizáveis neste ambiente.
+
+    Returns:
+        dict: nome -> classe
+    """
+    tokenizers = {"chars": CharEstimateTokenizer}
+    if tiktoken is not None:
+        tokenizers["tiktoken"] = TiktokenTokenizer
+    return tokenizers
+
+
+def get_tokenizer(name=None):
+    """
+    Retorna o tokenizador pelo nome.
+
+    Args:
+        name (str, optional): 'auto', 'chars' ou 'tiktoken'; None equivale a 'auto'
+
+    Returns:
+        Tokenizer: Instância com os métodos count(text) e truncate(text, max_tokens)
+
+    Raises:
+        ValueError: Se o nome for desconhecido ou a dependência não estiver instalada
+    """
+    tokenizers = available_tokenizers()
+    if name in (None, "auto"):
+        return (tokenizers.get("tiktoken") or tokenizers["chars"])()
+    try:
+        return tokenizers[name]()
+    except KeyError:
+        raise ValueError(f"Tokenizador indisponível: {name}")
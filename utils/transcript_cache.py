@@ -0,0 +1,132 @@
+"""
+Cache de Transcrições do YouTube
+
+Processar de novo o mesmo vídeo (ou usar /youtube e depois /youtube_resumo) repetia
+todo o caminho de rede do yt-dlp e a limpeza das legendas. Este módulo guarda em
+disco a transcrição já limpa (também linha a linha, com os tempos) e o título do
+vídeo, com a chave sendo o ID do vídeo e o idioma da legenda, e é consultado antes
+de o yt-dlp ser chamado.
+
+As entradas usam o mesmo armazenamento do cache de respostas do LLM
+(utils/response_cache.py): um arquivo JSON por entrada, ordem LRU pelo mtime,
+limite de tamanho e validade.
+
+Configuração por variáveis de ambiente:
+- YOUTUBE_TRANSCRIPT_CACHE_ENABLED: "0" desativa o cache (padrão "1")
+- YOUTUBE_TRANSCRIPT_CACHE_DIR: diretório das entradas (padrão data/transcripts)
+- YOUTUBE_TRANSCRIPT_CACHE_MAX_BYTES: tamanho máximo em disco (padrão 256 MB)
+- YOUTUBE_TRANSCRIPT_CACHE_TTL: validade das entradas em segundos (padrão 30 dias)
+"""
+
+import os
+import re
+from urllib.parse import parse_qs, urlparse
+
+from utils.response_cache import ResponseCache
+
+TRANSCRIPT_CACHE_ENABLED = os.environ.get("YOUTUBE_TRANSCRIPT_CACHE_ENABLED", "1") == "1"
+TRANSCRIPT_CACHE_DIR = os.environ.get("YOUTUBE_TRANSCRIPT_CACHE_DIR", os.path.join("data", "transcripts"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.environ.get("YOUTUBE_TRANSCRIPT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+TRANSCRIPT_CACHE_TTL = float(os.environ.get("YOUTUBE_TRANSCRIPT_CACHE_TTL", str(30 * 24 * 3600)))
+
+# IDs de vídeo do YouTube: 11 caracteres do alfabeto base64 para URLs
+VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+# Caminhos em que o ID aparece como segmento: /embed/ID, /shorts/ID, /live/ID, /v/ID, /e/ID
+VIDEO_ID_PATH_PREFIXES = ("embed", "shorts", "live", "v", "e")
+YOUTUBE_HOSTS = ("youtube.com", "youtube-nocookie.com")
+
+_transcript_cache = None
+
+
+def extract_video_id(url):
+    """
+    Extrai o ID do vídeo das formas comuns de URL do YouTube:
+    youtube.com/watch?v=ID, youtu.be/ID, youtube.com/embed|shorts|live|v/ID,
+    youtube-nocookie.com/embed/ID (com ou sem www., m. ou music.) ou o próprio ID.
+
+    Args:
+        url (str): URL (ou ID) do vídeo
+
+    Returns:
+        str: ID do vídeo ou None se não for reconhecido
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if VIDEO_ID_PATTERN.match(url):
+        return url
+    if "://" not in url:
+        url = "https://" + url
+
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    segments = [segment for segment in parsed.path.split("/") if segment]
+    candidate = None
+
+    if host == "youtu.be" or host.endswith(".youtu.be"):
+        candidate = segments[0] if segments else None
+    elif any(host == domain or host.endswith("." + domain) for domain in YOUTUBE_HOSTS):
+        query = parse_qs(parsed.query)
+        if segments[:1] == ["watch"] or (not segments and "v" in query):
+            candidate = (query.get("v") or [None])[0]
+        elif len(segments) >= 2 and segments[0] in VIDEO_ID_PATH_PREFIXES:
+            candidate = segments[1]
+
+    if candidate and VIDEO_ID_PATTERN.match(candidate):
+        return candidate
+    return None
+
+
+class TranscriptCache(ResponseCache):
+    """
+    Transcrições limpas por (ID do vídeo, idioma).
+    """
+
+    def __init__(self, directory=TRANSCRIPT_CACHE_DIR, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES, ttl=TRANSCRIPT_CACHE_TTL):
+        super().__init__(directory, max_bytes, ttl)
+
+    def get_transcript(self, video_id, languages):
+        """
+        Procura a transcrição do vídeo nos idiomas informados, na ordem de prioridade.
+
+        Args:
+            video_id (str): ID do vídeo
+            languages (list): Idiomas em ordem de preferência (ex.: ['pt-BR', 'pt', 'en'])
+
+        Returns:
+            dict: {'video_id', 'language', 'title', 'transcript', 'segments'} ou None
+        """
+        for language in languages:
+            entry = self.get(f"{video_id}.{language}")
+            if entry:
+                return entry
+        return None
+
+    def put_transcript(self, video_id, language, title, segments):
+        """
+        Guarda a transcrição limpa e o título do vídeo.
+
+        Args:
+            segments (list): Linhas da transcrição como (início, fim, texto)
+                             (ver utils/subtitle_parser.py)
+        """
+        self.put(f"{video_id}.{language}", {
+            "video_id": video_id,
+            "language": language,
+            "title": title,
+            "transcript": " ".join(segment[2] for segment in segments),
+            "segments": [list(segment) for segment in segments]
+        })
+
+
+def get_transcript_cache():
+    """
+    Retorna o cache de transcrições compartilhado, criando-o na primeira chamada.
+
+    Returns:
+        TranscriptCache: Cache em TRANSCRIPT_CACHE_DIR, ou None se estiver desativado
+    """
+    global _transcript_cache
+    if TRANSCRIPT_CACHE_ENABLED and _transcript_cache is None:
+        _transcript_cache = TranscriptCache()
+    return _transcript_cache
@@ -0,0 +1,144 @@
+"""
+Divisão de Transcrições em Blocos
+
+Este módulo divide uma transcrição em blocos para o resumo por partes, como um
+gerador: as palavras são lidas sob demanda (sem montar a lista de todas as palavras
+da transcrição) e só o bloco em construção fica em memória.
+
+- O tamanho dos blocos é medido em tokens (utils/tokenizers.py), não em palavras.
+- Os blocos terminam em fim de frase sempre que possível; uma frase maior que o
+  bloco inteiro (comum em legendas automáticas, sem pontuação) é cortada entre
+  palavras.
+- Opcionalmente, cada bloco repete no início as últimas frases do anterior
+  (overlap_tokens), para não perder o contexto na divisa.
+- Quando a entrada são as linhas da legenda com tempos (Segments de
+  utils/subtitle_parser.py), cada bloco informa o início e o fim no vídeo.
+"""
+
+import os
+import re
+from collections import namedtuple
+
+from utils.tokenizers import get_tokenizer
+
+# Tokens por bloco e sobreposição entre blocos consecutivos
+CHUNK_TOKENS = int(os.environ.get("YOUTUBE_CHUNK_TOKENS", "600"))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("YOUTUBE_CHUNK_OVERLAP_TOKENS", "0"))
+
+Chunk = namedtuple("Chunk", ["index", "text", "start", "end", "tokens"])
+
+WORD_PATTERN = re.compile(r'\S+')
+SENTENCE_END = ('.', '!', '?', '…', '."', '?"', '!"')
+
+
+def _iter_words(source):
+    """Produz (palavra, início, fim) a partir de um texto ou de Segments."""
+    if isinstance(source, str):
+        source = [(None, None, source)]
+    for start, end, text in source:
+        for match in WORD_PATTERN.finditer(text):
+            yield match.group(0), start, end
+
+
+def iter_sentences(source, max_tokens, tokenizer):
+    """
+    Agrupa as palavras em frases, cortando frases que passem de max_tokens.
+
+    Args:
+        source (str | iterable): Texto ou Segments (início, fim, texto)
+        max_tokens (int): Tamanho máximo de uma frase
+        tokenizer: Tokenizador (ver utils/tokenizers.py)
+
+    Yields:
+        tuple: (texto da frase, início, fim, tokens)
+    """
+    words = []
+    tokens = 0
+    start = end = None
+    for word, word_start, word_end in _iter_words(source):
+        word_tokens = tokenizer.count(word)
+        if words and tokens + word_tokens > max_tokens:
+            yield " ".join(words), start, end, tokens
+            words, tokens = [], 0
+        if not words:
+            start = word_start
+        words.append(word)
+        tokens += word_tokens
+        end = word_end
+        if word.endswith(SENTENCE_END):
+            yield " ".join(words), start, end, tokens
+            words, tokens = [], 0
+    if words:
+        yield " ".join(words), start, end, tokens
+
+
+def iter_chunks(source, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, tokenizer=None):
+    """
+    Divide a transcrição em blocos de até max_tokens tokens, em fim de frase.
+
+    Args:
+        source (str | iterable): Transcrição limpa ou Segments com os tempos
+        max_tokens (int): Tamanho máximo de cada bloco
+        overlap_tokens (int): Tokens finais do bloco anterior repetidos no seguinte
+        tokenizer (optional): Tokenizador; padrão: o de CHAT_TOKENIZER ('auto')
+
+    Yields:
+        Chunk: (índice, texto, início, fim, tokens); início e fim são None sem tempos
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    sentences = []
+    tokens = 0
+    fresh = False
+    index = 0
+
+    for sentence in iter_sentences(source, max_tokens, tokenizer):
+        if fresh and tokens + sentence[3] > max_tokens:
+            yield _make_chunk(index, sentences, tokens)
+            index += 1
+            sentences, tokens = _overlap(sentences, overlap_tokens)
+            fresh = False
+            # A sobreposição nunca impede a próxima frase de caber
+            while sentences and tokens + sentence[3] > max_tokens:
+                tokens -= sentences.pop(0)[3]
+        sentences.append(sentence)
+        tokens += sentence[3]
+        fresh = True
+
+    if fresh:
+        yield _make_chunk(index, sentences, tokens)
+
+
+def _overlap(sentences, overlap_tokens):
+    """Últimas frases do bloco que cabem na sobreposição."""
+    kept = []
+    tokens = 0
+    for sentence in reversed(sentences):
+        if tokens + sentence[3] > overlap_tokens:
+            break
+        kept.insert(0, sentence)
+        tokens += sentence[3]
+    return kept, tokens
+
+
+def _make_chunk(index, sentences, tokens):
+    return Chunk(
+        index=index,
+        text=" ".join(sentence[0] for sentence in sentences),
+        start=sentences[0][1],
+        end=sentences[-1][2],
+        tokens=tokens
+    )
+
+
+def format_timestamp(seconds):
+    """Formata segundos como H:MM:SS (ou M:SS em vídeos com menos de uma hora)."""
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
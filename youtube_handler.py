@@ -8,37 +8,143 @@ A classe YoutubeHandler oferece métodos para:
 - Baixar legendas de vídeos do YouTube (PT-BR, PT e EN)
 - Limpar e formatar o texto das legendas
 - Dividir transcrições em blocos para processamento
+
+Transcrições já processadas ficam em um cache em disco por ID do vídeo e idioma
+(utils/transcript_cache.py), consultado antes de qualquer chamada ao yt-dlp.
+
+Cada YoutubeHandler mantém uma instância do yt-dlp já inicializada (com o extrator
+do YouTube carregado), reaproveitada entre os vídeos. A YoutubeService, usada pela
+aplicação, é um serviço de longa duração com alguns handlers (um por worker), uma
+fila limitada de pedidos e deduplicação de pedidos simultâneos para o mesmo vídeo.
+
+Configuração por variáveis de ambiente:
+- YOUTUBE_WORKERS: downloads simultâneos (padrão 2)
+- YOUTUBE_QUEUE_SIZE: pedidos aguardando na fila (padrão 16)
+- YOUTUBE_DL_VERBOSE: "1" mostra a saída completa do yt-dlp (padrão "0")
 """
 
 import os
 import json
+import queue
+import threading
+import time
 import yt_dlp
-import re
 import logging
 import traceback
-from typing import Optional, Dict, Any, Tuple
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, Iterator, List, Tuple
+
+from utils.subtitle_parser import Segment, parse_subtitle_file
+from utils.transcript_chunker import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, Chunk, iter_chunks
+from utils.transcript_cache import extract_video_id, get_transcript_cache
 
 # Configuração do logger
 logger = logging.getLogger('youtube_handler')
 
+# Idiomas das legendas em ordem de prioridade, com os sufixos dos arquivos
+# baixados pelo yt-dlp (legendas manuais e automáticas)
+SUBTITLE_LANGUAGES = [
+    ("pt-BR", ["pt-BR.vtt", "pt_BR.vtt", "pt-br.vtt", "pt-BR.auto.vtt", "pt_BR.auto.vtt"]),
+    ("pt", ["pt.vtt", "pt-PT.vtt", "pt.auto.vtt"]),
+    ("en", ["en.vtt", "en.auto.vtt"])
+]
+
+YOUTUBE_WORKERS = int(os.environ.get("YOUTUBE_WORKERS", "2"))
+YOUTUBE_QUEUE_SIZE = int(os.environ.get("YOUTUBE_QUEUE_SIZE", "16"))
+YOUTUBE_DL_VERBOSE = os.environ.get("YOUTUBE_DL_VERBOSE", "0") == "1"
+
+
+class YtDlpLogger:
+    """Encaminha as mensagens do yt-dlp para o logger do módulo."""
+
+    def debug(self, msg):
+        # O yt-dlp envia as mensagens informativas como debug com o prefixo [info] etc.
+        logger.debug(msg)
+
+    def info(self, msg):
+        logger.debug(msg)
+
+    def warning(self, msg):
+        logger.warning(msg)
+
+    def error(self, msg):
+        logger.error(msg)
+
+
+class YoutubeQueueFull(Exception):
+    """A fila de processamento de vídeos está cheia."""
+
 class YoutubeHandler:
     """
     Classe para manipular vídeos do YouTube, com foco em download e processamento de legendas.
     Oferece suporte para baixar legendas em português e inglês, limpá-las e dividi-las em blocos.
     """
     
-    def __init__(self, download_path: str = "./temp"):
+    def __init__(self, download_path: str = "./temp", transcript_cache=None):
         """
         Inicializa o manipulador de vídeos do YouTube.
         
         Args:
             download_path (str): Caminho para salvar arquivos temporários
+            transcript_cache (TranscriptCache, optional): Cache de transcrições;
+                padrão: o cache compartilhado (None se desativado)
         """
         logger.info("Iniciando YoutubeHandler")
         self.download_path = download_path
+        self.transcript_cache = transcript_cache if transcript_cache is not None else get_transcript_cache()
         if not os.path.exists(download_path):
             os.makedirs(download_path)
             logger.debug(f"Diretório criado: {download_path}")
+        self._ydl = None
+        # O YoutubeDL não é thread-safe: um download por vez em cada handler
+        self._lock = threading.Lock()
+        self.metrics = {
+            "init_count": 0, "init_seconds": 0.0,
+            "network_count": 0, "network_seconds": 0.0,
+            "parse_count": 0, "parse_seconds": 0.0
+        }
+
+    def _get_ydl(self):
+        """
+        Retorna a instância do yt-dlp deste handler, criando-a na primeira chamada.
+        O extrator do YouTube é carregado já na criação, para que o custo de
+        inicialização não se misture ao tempo de rede do primeiro vídeo.
+        """
+        if self._ydl is None:
+            start = time.perf_counter()
+            # Configuração para baixar legendas apenas em PT-BR, PT e EN
+            ydl_opts = {
+                'writesubtitles': True,          # Baixa legendas manuais
+                'writeautomaticsub': True,       # Baixa legendas automáticas como fallback
+                'subtitleslangs': ['pt-BR', 'pt', 'en'],  # Limita a PT-BR, PT e EN
+                'skip_download': True,           # Não baixa o vídeo
+                'outtmpl': os.path.join(self.download_path, '%(id)s.%(ext)s'),
+                'quiet': not YOUTUBE_DL_VERBOSE,
+                'no_warnings': not YOUTUBE_DL_VERBOSE,
+                'noprogress': True,
+                'socket_timeout': 30,
+            }
+            if not YOUTUBE_DL_VERBOSE:
+                ydl_opts['logger'] = YtDlpLogger()
+            ydl = yt_dlp.YoutubeDL(ydl_opts)
+            ydl.get_info_extractor('Youtube')
+            self._ydl = ydl
+            self.metrics["init_count"] += 1
+            self.metrics["init_seconds"] += time.perf_counter() - start
+            logger.debug(f"yt-dlp inicializado em {time.perf_counter() - start:.3f}s")
+        return self._ydl
+
+    def warm_up(self):
+        """Inicializa o yt-dlp antes do primeiro pedido."""
+        with self._lock:
+            self._get_ydl()
+
+    def close(self):
+        """Libera a instância do yt-dlp."""
+        with self._lock:
+            if self._ydl is not None:
+                self._ydl.close()
+                self._ydl = None
 
     def download_subtitles(self, video_url: str) -> Tuple[Optional[str], Optional[str]]:
         """
@@ -52,21 +158,17 @@ class YoutubeHandler:
                 Se não for possível baixar, o primeiro elemento será None
         """
         logger.info(f"Iniciando download de legendas para: {video_url}")
-        
-        # Configuração para baixar legendas apenas em PT-BR, PT e EN
-        ydl_opts = {
-            'writesubtitles': True,          # Baixa legendas manuais
-            'writeautomaticsub': True,       # Baixa legendas automáticas como fallback
-            'subtitleslangs': ['pt-BR', 'pt', 'en'],  # Limita a PT-BR, PT e EN
-            'skip_download': True,           # Não baixa o vídeo
-            'outtmpl': os.path.join(self.download_path, '%(id)s.%(ext)s'),
-            'quiet': False,                  # Logs detalhados para diagnóstico
-        }
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self._lock:
+                ydl = self._get_ydl()
                 logger.debug("Extraindo informações do vídeo...")
-                info = ydl.extract_info(video_url, download=True)
+                start = time.perf_counter()
+                try:
+                    info = ydl.extract_info(video_url, download=True)
+                finally:
+                    self.metrics["network_count"] += 1
+                    self.metrics["network_seconds"] += time.perf_counter() - start
                 
                 if not info:
                     logger.error("Não foi possível extrair informações do vídeo")
@@ -76,20 +178,10 @@ class YoutubeHandler:
                 video_title = info.get('title', 'Sem título')
                 logger.info(f"Vídeo encontrado - ID: {video_id}, Título: {video_title}")
 
-                # Lista de sufixos para legendas manuais e automáticas, na ordem de prioridade
-                lang_options = [
-                    # PT-BR (manuais e automáticas)
-                    [f"{video_id}.pt-BR.vtt", f"{video_id}.pt_BR.vtt", f"{video_id}.pt-br.vtt",
-                     f"{video_id}.pt-BR.auto.vtt", f"{video_id}.pt_BR.auto.vtt"],
-                    # PT (manuais e automáticas)
-                    [f"{video_id}.pt.vtt", f"{video_id}.pt-PT.vtt", f"{video_id}.pt.auto.vtt"],
-                    # EN (manuais e automáticas)
-                    [f"{video_id}.en.vtt", f"{video_id}.en.auto.vtt"]
-                ]
-
                 # Busca por legendas na ordem de prioridade
-                for lang_group in lang_options:
-                    for file_name in lang_group:
+                for _, suffixes in SUBTITLE_LANGUAGES:
+                    for suffix in suffixes:
+                        file_name = f"{video_id}.{suffix}"
                         subtitle_file = os.path.join(self.download_path, file_name)
                         if os.path.exists(subtitle_file):
                             logger.info(f"Legenda encontrada: {file_name}")
@@ -119,6 +211,22 @@ class YoutubeHandler:
         Returns:
             Optional[str]: Texto limpo das legendas ou None se ocorrer erro
         """
+        segments = self.clean_subtitle_segments(subtitle_file)
+        if segments is None:
+            return None
+        return ' '.join(segment.text for segment in segments)
+
+    def clean_subtitle_segments(self, subtitle_file: str) -> Optional[List[Segment]]:
+        """
+        Lê as legendas sem timestamps, formatação e repetições, mantendo o início e o
+        fim de cada linha no vídeo.
+        
+        Args:
+            subtitle_file (str): Caminho do arquivo de legendas
+            
+        Returns:
+            Optional[List[Segment]]: Linhas de texto com os tempos ou None se ocorrer erro
+        """
         logger.debug(f"Iniciando limpeza de legendas: {subtitle_file}")
         
         if not isinstance(subtitle_file, str):
@@ -130,46 +238,12 @@ class YoutubeHandler:
             return None
 
         try:
-            # Tenta diferentes codificações
-            content = None
-            for encoding in ['utf-8', 'latin1', 'cp1252']:
-                try:
-                    with open(subtitle_file, 'r', encoding=encoding) as f:
-                        content = f.read()
-                        logger.debug(f"Arquivo lido com sucesso usando encoding: {encoding}")
-                        break
-                except UnicodeDecodeError:
-                    logger.debug(f"Falha ao ler com encoding: {encoding}")
-                    continue
-            
-            if content is None:
-                raise Exception("Não foi possível ler o arquivo com nenhuma codificação suportada")
-
+            # Leitura em uma única passada, linha a linha (ver utils/subtitle_parser.py)
             logger.debug("Iniciando processo de limpeza do texto...")
-            
-            # Remove cabeçalho WEBVTT e metadados
-            content = re.sub(r'WEBVTT.*\n', '', content)
-            content = re.sub(r'Kind:.*\n', '', content)
-            content = re.sub(r'Language:.*\n', '', content)
-            
-            # Remove timestamps e números de sequência
-            content = re.sub(r'\d{2}:\d{2}:\d{2}[\.,]\d{3} --> .*\n', '', content)
-            content = re.sub(r'^\d+$', '', content, flags=re.MULTILINE)
-            
-            # Remove tags HTML e formatação
-            content = re.sub(r'<[^>]+>', '', content)
-            content = re.sub(r'{\\an\d}', '', content)
-            content = re.sub(r'\[.*?\]', '', content)
-            
-            # Processa linha por linha removendo duplicatas
-            seen_lines = set()
-            cleaned_lines = []
-            
-            for line in content.split('\n'):
-                line = line.strip()
-                if line and not line.startswith(('<', '{', '[')) and line not in seen_lines:
-                    cleaned_lines.append(line)
-                    seen_lines.add(line)
+            start = time.perf_counter()
+            segments = parse_subtitle_file(subtitle_file)
+            self.metrics["parse_count"] += 1
+            self.metrics["parse_seconds"] += time.perf_counter() - start
 
             # Remove arquivo temporário
             try:
@@ -178,17 +252,31 @@ class YoutubeHandler:
             except Exception as e:
                 logger.warning(f"Não foi possível remover o arquivo temporário: {str(e)}")
             
-            # Junta as linhas com espaço e remove espaços extras
-            result = ' '.join(cleaned_lines).strip()
-            logger.info(f"Texto limpo gerado com sucesso: {len(result)} caracteres")
-            logger.debug(f"Amostra do texto limpo: {result[:100]}...")
-            return result
+            logger.info(f"Legendas limpas com sucesso: {len(segments)} linhas")
+            return segments
             
         except Exception as e:
             logger.error(f"Erro ao limpar legendas: {str(e)}")
             logger.error(traceback.format_exc())
             return None
 
+    @staticmethod
+    def subtitle_language(subtitle_file: str) -> Optional[str]:
+        """
+        Identifica o idioma (como em SUBTITLE_LANGUAGES) de um arquivo de legenda baixado.
+        
+        Args:
+            subtitle_file (str): Caminho do arquivo (<id>.<sufixo>)
+            
+        Returns:
+            Optional[str]: 'pt-BR', 'pt', 'en' ou None se não reconhecido
+        """
+        file_name = os.path.basename(subtitle_file)
+        for language, suffixes in SUBTITLE_LANGUAGES:
+            if any(file_name.endswith("." + suffix) for suffix in suffixes):
+                return language
+        return None
+
     def download_and_clean_transcript(self, video_url: str) -> Tuple[Optional[str], Optional[str]]:
         """
         Combinação das funções download_subtitles e clean_subtitles em um único método.
@@ -199,15 +287,49 @@ class YoutubeHandler:
         Returns:
             Tuple[Optional[str], Optional[str]]: (transcrição_limpa, título_do_vídeo)
         """
+        segments, video_title = self.download_transcript_segments(video_url)
+        if not segments:
+            return None, video_title
+        return ' '.join(segment.text for segment in segments), video_title
+
+    def download_transcript_segments(self, video_url: str) -> Tuple[Optional[List[Segment]], Optional[str]]:
+        """
+        Obtém a transcrição limpa como linhas com os tempos no vídeo, consultando o
+        cache antes de baixar as legendas.
+        
+        Args:
+            video_url (str): URL do vídeo do YouTube
+            
+        Returns:
+            Tuple[Optional[List[Segment]], Optional[str]]: (linhas_da_transcrição, título_do_vídeo)
+        """
         logger.info(f"Iniciando download e limpeza de transcrição para: {video_url}")
         
+        # O cache é consultado antes de qualquer acesso à rede
+        video_id = extract_video_id(video_url)
+        if video_id and self.transcript_cache:
+            cached = self.transcript_cache.get_transcript(video_id, [language for language, _ in SUBTITLE_LANGUAGES])
+            if cached:
+                logger.info(f"Transcrição encontrada no cache: {video_id} ({cached['language']})")
+                if cached.get("segments"):
+                    return [Segment(*segment) for segment in cached["segments"]], cached["title"]
+                return [Segment(None, None, cached["transcript"])], cached["title"]
+        
         subtitle_file, video_title = self.download_subtitles(video_url)
         if subtitle_file:
             logger.debug(f"Legendas baixadas com sucesso, iniciando limpeza: {video_title}")
-            cleaned_transcript = self.clean_subtitles(subtitle_file)
-            if cleaned_transcript:
+            # Idioma e ID vêm do nome do arquivo baixado (<id>.<sufixo>)
+            language = self.subtitle_language(subtitle_file)
+            file_video_id = os.path.basename(subtitle_file).split('.')[0]
+            segments = self.clean_subtitle_segments(subtitle_file)
+            if segments:
                 logger.info(f"Transcrição processada com sucesso para: {video_title}")
-                return cleaned_transcript, video_title
+                if self.transcript_cache and language:
+                    try:
+                        self.transcript_cache.put_transcript(file_video_id, language, video_title, segments)
+                    except Exception as e:
+                        logger.warning(f"Não foi possível guardar a transcrição no cache: {str(e)}")
+                return segments, video_title
             else:
                 logger.error(f"Falha ao limpar legendas para: {video_title}")
         else:
@@ -215,40 +337,172 @@ class YoutubeHandler:
         
         return None, video_title
         
-    def split_transcript_into_chunks(self, transcript: str, words_per_chunk: int = 300) -> list[str]:
+    def iter_transcript_chunks(self, transcript, max_tokens: int = CHUNK_TOKENS,
+                               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Iterator[Chunk]:
         """
-        Divide a transcrição em blocos de aproximadamente N palavras.
+        Divide a transcrição em blocos de até max_tokens tokens, terminando em fim de
+        frase sempre que possível (ver utils/transcript_chunker.py). Os blocos são
+        produzidos sob demanda, sem montar a lista de todos eles.
         
         Args:
-            transcript (str): Texto da transcrição limpa
-            words_per_chunk (int): Número aproximado de palavras por bloco
+            transcript (str | list): Texto da transcrição limpa ou linhas com os tempos
+                                     (download_transcript_segments)
+            max_tokens (int): Tamanho máximo de cada bloco em tokens
+            overlap_tokens (int): Tokens do fim de um bloco repetidos no início do seguinte
             
-        Returns:
-            list[str]: Lista de blocos de texto
+        Yields:
+            Chunk: Blocos com texto, tempos de início e fim (None sem tempos) e tokens
         """
         if not transcript:
             logger.error("Transcrição vazia, não é possível dividir em blocos")
-            return []
+            return
             
+        count = 0
         try:
-            # Divide o texto em palavras
-            words = transcript.split()
-            total_words = len(words)
-            logger.debug(f"Total de palavras na transcrição: {total_words}")
-            
-            # Calcula quantos blocos serão necessários
-            num_chunks = max(1, (total_words + words_per_chunk - 1) // words_per_chunk)
-            logger.debug(f"Dividindo em aproximadamente {num_chunks} blocos")
-            
-            chunks = []
-            for i in range(0, total_words, words_per_chunk):
-                chunk = ' '.join(words[i:i + words_per_chunk])
-                chunks.append(chunk)
-                
-            logger.info(f"Transcrição dividida em {len(chunks)} blocos de aproximadamente {words_per_chunk} palavras")
-            return chunks
+            for chunk in iter_chunks(transcript, max_tokens, overlap_tokens):
+                count += 1
+                yield chunk
+            logger.info(f"Transcrição dividida em {count} blocos de até {max_tokens} tokens")
             
         except Exception as e:
             logger.error(f"Erro ao dividir transcrição em blocos: {str(e)}")
             logger.error(traceback.format_exc())
-            return []
+
+
+class YoutubeService:
+    """
+    Serviço de longa duração para obter transcrições: workers com handlers (e yt-dlp)
+    já inicializados, fila limitada e um único processamento por vídeo, mesmo com
+    pedidos simultâneos.
+    """
+
+    def __init__(self, workers: int = YOUTUBE_WORKERS, queue_size: int = YOUTUBE_QUEUE_SIZE,
+                 download_path: str = "./temp"):
+        """
+        Args:
+            workers (int): Downloads simultâneos (um handler por worker)
+            queue_size (int): Pedidos que podem aguardar na fila
+            download_path (str): Caminho para salvar arquivos temporários
+        """
+        self.handlers = [YoutubeHandler(download_path) for _ in range(max(1, workers))]
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self.counters = {
+            "submitted": 0, "deduplicated": 0, "rejected": 0,
+            "completed": 0, "failed": 0, "queue_wait_seconds": 0.0
+        }
+
+    def _start(self):
+        # Workers iniciados no primeiro pedido; cada um inicializa seu yt-dlp ao começar
+        if self._threads:
+            return
+        for i, handler in enumerate(self.handlers):
+            thread = threading.Thread(target=self._worker, args=(handler,), name=f"youtube-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, video_url: str) -> Future:
+        """
+        Agenda a obtenção da transcrição de um vídeo. Pedidos para um vídeo que já está
+        na fila ou em processamento recebem o mesmo Future.
+        
+        Args:
+            video_url (str): URL do vídeo do YouTube
+            
+        Returns:
+            Future: Resultado (linhas_da_transcrição, título_do_vídeo), como em
+                    YoutubeHandler.download_transcript_segments
+            
+        Raises:
+            YoutubeQueueFull: Se a fila estiver cheia
+        """
+        key = extract_video_id(video_url) or video_url.strip()
+        with self._lock:
+            self._start()
+            future = self._inflight.get(key)
+            if future is not None:
+                self.counters["deduplicated"] += 1
+                logger.info(f"Vídeo {key} já está em processamento; aguardando o mesmo resultado")
+                return future
+            future = Future()
+            try:
+                self._queue.put_nowait((key, video_url, future, time.perf_counter()))
+            except queue.Full:
+                self.counters["rejected"] += 1
+                raise YoutubeQueueFull("Fila de processamento de vídeos cheia")
+            self._inflight[key] = future
+            self.counters["submitted"] += 1
+        return future
+
+    def _worker(self, handler):
+        try:
+            handler.warm_up()
+        except Exception as e:
+            logger.error(f"Falha ao inicializar o yt-dlp: {str(e)}")
+        while True:
+            job = self._queue.get()
+            if job is None:
+                handler.close()
+                return
+            key, video_url, future, enqueued = job
+            with self._lock:
+                self.counters["queue_wait_seconds"] += time.perf_counter() - enqueued
+            try:
+                result = handler.download_transcript_segments(video_url)
+            except Exception as e:
+                logger.error(f"Erro ao processar vídeo {video_url}: {str(e)}")
+                with self._lock:
+                    self._inflight.pop(key, None)
+                    self.counters["failed"] += 1
+                future.set_exception(e)
+                continue
+            with self._lock:
+                self._inflight.pop(key, None)
+                self.counters["completed"] += 1
+            future.set_result(result)
+
+    def get_transcript_segments(self, video_url: str, timeout: Optional[float] = None) -> Tuple[Optional[List[Segment]], Optional[str]]:
+        """
+        Obtém a transcrição como linhas com os tempos, aguardando na fila se preciso.
+        
+        Raises:
+            YoutubeQueueFull: Se a fila estiver cheia
+        """
+        return self.submit(video_url).result(timeout)
+
+    def get_transcript(self, video_url: str, timeout: Optional[float] = None) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Obtém a transcrição limpa como texto corrido.
+        
+        Raises:
+            YoutubeQueueFull: Se a fila estiver cheia
+        """
+        segments, video_title = self.get_transcript_segments(video_url, timeout)
+        if not segments:
+            return None, video_title
+        return ' '.join(segment.text for segment in segments), video_title
+
+    def iter_transcript_chunks(self, transcript, **kwargs) -> Iterator[Chunk]:
+        """Divide a transcrição em blocos, sob demanda (ver YoutubeHandler.iter_transcript_chunks)."""
+        return self.handlers[0].iter_transcript_chunks(transcript, **kwargs)
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Retorna as métricas do serviço: tempo de inicialização do yt-dlp, tempo de
+        rede e de leitura das legendas (somados entre os handlers), e contadores da fila.
+        """
+        totals = {}
+        for handler in self.handlers:
+            for name, value in handler.metrics.items():
+                totals[name] = totals.get(name, 0) + value
+        with self._lock:
+            counters = dict(self.counters, queued=self._queue.qsize(), inflight=len(self._inflight))
+        return dict(totals, **counters)
+
+    def close(self):
+        """Encerra os workers depois dos pedidos já enfileirados."""
+        for _ in self._threads:
+            self._queue.put(None)
+        self._threads = []